@@ -0,0 +1,135 @@
+# Асинхронный слой доступа к данным для CollabHub
+#
+# Функции models.py синхронные: sqlite3 и bcrypt блокируют поток, в котором
+# вызваны. Здесь они выполняются в ограниченных пулах потоков, а маршруты
+# ожидают результат через await, не останавливая цикл событий.
+#
+# Запросы к БД и хэширование паролей разведены по разным пулам: поток запроса
+# к БД занят миллисекунды, а bcrypt - сотни миллисекунд. Волна логинов
+# заполняет только пул хэширования, остальные запросы продолжают обслуживаться.
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import models
+from database import POOL_SIZE
+
+# ===== НАСТРОЙКИ ПУЛОВ ПОТОКОВ =====
+
+# Потоков для БД столько же, сколько подключений в пуле, чтобы поток
+# не простаивал в ожидании свободного подключения
+DB_EXECUTOR_SIZE = int(os.getenv("DB_EXECUTOR_SIZE", str(POOL_SIZE)))
+# bcrypt отпускает GIL, поэтому хэши считаются параллельно, но каждый занимает ядро
+HASH_EXECUTOR_SIZE = int(os.getenv("HASH_EXECUTOR_SIZE", str(min(4, os.cpu_count() or 1))))
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_SIZE, thread_name_prefix="db")
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_EXECUTOR_SIZE, thread_name_prefix="bcrypt")
+
+
+async def run_db(func, *args, **kwargs):
+    """Выполняет синхронную функцию работы с БД в пуле потоков БД"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(func, *args, **kwargs))
+
+
+async def run_hash(func, *args, **kwargs):
+    """Выполняет функцию хэширования паролей в отдельном пуле потоков"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, functools.partial(func, *args, **kwargs))
+
+
+def _db(func):
+    """Оборачивает функцию models.py в корутину, выполняемую в пуле БД"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+    return wrapper
+
+
+def _hash(func):
+    """Оборачивает функцию работы с паролями в корутину пула хэширования"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_hash(func, *args, **kwargs)
+    return wrapper
+
+
+# ===== ПАРОЛИ =====
+
+hash_password = _hash(models.hash_password)
+verify_password = _hash(models.verify_password)
+
+# ===== ПОЛЬЗОВАТЕЛИ =====
+
+get_user = _db(models.get_user)
+get_user_by_email = _db(models.get_user_by_email)
+get_user_by_id = _db(models.get_user_by_id)
+create_user = _db(models.create_user)
+update_user_profile = _db(models.update_user_profile)
+get_users_by_role = _db(models.get_users_by_role)
+get_all_users_with_filters = _db(models.get_all_users_with_filters)
+search_users = _db(models.search_users)
+count_users = _db(models.count_users)
+get_popular_skills = _db(models.get_popular_skills)
+get_user_profile_by_email = _db(models.get_user_profile_by_email)
+is_admin = _db(models.is_admin)
+
+# ===== ПРОЕКТЫ =====
+
+get_jobs = _db(models.get_jobs)
+count_jobs = _db(models.count_jobs)
+get_visible_jobs = _db(models.get_visible_jobs)
+search_jobs = _db(models.search_jobs)
+build_job_feed = _db(models.build_job_feed)
+get_job_by_id = _db(models.get_job_by_id)
+create_job = _db(models.create_job)
+update_job = _db(models.update_job)
+delete_job = _db(models.delete_job)
+complete_job = _db(models.complete_job)
+get_project_participants = _db(models.get_project_participants)
+
+# ===== РЕКОМЕНДАЦИИ =====
+
+get_job_candidates = _db(models.get_job_candidates)
+get_recommended_jobs = _db(models.get_recommended_jobs)
+
+# ===== ОТКЛИКИ =====
+
+apply_to_job = _db(models.apply_to_job)
+get_applications = _db(models.get_applications)
+get_applications_by_freelancer = _db(models.get_applications_by_freelancer)
+get_applications_for_client = _db(models.get_applications_for_client)
+get_application_by_id = _db(models.get_application_by_id)
+update_application_status = _db(models.update_application_status)
+has_user_applied_to_job = _db(models.has_user_applied_to_job)
+get_user_application_status = _db(models.get_user_application_status)
+
+# ===== ОТЗЫВЫ И СТАТИСТИКА =====
+
+create_review = _db(models.create_review)
+get_reviews_for_freelancer = _db(models.get_reviews_for_freelancer)
+get_job_reviews = _db(models.get_job_reviews)
+has_reviewed_job = _db(models.has_reviewed_job)
+update_freelancer_stats = _db(models.update_freelancer_stats)
+update_all_freelancer_stats = _db(models.update_all_freelancer_stats)
+verify_freelancer_aggregates = _db(models.verify_freelancer_aggregates)
+
+# ===== СООБЩЕНИЯ =====
+
+create_message = _db(models.create_message)
+get_messages_between_users = _db(models.get_messages_between_users)
+get_message_history = _db(models.get_message_history)
+get_user_conversations = _db(models.get_user_conversations)
+mark_messages_as_read = _db(models.mark_messages_as_read)
+get_unread_messages_count = _db(models.get_unread_messages_count)
+reconcile_unread_counters = _db(models.reconcile_unread_counters)
+
+# ===== КОММЕНТАРИИ =====
+
+create_project_comment = _db(models.create_project_comment)
+delete_project_comment = _db(models.delete_project_comment)
+get_project_comments = _db(models.get_project_comments)
+get_all_project_comments = _db(models.get_all_project_comments)
+can_user_comment_on_project = _db(models.can_user_comment_on_project)
@@ -0,0 +1,96 @@
+# Кэш в памяти процесса для CollabHub
+#
+# TTLCache - LRU-кэш с ограничением размера и временем жизни записей.
+# Функции models.py выполняются в пуле потоков, поэтому все операции
+# защищены блокировкой. Время жизни - страховка: записи должны явно
+# сбрасываться при изменении данных, TTL лишь ограничивает устаревание,
+# если сброс где-то пропущен.
+
+import threading
+import time
+from collections import OrderedDict
+
+# Маркер отсутствия записи (None - допустимое закэшированное значение)
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU-кэш с ограничением размера, временем жизни записей и счетчиками попаданий"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()  # ключ -> (момент устаревания, значение)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """Возвращает значение по ключу или default, если записи нет или она устарела"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Сохраняет значение, вытесняя давно не использованные записи сверх maxsize"""
+        with self._lock:
+            self._data[key] = (self._clock() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """Возвращает значение из кэша, при промахе загружает его через loader() и сохраняет"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, *keys):
+        """Удаляет записи по ключам"""
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def invalidate_if(self, predicate):
+        """Удаляет записи, для которых predicate(ключ, значение) истинно"""
+        with self._lock:
+            stale = [key for key, (_, value) in self._data.items() if predicate(key, value)]
+            for key in stale:
+                del self._data[key]
+
+    def clear(self):
+        """Очищает кэш (счетчики сохраняются)"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """Счетчики кэша для мониторинга"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
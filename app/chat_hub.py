@@ -0,0 +1,73 @@
+# Доставка сообщений чата в реальном времени для CollabHub
+#
+# Открытые вкладки чата подписываются на диалог через WebSocket, а
+# send_message_api публикует сюда каждое сохраненное сообщение. Пока
+# вкладка открыта, она не обращается к БД - сообщения приходят по сокету.
+#
+# Хаб живет в памяти процесса: подписчики и публикации одного воркера
+# видят друг друга. Клиент при подключении догружает пропущенное через
+# /api/messages/..., а без сокета возвращается к опросу раз в 3 секунды.
+
+import asyncio
+import os
+
+# Сколько сообщений может ждать отправки одному подписчику
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("CHAT_QUEUE_SIZE", "100"))
+
+
+def conversation_key(user1_email: str, user2_email: str, job_id: int = None):
+    """Ключ диалога: пара собеседников без учета порядка и проект (None для обычного чата)"""
+    first, second = sorted((user1_email, user2_email))
+    return (first, second, job_id or None)
+
+
+class Subscription:
+    """Подписка одного сокета на диалог"""
+
+    def __init__(self, key):
+        self.key = key
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        # Очередь переполнилась и часть сообщений потеряна - сокет нужно переподключить
+        self.overflowed = False
+
+
+class ChatHub:
+    """Публикация сообщений подписчикам диалога внутри процесса"""
+
+    def __init__(self):
+        self._subscriptions = {}
+
+    def subscribe(self, user1_email: str, user2_email: str, job_id: int = None) -> Subscription:
+        """Подписывает на новые сообщения диалога"""
+        subscription = Subscription(conversation_key(user1_email, user2_email, job_id))
+        self._subscriptions.setdefault(subscription.key, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """Отменяет подписку; пустые диалоги удаляются"""
+        subscribers = self._subscriptions.get(subscription.key)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscriptions[subscription.key]
+
+    def publish(self, message: dict) -> int:
+        """Рассылает сообщение подписчикам его диалога, возвращает число получателей"""
+        key = conversation_key(message["sender_email"], message["receiver_email"], message.get("job_id"))
+        delivered = 0
+        for subscription in self._subscriptions.get(key, ()):
+            try:
+                subscription.queue.put_nowait(message)
+                delivered += 1
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+        return delivered
+
+    def subscriber_count(self) -> int:
+        """Количество активных подписок во всех диалогах"""
+        return sum(len(subscribers) for subscribers in self._subscriptions.values())
+
+
+# Общий хаб процесса
+chat_hub = ChatHub()
@@ -77,10 +77,16 @@ SUCCESS_MESSAGES = {
 
 # Настройки пагинации
 ITEMS_PER_PAGE = 12
+SEARCH_PAGE_LIMIT = 50  # Максимум проектов на странице API поиска
 MAX_PAGES_DISPLAY = 5
 
+# Настройки рекомендаций
+RECOMMENDED_JOBS_LIMIT = 5  # Блок "Рекомендуем вам" на главной
+CANDIDATES_LIMIT = 20  # Максимум кандидатов на проект
+
 # Настройки чата
 MESSAGES_PER_PAGE = 50
+MESSAGES_POLL_LIMIT = 200  # Максимум новых сообщений за один опрос
 MESSAGE_MAX_LENGTH = 1000
 
 # Настройки отзывов
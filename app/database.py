@@ -1,31 +1,246 @@
 # Импорты для работы с базой данных
 import sqlite3
 import os
+import queue
+import threading
+from contextlib import contextmanager
+
+from skills import rebuild_user_skills
 
 # Название файла базы данных
 DB_NAME = "freelance.db"
 
-def get_connection():
-    """Создает подключение к базе данных SQLite"""
-    conn = sqlite3.connect(DB_NAME)
+# Настройки пула подключений
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+# Профили PRAGMA для разных окружений (выбираются через DB_PRAGMA_PROFILE).
+# WAL позволяет читателям не блокировать писателя, busy_timeout - ждать блокировку
+# вместо немедленной ошибки "database is locked".
+PRAGMA_PROFILES = {
+    "production": {
+        "busy_timeout": 5000,           # мс ожидания блокировки
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",        # в режиме WAL безопасно и намного быстрее FULL
+        "cache_size": -64000,           # ~64 МБ кэша страниц на подключение
+        "mmap_size": 268435456,         # 256 МБ memory-mapped I/O
+        "temp_store": "MEMORY",
+    },
+    "development": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "mmap_size": 67108864,
+        "temp_store": "MEMORY",
+    },
+    # Поведение SQLite по умолчанию (журнал отката, без mmap)
+    "legacy": {
+        "busy_timeout": 5000,
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+    },
+}
+
+def get_db_path():
+    """Возвращает путь к файлу БД (DATABASE_URL переопределяет путь, например в тестах)"""
+    return os.getenv("DATABASE_URL", DB_NAME)
+
+def get_pragma_profile_name() -> str:
+    """Возвращает имя активного профиля PRAGMA"""
+    default = "production" if os.getenv("RENDER") else "development"
+    name = os.getenv("DB_PRAGMA_PROFILE", default)
+    if name not in PRAGMA_PROFILES:
+        raise ValueError(f"Неизвестный профиль PRAGMA: {name}")
+    return name
+
+def configure_connection(conn):
+    """Применяет настройки к новому подключению (один раз за время его жизни)"""
     conn.row_factory = sqlite3.Row  # Возвращает результаты как словари
     # Включаем поддержку внешних ключей в SQLite
     conn.execute("PRAGMA foreign_keys = ON")
+    for pragma, value in PRAGMA_PROFILES[get_pragma_profile_name()].items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
     return conn
 
-def init_db():
-    """Инициализирует базу данных и создает все необходимые таблицы"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    # Включаем поддержку внешних ключей ПЕРЕД созданием таблиц
-    cursor.execute("PRAGMA foreign_keys = ON")
-    
-    # Таблица пользователей
-    # Удаляем старую таблицу для пересоздания с правильной структурой
-    cursor.execute("DROP TABLE IF EXISTS Users")
-    # Commit не нужен здесь, так как мы сразу создаем новую таблицу
-    cursor.execute("""
-        CREATE TABLE Users (
+def get_pragma_report() -> dict:
+    """Возвращает фактические значения PRAGMA активного профиля (для вывода при старте)"""
+    report = {"profile": get_pragma_profile_name(), "database": get_db_path()}
+    with db_connection() as conn:
+        for pragma in ["foreign_keys", *PRAGMA_PROFILES[report["profile"]]]:
+            report[pragma] = conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+    return report
+
+def get_connection():
+    """Создает отдельное подключение к базе данных SQLite (для скриптов и миграций)"""
+    conn = sqlite3.connect(get_db_path())
+    return configure_connection(conn)
+
+
+class ConnectionPool:
+    """Ограниченный потокобезопасный пул подключений SQLite"""
+
+    def __init__(self, db_path: str, max_size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        # Семафор ограничивает число одновременно выданных подключений
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._closed = False
+
+    def _create_connection(self):
+        """Открывает новое подключение с уже примененными настройками"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        return configure_connection(conn)
+
+    def _is_healthy(self, conn) -> bool:
+        """Проверяет, что подключение живо"""
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        """Выдает подключение из пула, при необходимости открывая новое"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("Нет свободных подключений к базе данных")
+        try:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._create_connection()
+                if self._is_healthy(conn):
+                    return conn
+                # Битое подключение выбрасываем и берем следующее
+                conn.close()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        """Возвращает подключение в пул, сбрасывая его состояние"""
+        try:
+            if self._closed:
+                conn.close()
+                return
+            try:
+                # Незавершенная транзакция откатывается, настройки восстанавливаются
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.row_factory = sqlite3.Row
+                self._idle.put_nowait(conn)
+            except sqlite3.Error:
+                conn.close()
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Контекстный менеджер: выдает подключение и гарантированно возвращает его"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Закрывает все свободные подключения пула"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Возвращает общий для процесса пул подключений к текущей БД"""
+    global _pool
+    db_path = get_db_path()
+    with _pool_lock:
+        # Путь к БД мог смениться (например, между тестами) - пересоздаем пул
+        if _pool is None or _pool.db_path != db_path:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(db_path)
+        return _pool
+
+@contextmanager
+def db_connection():
+    """Выдает подключение из пула: with db_connection() as conn: ..."""
+    with get_pool().connection() as conn:
+        yield conn
+
+# ===== КАТАЛОГ ИНДЕКСОВ =====
+# Имя индекса -> (таблица, колонки). Колонки подобраны под WHERE/ORDER BY
+# запросов из models.py; индексы создаются только миграциями через create_indexes().
+# При изменении колонок добавляется миграция с rebuild_indexes() для уже созданных БД.
+
+INDEXES = {
+    # get_messages_between_users, mark_messages_as_read: пара собеседников + проект; rowid (id)
+    # неявно идет последним, поэтому курсор id > ? и ORDER BY id читаются прямо из индекса
+    "idx_messages_pair": ("Messages", "sender_email, receiver_email, job_id"),
+    # get_unread_messages_count и входящие в get_user_conversations
+    "idx_messages_receiver_read": ("Messages", "receiver_email, is_read"),
+    # Проектные чаты и удаление сообщений проекта
+    "idx_messages_job": ("Messages", "job_id"),
+    # get_applications_by_freelancer, has_user_applied_to_job по фрилансеру
+    "idx_applications_freelancer": ("Applications", "freelancer_email, status"),
+    # get_reviews_for_freelancer: отзывы фрилансера, новые первыми
+    "idx_reviews_freelancer": ("Reviews", "freelancer_email, created_at"),
+    # get_project_comments: комментарии проекта по времени
+    "idx_comments_job": ("ProjectComments", "job_id, created_at"),
+    # get_jobs / get_visible_jobs с фильтром по статусу и курсором по id
+    "idx_jobs_status": ("Jobs", "status, id"),
+    # get_applications_for_client и проекты создателя
+    "idx_jobs_creator": ("Jobs", "creator_email"),
+    # get_user_conversations: диалоги пользователя по последней активности
+    "idx_conversations_user": ("Conversations", "user_email, last_message_id"),
+    # search_users: каталог пользователей по рейтингу; id (rowid) неявно замыкает индекс
+    # и служит последним полем курсора
+    "idx_users_role_rating": ("Users", "role, rating, completed_projects"),
+    "idx_users_rating": ("Users", "rating, completed_projects"),
+    # Навыки пользователя при обновлении профиля (первичный ключ UserSkills начинается с навыка)
+    "idx_user_skills_user": ("UserSkills", "user_id"),
+}
+
+def create_indexes(*names):
+    """Возвращает шаг миграции, создающий индексы из каталога"""
+    def step(cursor):
+        for name in names:
+            table, columns = INDEXES[name]
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+    return step
+
+def rebuild_indexes(*names):
+    """Возвращает шаг миграции, пересоздающий индексы по текущему определению из каталога"""
+    def step(cursor):
+        for name in names:
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+        create_indexes(*names)(cursor)
+    return step
+
+def fold_yo(expression: str) -> str:
+    """SQL-выражение, заменяющее "ё" на "е" (так текст попадает в поисковый индекс)"""
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+# ===== МИГРАЦИИ СХЕМЫ =====
+# Каждая миграция - (версия, описание, шаги). Шаг - SQL-команда или функция,
+# принимающая курсор. Применяются только миграции новее версии из schema_version,
+# каждая в отдельной транзакции. Уже примененные миграции не изменяются -
+# изменения схемы добавляются новыми версиями в конец списка.
+
+MIGRATIONS = [
+    (1, "Базовая схема", [
+        """
+        CREATE TABLE IF NOT EXISTS Users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             email TEXT UNIQUE NOT NULL,
             password TEXT NOT NULL,
@@ -43,64 +258,9 @@ def init_db():
             portfolio_files TEXT,
             portfolio_links TEXT
         )
-    """)
-    
-    # Добавляем новые колонки, если их нет (для совместимости с существующими БД)
-    try:
-        cursor.execute("ALTER TABLE Users ADD COLUMN about_me TEXT")
-    except sqlite3.OperationalError:
-        pass  # Колонка уже существует
-    
-    try:
-        cursor.execute("ALTER TABLE Users ADD COLUMN activity TEXT")
-    except sqlite3.OperationalError:
-        pass
-    
-    try:
-        cursor.execute("ALTER TABLE Users ADD COLUMN skills TEXT")
-    except sqlite3.OperationalError:
-        pass
-    
-    try:
-        cursor.execute("ALTER TABLE Users ADD COLUMN rating REAL DEFAULT 0.0")
-    except sqlite3.OperationalError:
-        pass
-    
-    try:
-        cursor.execute("ALTER TABLE Users ADD COLUMN completed_projects INTEGER DEFAULT 0")
-    except sqlite3.OperationalError:
-        pass
-    
-    try:
-        cursor.execute("ALTER TABLE Users ADD COLUMN phone TEXT")
-    except sqlite3.OperationalError:
-        pass
-    
-    try:
-        cursor.execute("ALTER TABLE Users ADD COLUMN telegram TEXT")
-    except sqlite3.OperationalError:
-        pass
-    
-    try:
-        cursor.execute("ALTER TABLE Users ADD COLUMN created_at DATETIME DEFAULT CURRENT_TIMESTAMP")
-    except sqlite3.OperationalError:
-        pass
-    
-    try:
-        cursor.execute("ALTER TABLE Users ADD COLUMN portfolio_files TEXT")
-    except sqlite3.OperationalError:
-        pass
-    
-    try:
-        cursor.execute("ALTER TABLE Users ADD COLUMN portfolio_links TEXT")
-    except sqlite3.OperationalError:
-        pass
-    
-    # Таблица проектов/заданий
-    # Удаляем старую таблицу если она существует без FOREIGN KEY
-    cursor.execute("DROP TABLE IF EXISTS Jobs")
-    cursor.execute("""
-        CREATE TABLE Jobs (
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Jobs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             title TEXT NOT NULL,
             description TEXT NOT NULL,
@@ -111,23 +271,10 @@ def init_db():
             files TEXT,
             FOREIGN KEY (creator_email) REFERENCES Users (email)
         )
-    """)
-
-    # Добавляем недостающие колонки в Jobs (для совместимости)
-    try:
-        cursor.execute("ALTER TABLE Jobs ADD COLUMN priority TEXT DEFAULT 'medium'")
-    except sqlite3.OperationalError:
-        pass
-    
-    try:
-        cursor.execute("ALTER TABLE Jobs ADD COLUMN files TEXT")
-    except sqlite3.OperationalError:
-        pass
-    
-    # Таблица откликов фрилансеров на проекты
-    cursor.execute("DROP TABLE IF EXISTS Applications")
-    cursor.execute("""
-        CREATE TABLE Applications (
+        """,
+        # Отклики фрилансеров на проекты
+        """
+        CREATE TABLE IF NOT EXISTS Applications (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             job_id INTEGER NOT NULL,
             freelancer_email TEXT NOT NULL,
@@ -136,12 +283,10 @@ def init_db():
             FOREIGN KEY (job_id) REFERENCES Jobs (id),
             FOREIGN KEY (freelancer_email) REFERENCES Users (email)
         )
-    """)
-    
-    # Таблица отзывов клиентов о фрилансерах
-    cursor.execute("DROP TABLE IF EXISTS Reviews")
-    cursor.execute("""
-        CREATE TABLE Reviews (
+        """,
+        # Отзывы клиентов о фрилансерах
+        """
+        CREATE TABLE IF NOT EXISTS Reviews (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             job_id INTEGER NOT NULL,
             freelancer_email TEXT NOT NULL,
@@ -154,12 +299,10 @@ def init_db():
             FOREIGN KEY (freelancer_email) REFERENCES Users (email),
             FOREIGN KEY (client_email) REFERENCES Users (email)
         )
-    """)
-    
-    # Таблица сообщений в чате
-    cursor.execute("DROP TABLE IF EXISTS Messages")
-    cursor.execute("""
-        CREATE TABLE Messages (
+        """,
+        # Сообщения в чате
+        """
+        CREATE TABLE IF NOT EXISTS Messages (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             sender_email TEXT NOT NULL,
             receiver_email TEXT NOT NULL,
@@ -171,12 +314,10 @@ def init_db():
             FOREIGN KEY (receiver_email) REFERENCES Users (email),
             FOREIGN KEY (job_id) REFERENCES Jobs (id)
         )
-    """)
-    
-    # Таблица комментариев к проектам
-    cursor.execute("DROP TABLE IF EXISTS ProjectComments")
-    cursor.execute("""
-        CREATE TABLE ProjectComments (
+        """,
+        # Комментарии к проектам
+        """
+        CREATE TABLE IF NOT EXISTS ProjectComments (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             job_id INTEGER NOT NULL,
             user_email TEXT NOT NULL,
@@ -185,8 +326,541 @@ def init_db():
             FOREIGN KEY (job_id) REFERENCES Jobs (id),
             FOREIGN KEY (user_email) REFERENCES Users (email)
         )
+        """,
+    ]),
+    (2, "Индексы для основных запросов", [
+        create_indexes(
+            "idx_messages_pair",
+            "idx_messages_receiver_read",
+            "idx_messages_job",
+            "idx_applications_freelancer",
+            "idx_reviews_freelancer",
+            "idx_comments_job",
+            "idx_jobs_status",
+            "idx_jobs_creator",
+        ),
+    ]),
+    (3, "Индекс диалогов с курсором по id сообщения", [
+        rebuild_indexes("idx_messages_pair"),
+    ]),
+    (4, "Счетчики непрочитанных сообщений", [
+        # Количество непрочитанных сообщений получателя; поддерживается триггерами
+        # в той же транзакции, что и изменение Messages
+        """
+        CREATE TABLE IF NOT EXISTS UnreadCounters (
+            user_email TEXT PRIMARY KEY,
+            unread_count INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_messages_unread_insert
+        AFTER INSERT ON Messages
+        WHEN NEW.is_read = FALSE
+        BEGIN
+            INSERT INTO UnreadCounters (user_email, unread_count) VALUES (NEW.receiver_email, 1)
+            ON CONFLICT (user_email) DO UPDATE SET unread_count = unread_count + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_messages_unread_update
+        AFTER UPDATE OF is_read, receiver_email ON Messages
+        WHEN (OLD.is_read = FALSE) IS NOT (NEW.is_read = FALSE) OR OLD.receiver_email != NEW.receiver_email
+        BEGIN
+            UPDATE UnreadCounters SET unread_count = unread_count - 1
+            WHERE user_email = OLD.receiver_email AND OLD.is_read = FALSE;
+            INSERT INTO UnreadCounters (user_email, unread_count)
+            SELECT NEW.receiver_email, 1 WHERE NEW.is_read = FALSE
+            ON CONFLICT (user_email) DO UPDATE SET unread_count = unread_count + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_messages_unread_delete
+        AFTER DELETE ON Messages
+        WHEN OLD.is_read = FALSE
+        BEGIN
+            UPDATE UnreadCounters SET unread_count = unread_count - 1
+            WHERE user_email = OLD.receiver_email;
+        END
+        """,
+        # Заполняем счетчики по уже существующим сообщениям
+        """
+        INSERT OR REPLACE INTO UnreadCounters (user_email, unread_count)
+        SELECT receiver_email, COUNT(*) FROM Messages
+        WHERE is_read = FALSE
+        GROUP BY receiver_email
+        """,
+    ]),
+    (5, "Сводка диалогов для списка сообщений", [
+        # Одна строка на диалог: пара участников (user_a < user_b) и проект (0 - обычный чат).
+        # Последнее сообщение и непрочитанные каждой стороны обновляются триггерами
+        """
+        CREATE TABLE IF NOT EXISTS Conversations (
+            user_a TEXT NOT NULL,
+            user_b TEXT NOT NULL,
+            job_id INTEGER NOT NULL DEFAULT 0,
+            last_message_id INTEGER NOT NULL,
+            last_message_time DATETIME,
+            snippet TEXT,
+            unread_a INTEGER NOT NULL DEFAULT 0,
+            unread_b INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_a, user_b, job_id)
+        )
+        """,
+        # Индексы этой таблицы удалены из каталога вместе с ней (миграция 11)
+        "CREATE INDEX IF NOT EXISTS idx_conversations_a ON Conversations (user_a, last_message_id)",
+        "CREATE INDEX IF NOT EXISTS idx_conversations_b ON Conversations (user_b, last_message_id)",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_messages_conversation_insert
+        AFTER INSERT ON Messages
+        BEGIN
+            INSERT INTO Conversations (user_a, user_b, job_id, last_message_id, last_message_time, snippet, unread_a, unread_b)
+            VALUES (
+                min(NEW.sender_email, NEW.receiver_email),
+                max(NEW.sender_email, NEW.receiver_email),
+                IFNULL(NEW.job_id, 0),
+                NEW.id,
+                NEW.created_at,
+                substr(NEW.message, 1, 100),
+                NEW.is_read = FALSE AND NEW.receiver_email < NEW.sender_email,
+                NEW.is_read = FALSE AND NEW.receiver_email > NEW.sender_email
+            )
+            ON CONFLICT (user_a, user_b, job_id) DO UPDATE SET
+                last_message_id = excluded.last_message_id,
+                last_message_time = excluded.last_message_time,
+                snippet = excluded.snippet,
+                unread_a = unread_a + excluded.unread_a,
+                unread_b = unread_b + excluded.unread_b;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_messages_conversation_read
+        AFTER UPDATE OF is_read ON Messages
+        WHEN (OLD.is_read = FALSE) IS NOT (NEW.is_read = FALSE)
+        BEGIN
+            UPDATE Conversations SET
+                unread_a = unread_a + CASE WHEN NEW.receiver_email = user_a
+                    THEN (NEW.is_read = FALSE) - (OLD.is_read = FALSE) ELSE 0 END,
+                unread_b = unread_b + CASE WHEN NEW.receiver_email = user_b
+                    THEN (NEW.is_read = FALSE) - (OLD.is_read = FALSE) ELSE 0 END
+            WHERE user_a = min(NEW.sender_email, NEW.receiver_email)
+              AND user_b = max(NEW.sender_email, NEW.receiver_email)
+              AND job_id = IFNULL(NEW.job_id, 0);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_messages_conversation_delete
+        AFTER DELETE ON Messages
+        BEGIN
+            UPDATE Conversations SET
+                unread_a = unread_a - (OLD.is_read = FALSE AND OLD.receiver_email = user_a),
+                unread_b = unread_b - (OLD.is_read = FALSE AND OLD.receiver_email = user_b)
+            WHERE user_a = min(OLD.sender_email, OLD.receiver_email)
+              AND user_b = max(OLD.sender_email, OLD.receiver_email)
+              AND job_id = IFNULL(OLD.job_id, 0);
+            -- Удален весь диалог - удаляем строку
+            DELETE FROM Conversations
+            WHERE user_a = min(OLD.sender_email, OLD.receiver_email)
+              AND user_b = max(OLD.sender_email, OLD.receiver_email)
+              AND job_id = IFNULL(OLD.job_id, 0)
+              AND NOT EXISTS (
+                  SELECT 1 FROM Messages m
+                  WHERE ((m.sender_email = OLD.sender_email AND m.receiver_email = OLD.receiver_email)
+                      OR (m.sender_email = OLD.receiver_email AND m.receiver_email = OLD.sender_email))
+                    AND m.job_id IS OLD.job_id
+              );
+            -- Удалено последнее сообщение - последним становится предыдущее
+            UPDATE Conversations SET (last_message_id, last_message_time, snippet) = (
+                SELECT m.id, m.created_at, substr(m.message, 1, 100) FROM Messages m
+                WHERE ((m.sender_email = OLD.sender_email AND m.receiver_email = OLD.receiver_email)
+                    OR (m.sender_email = OLD.receiver_email AND m.receiver_email = OLD.sender_email))
+                  AND m.job_id IS OLD.job_id
+                ORDER BY m.id DESC LIMIT 1
+            )
+            WHERE user_a = min(OLD.sender_email, OLD.receiver_email)
+              AND user_b = max(OLD.sender_email, OLD.receiver_email)
+              AND job_id = IFNULL(OLD.job_id, 0)
+              AND last_message_id = OLD.id;
+        END
+        """,
+        # Заполняем сводку по уже существующим сообщениям; при MAX(id) остальные
+        # колонки берутся из последнего сообщения диалога
+        """
+        INSERT OR REPLACE INTO Conversations (user_a, user_b, job_id, last_message_id, last_message_time, snippet, unread_a, unread_b)
+        SELECT
+            min(sender_email, receiver_email) AS pair_a,
+            max(sender_email, receiver_email) AS pair_b,
+            IFNULL(job_id, 0) AS pair_job,
+            MAX(id),
+            created_at,
+            substr(message, 1, 100),
+            SUM(is_read = FALSE AND receiver_email < sender_email),
+            SUM(is_read = FALSE AND receiver_email > sender_email)
+        FROM Messages
+        GROUP BY pair_a, pair_b, pair_job
+        """,
+    ]),
+    (6, "Накопительная статистика фрилансеров", [
+        # Сумма и количество оценок обновляются вместе с отзывом, rating выводится из них.
+        # Счетчиком завершенных проектов служит существующая колонка completed_projects
+        "ALTER TABLE Users ADD COLUMN rating_sum INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE Users ADD COLUMN rating_count INTEGER NOT NULL DEFAULT 0",
+        """
+        UPDATE Users SET (rating_sum, rating_count) = (
+            SELECT IFNULL(SUM(rating), 0), COUNT(*) FROM Reviews
+            WHERE freelancer_email = Users.email
+        )
+        WHERE role = 'freelancer'
+        """,
+        """
+        UPDATE Users SET
+            rating = CASE WHEN rating_count > 0
+                THEN ROUND(CAST(rating_sum AS REAL) / rating_count, 1) ELSE 0.0 END,
+            completed_projects = (
+                SELECT COUNT(DISTINCT j.id) FROM Jobs j
+                INNER JOIN Applications a ON j.id = a.job_id
+                WHERE a.freelancer_email = Users.email AND a.status = 'completed' AND j.status = 'done'
+            )
+        WHERE role = 'freelancer'
+        """,
+    ]),
+    (7, "Полнотекстовый поиск по проектам", [
+        # unicode61 приводит кириллицу к нижнему регистру, но remove_diacritics действует только
+        # на латиницу, поэтому "ё" сводится к "е" в представлении, из которого строится индекс
+        f"""
+        CREATE VIEW IF NOT EXISTS JobsSearchContent AS
+        SELECT id, {fold_yo("title")} AS title, {fold_yo("description")} AS description
+        FROM Jobs
+        """,
+        # Индекс без копии текста (content): строки читаются из представления по rowid.
+        # Префиксные индексы ускоряют запросы вида "диз*"
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS JobsSearch USING fts5(
+            title, description,
+            content='JobsSearchContent', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+        """,
+        # Совпадение в заголовке весит больше, чем в описании
+        "INSERT INTO JobsSearch (JobsSearch, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_jobs_search_insert
+        AFTER INSERT ON Jobs
+        BEGIN
+            INSERT INTO JobsSearch (rowid, title, description)
+            VALUES (NEW.id, {fold_yo("NEW.title")}, {fold_yo("NEW.description")});
+        END
+        """,
+        # Для индекса с внешним содержимым удаление требует прежних значений колонок
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_jobs_search_delete
+        AFTER DELETE ON Jobs
+        BEGIN
+            INSERT INTO JobsSearch (JobsSearch, rowid, title, description)
+            VALUES ('delete', OLD.id, {fold_yo("OLD.title")}, {fold_yo("OLD.description")});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_jobs_search_update
+        AFTER UPDATE OF title, description ON Jobs
+        BEGIN
+            INSERT INTO JobsSearch (JobsSearch, rowid, title, description)
+            VALUES ('delete', OLD.id, {fold_yo("OLD.title")}, {fold_yo("OLD.description")});
+            INSERT INTO JobsSearch (rowid, title, description)
+            VALUES (NEW.id, {fold_yo("NEW.title")}, {fold_yo("NEW.description")});
+        END
+        """,
+        # Индексируем уже существующие проекты
+        "INSERT INTO JobsSearch (JobsSearch) VALUES ('rebuild')",
+    ]),
+    (8, "Справочник навыков и каталог пользователей", [
+        # user_count - число пользователей с навыком (для подсказок), ведется триггерами UserSkills
+        """
+        CREATE TABLE IF NOT EXISTS Skills (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            normalized TEXT NOT NULL UNIQUE,
+            user_count INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        # Ключ начинается с навыка: пересечение навыков читает только их списки пользователей
+        """
+        CREATE TABLE IF NOT EXISTS UserSkills (
+            skill_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (skill_id, user_id),
+            FOREIGN KEY (skill_id) REFERENCES Skills (id),
+            FOREIGN KEY (user_id) REFERENCES Users (id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_user_skills_insert
+        AFTER INSERT ON UserSkills
+        BEGIN
+            UPDATE Skills SET user_count = user_count + 1 WHERE id = NEW.skill_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_user_skills_delete
+        AFTER DELETE ON UserSkills
+        BEGIN
+            UPDATE Skills SET user_count = user_count - 1 WHERE id = OLD.skill_id;
+        END
+        """,
+        # Курсор каталога сравнивает (rating, completed_projects, id) - NULL в них недопустим
+        "UPDATE Users SET rating = 0.0 WHERE rating IS NULL",
+        "UPDATE Users SET completed_projects = 0 WHERE completed_projects IS NULL",
+        create_indexes("idx_users_role_rating", "idx_users_rating", "idx_user_skills_user"),
+        rebuild_user_skills,
+    ]),
+    (9, "Хранилище загрузок по хешу содержимого", [
+        # Файл хранится один раз на содержимое; ref_count ведется триггерами UploadRefs,
+        # uploaded_at - время последней загрузки этого содержимого
+        """
+        CREATE TABLE IF NOT EXISTS UploadBlobs (
+            sha256 TEXT PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Кто ссылается на блоб: owner_type - поле владельца (avatar, portfolio - Users.id; job - Jobs.id)
+        """
+        CREATE TABLE IF NOT EXISTS UploadRefs (
+            owner_type TEXT NOT NULL,
+            owner_id INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            PRIMARY KEY (owner_type, owner_id, sha256),
+            FOREIGN KEY (sha256) REFERENCES UploadBlobs (sha256)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_upload_refs_insert
+        AFTER INSERT ON UploadRefs
+        BEGIN
+            UPDATE UploadBlobs SET ref_count = ref_count + 1 WHERE sha256 = NEW.sha256;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_upload_refs_delete
+        AFTER DELETE ON UploadRefs
+        BEGIN
+            UPDATE UploadBlobs SET ref_count = ref_count - 1 WHERE sha256 = OLD.sha256;
+        END
+        """,
+    ]),
+    (10, "Блобы загрузок по хешу и расширению", [
+        # Ключ блоба - путь (хеш + расширение): одно содержимое, загруженное как .txt и как
+        # .jpg, хранится двумя файлами, и каждый отдается со своим типом
+        "DROP TRIGGER IF EXISTS trg_upload_refs_insert",
+        "DROP TRIGGER IF EXISTS trg_upload_refs_delete",
+        """
+        CREATE TABLE UploadBlobsByPath (
+            path TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        INSERT INTO UploadBlobsByPath (path, sha256, size, ref_count, uploaded_at)
+        SELECT path, sha256, size, ref_count, uploaded_at FROM UploadBlobs
+        """,
+        """
+        CREATE TABLE UploadRefsByPath (
+            owner_type TEXT NOT NULL,
+            owner_id INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            PRIMARY KEY (owner_type, owner_id, path),
+            FOREIGN KEY (path) REFERENCES UploadBlobsByPath (path)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT INTO UploadRefsByPath (owner_type, owner_id, path)
+        SELECT r.owner_type, r.owner_id, b.path
+        FROM UploadRefs r INNER JOIN UploadBlobs b ON b.sha256 = r.sha256
+        """,
+        "DROP TABLE UploadRefs",
+        "DROP TABLE UploadBlobs",
+        # Переименование переносит и внешний ключ UploadRefsByPath на новое имя
+        "ALTER TABLE UploadBlobsByPath RENAME TO UploadBlobs",
+        "ALTER TABLE UploadRefsByPath RENAME TO UploadRefs",
+        """
+        CREATE TRIGGER trg_upload_refs_insert
+        AFTER INSERT ON UploadRefs
+        BEGIN
+            UPDATE UploadBlobs SET ref_count = ref_count + 1 WHERE path = NEW.path;
+        END
+        """,
+        """
+        CREATE TRIGGER trg_upload_refs_delete
+        AFTER DELETE ON UploadRefs
+        BEGIN
+            UPDATE UploadBlobs SET ref_count = ref_count - 1 WHERE path = OLD.path;
+        END
+        """,
+    ]),
+    (11, "Сводка диалогов по участникам", [
+        # У каждого участника своя строка диалога (пользователь, собеседник, проект): список
+        # сообщений читается одним проходом по idx_conversations_user без объединений и
+        # группировки, проектный чат - такой же диалог с собеседником по проекту
+        "DROP TRIGGER IF EXISTS trg_messages_conversation_insert",
+        "DROP TRIGGER IF EXISTS trg_messages_conversation_read",
+        "DROP TRIGGER IF EXISTS trg_messages_conversation_delete",
+        """
+        CREATE TABLE ConversationsByUser (
+            user_email TEXT NOT NULL,
+            other_email TEXT NOT NULL,
+            job_id INTEGER NOT NULL DEFAULT 0,
+            last_message_id INTEGER NOT NULL,
+            last_message_time DATETIME,
+            snippet TEXT,
+            unread_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_email, other_email, job_id)
+        )
+        """,
+        # Каждая строка пары дает по строке обоим участникам
+        """
+        INSERT INTO ConversationsByUser
+        SELECT user_a, user_b, job_id, last_message_id, last_message_time, snippet, unread_a FROM Conversations
+        UNION ALL
+        SELECT user_b, user_a, job_id, last_message_id, last_message_time, snippet, unread_b FROM Conversations
+        """,
+        "DROP TABLE Conversations",
+        "ALTER TABLE ConversationsByUser RENAME TO Conversations",
+        create_indexes("idx_conversations_user"),
+        """
+        CREATE TRIGGER trg_messages_conversation_insert
+        AFTER INSERT ON Messages
+        BEGIN
+            INSERT INTO Conversations (user_email, other_email, job_id, last_message_id, last_message_time, snippet, unread_count)
+            VALUES (NEW.sender_email, NEW.receiver_email, IFNULL(NEW.job_id, 0), NEW.id, NEW.created_at,
+                    substr(NEW.message, 1, 100), 0),
+                   (NEW.receiver_email, NEW.sender_email, IFNULL(NEW.job_id, 0), NEW.id, NEW.created_at,
+                    substr(NEW.message, 1, 100), NEW.is_read = FALSE)
+            ON CONFLICT (user_email, other_email, job_id) DO UPDATE SET
+                last_message_id = excluded.last_message_id,
+                last_message_time = excluded.last_message_time,
+                snippet = excluded.snippet,
+                unread_count = unread_count + excluded.unread_count;
+        END
+        """,
+        """
+        CREATE TRIGGER trg_messages_conversation_read
+        AFTER UPDATE OF is_read ON Messages
+        WHEN (OLD.is_read = FALSE) IS NOT (NEW.is_read = FALSE)
+        BEGIN
+            UPDATE Conversations SET unread_count = unread_count + (NEW.is_read = FALSE) - (OLD.is_read = FALSE)
+            WHERE user_email = NEW.receiver_email
+              AND other_email = NEW.sender_email
+              AND job_id = IFNULL(NEW.job_id, 0);
+        END
+        """,
+        """
+        CREATE TRIGGER trg_messages_conversation_delete
+        AFTER DELETE ON Messages
+        BEGIN
+            UPDATE Conversations SET unread_count = unread_count - 1
+            WHERE OLD.is_read = FALSE
+              AND user_email = OLD.receiver_email
+              AND other_email = OLD.sender_email
+              AND job_id = IFNULL(OLD.job_id, 0);
+            -- Удален весь диалог - удаляем строки обоих участников
+            DELETE FROM Conversations
+            WHERE user_email IN (OLD.sender_email, OLD.receiver_email)
+              AND other_email IN (OLD.sender_email, OLD.receiver_email)
+              AND job_id = IFNULL(OLD.job_id, 0)
+              AND NOT EXISTS (
+                  SELECT 1 FROM Messages m
+                  WHERE ((m.sender_email = OLD.sender_email AND m.receiver_email = OLD.receiver_email)
+                      OR (m.sender_email = OLD.receiver_email AND m.receiver_email = OLD.sender_email))
+                    AND m.job_id IS OLD.job_id
+              );
+            -- Удалено последнее сообщение - последним становится предыдущее
+            UPDATE Conversations SET (last_message_id, last_message_time, snippet) = (
+                SELECT m.id, m.created_at, substr(m.message, 1, 100) FROM Messages m
+                WHERE ((m.sender_email = OLD.sender_email AND m.receiver_email = OLD.receiver_email)
+                    OR (m.sender_email = OLD.receiver_email AND m.receiver_email = OLD.sender_email))
+                  AND m.job_id IS OLD.job_id
+                ORDER BY m.id DESC LIMIT 1
+            )
+            WHERE user_email IN (OLD.sender_email, OLD.receiver_email)
+              AND other_email IN (OLD.sender_email, OLD.receiver_email)
+              AND job_id = IFNULL(OLD.job_id, 0)
+              AND last_message_id = OLD.id;
+        END
+        """,
+    ]),
+]
+
+def get_schema_version(conn) -> int:
+    """Возвращает текущую версию схемы (0 для пустой БД)"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
     """)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
 
-    # Сохраняем изменения и закрываем соединение
+def apply_migrations(conn) -> list:
+    """Применяет недостающие миграции, каждую в своей транзакции; возвращает их версии"""
+    applied = []
+    conn.isolation_level = None  # управляем транзакциями явно
+    try:
+        if get_schema_version(conn) >= MIGRATIONS[-1][0]:
+            return applied  # схема актуальна - старт без изменений
+
+        for version, description, steps in MIGRATIONS:
+            # BEGIN IMMEDIATE сериализует миграции между процессами (воркерами)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if version <= get_schema_version(conn):
+                    conn.execute("ROLLBACK")
+                    continue
+                cursor = conn.cursor()
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                    (version, description)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(version)
+            print(f"Применена миграция {version}: {description}")
+    finally:
+        conn.isolation_level = ""
+    return applied
+
+def init_db():
+    """Приводит схему базы данных к актуальной версии, не удаляя данные"""
+    conn = get_connection()
+    try:
+        return apply_migrations(conn)
+    finally:
+        conn.close()
+
+def drop_all_tables():
+    """Удаляет все таблицы и историю миграций (для скриптов пересоздания БД)"""
+    conn = get_connection()
+    conn.execute("PRAGMA foreign_keys = OFF")
+    # Виртуальные таблицы удаляем первыми - вместе с ними удаляются их служебные таблицы
+    tables = conn.execute("""
+        SELECT name FROM sqlite_master
+        WHERE type = 'table' AND name NOT LIKE 'sqlite_%'
+        ORDER BY sql LIKE 'CREATE VIRTUAL%' DESC
+    """).fetchall()
+    for table in tables:
+        conn.execute(f"DROP TABLE IF EXISTS {table['name']}")
     conn.commit()
     conn.close()
@@ -3,130 +3,29 @@
 Скрипт для пересоздания базы данных с правильными FOREIGN KEY для DBeaver
 DBeaver читает FOREIGN KEY из базы данных, поэтому они должны быть явно определены
 """
-import sqlite3
 import os
 import sys
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-DB_NAME = "freelance.db"
+from database import get_connection, get_db_path, init_db
 
 def recreate_db_for_dbeaver():
     """Пересоздает базу данных с правильными FOREIGN KEY для DBeaver"""
-    # Удаляем старую базу
-    if os.path.exists(DB_NAME):
-        os.remove(DB_NAME)
-        print("Старая база данных удалена")
+    db_path = get_db_path()
     
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("PRAGMA foreign_keys = ON")
-    cursor = conn.cursor()
+    # Удаляем старую базу вместе с файлами журнала WAL
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    print("Старая база данных удалена")
     
+    # Схема создается теми же миграциями, что и при запуске приложения
     print("Создание таблиц с FOREIGN KEY...")
+    init_db()
     
-    # 1. Users (базовая таблица, без FOREIGN KEY)
-    cursor.execute("""
-        CREATE TABLE Users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL,
-            name TEXT,
-            avatar TEXT,
-            about_me TEXT,
-            activity TEXT,
-            skills TEXT,
-            rating REAL DEFAULT 0.0,
-            completed_projects INTEGER DEFAULT 0,
-            phone TEXT,
-            telegram TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            portfolio_files TEXT,
-            portfolio_links TEXT
-        )
-    """)
-    print("✓ Users создана")
-    
-    # 2. Jobs (связь с Users)
-    cursor.execute("""
-        CREATE TABLE Jobs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            description TEXT NOT NULL,
-            deadline TEXT NOT NULL,
-            status TEXT NOT NULL,
-            creator_email TEXT NOT NULL,
-            priority TEXT DEFAULT 'medium',
-            files TEXT,
-            FOREIGN KEY (creator_email) REFERENCES Users(email)
-        )
-    """)
-    print("✓ Jobs создана (1 FK: creator_email → Users.email)")
-    
-    # 3. Applications (связи с Jobs и Users)
-    cursor.execute("""
-        CREATE TABLE Applications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            job_id INTEGER NOT NULL,
-            freelancer_email TEXT NOT NULL,
-            status TEXT NOT NULL DEFAULT 'pending',
-            UNIQUE(job_id, freelancer_email),
-            FOREIGN KEY (job_id) REFERENCES Jobs(id),
-            FOREIGN KEY (freelancer_email) REFERENCES Users(email)
-        )
-    """)
-    print("✓ Applications создана (2 FK: job_id → Jobs.id, freelancer_email → Users.email)")
-    
-    # 4. Reviews (связи с Jobs и Users)
-    cursor.execute("""
-        CREATE TABLE Reviews (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            job_id INTEGER NOT NULL,
-            freelancer_email TEXT NOT NULL,
-            client_email TEXT NOT NULL,
-            rating INTEGER NOT NULL CHECK (rating >= 1 AND rating <= 5),
-            comment TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(job_id, freelancer_email, client_email),
-            FOREIGN KEY (job_id) REFERENCES Jobs(id),
-            FOREIGN KEY (freelancer_email) REFERENCES Users(email),
-            FOREIGN KEY (client_email) REFERENCES Users(email)
-        )
-    """)
-    print("✓ Reviews создана (3 FK: job_id → Jobs.id, freelancer_email → Users.email, client_email → Users.email)")
-    
-    # 5. Messages (связи с Users и Jobs)
-    cursor.execute("""
-        CREATE TABLE Messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            sender_email TEXT NOT NULL,
-            receiver_email TEXT NOT NULL,
-            job_id INTEGER,
-            message TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            is_read BOOLEAN DEFAULT FALSE,
-            FOREIGN KEY (sender_email) REFERENCES Users(email),
-            FOREIGN KEY (receiver_email) REFERENCES Users(email),
-            FOREIGN KEY (job_id) REFERENCES Jobs(id)
-        )
-    """)
-    print("✓ Messages создана (3 FK: sender_email → Users.email, receiver_email → Users.email, job_id → Jobs.id)")
-    
-    # 6. ProjectComments (связи с Jobs и Users)
-    cursor.execute("""
-        CREATE TABLE ProjectComments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            job_id INTEGER NOT NULL,
-            user_email TEXT NOT NULL,
-            comment TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (job_id) REFERENCES Jobs(id),
-            FOREIGN KEY (user_email) REFERENCES Users(email)
-        )
-    """)
-    print("✓ ProjectComments создана (2 FK: job_id → Jobs.id, user_email → Users.email)")
-    
-    conn.commit()
+    conn = get_connection()
+    cursor = conn.cursor()
     
     # Проверяем все FOREIGN KEY
     print("\n" + "="*60)
@@ -158,7 +57,7 @@ def recreate_db_for_dbeaver():
     if total_fk == 11:
         print("\n✓ УСПЕХ! Все связи созданы правильно!")
         print("Теперь DBeaver должен отобразить все связи на ER-диаграмме.")
-        print(f"\nБаза данных: {os.path.abspath(DB_NAME)}")
+        print(f"\nБаза данных: {os.path.abspath(db_path)}")
         print("Откройте её в DBeaver и создайте ER-диаграмму.")
     else:
         print(f"\n⚠ ВНИМАНИЕ: Создано {total_fk} из 11 связей")
@@ -173,4 +72,3 @@ if __name__ == "__main__":
         recreate_db_for_dbeaver()
     else:
         print("Отменено.")
-
@@ -1,66 +1,45 @@
 
 # Импорты для FastAPI и веб-функциональности
-from fastapi import FastAPI, Request, Form, HTTPException, Depends, UploadFile, File
-from fastapi.responses import RedirectResponse
+from fastapi import FastAPI, Request, Form, HTTPException, Depends, UploadFile, File, WebSocket, WebSocketDisconnect
+from fastapi.responses import RedirectResponse, FileResponse
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 
 # Стандартные библиотеки Python
+import asyncio
 import sqlite3
 import os
-import uuid
 from pathlib import Path
 from datetime import datetime, timedelta
 import re
 import json
 
 # Импорты из локальных модулей
-from database import init_db, get_connection
+from database import init_db, get_connection, get_pragma_report
+from constants import (
+    ITEMS_PER_PAGE, SEARCH_PAGE_LIMIT, MESSAGES_PER_PAGE, MESSAGES_POLL_LIMIT,
+    RECOMMENDED_JOBS_LIMIT, CANDIDATES_LIMIT, ALLOWED_FILE_EXTENSIONS, MAX_FILE_SIZE,
+)
+# Синхронные функции нужны только при запуске, для JWT и фоновых задач; обращения
+# к БД и bcrypt из маршрутов идут через async_models, в пулах потоков
 from models import (
-    get_user_by_email,
-    verify_password,
-    get_jobs,
-    create_job,
-    get_job_by_id,
-    apply_to_job,
-    create_user,
     hash_password,
-    update_user_profile,
-    get_user_by_id,
-    get_applications,
-    get_applications_by_freelancer,
-    get_applications_for_client,
-    update_application_status,
-    get_application_by_id,
-    delete_job,
-    has_user_applied_to_job,
-    get_user_application_status,
-    complete_job,
-    create_review,
-    get_reviews_for_freelancer,
-    get_job_reviews,
-    has_reviewed_job,
-    create_message,
-    get_messages_between_users,
-    get_user_conversations,
-    mark_messages_as_read,
-    get_users_by_role,
-    get_user_profile_by_email,
-    create_project_comment,
-    get_project_comments,
-    can_user_comment_on_project,
     create_access_token,
     verify_token,
-    get_all_users_with_filters,
-    get_project_participants,
-    get_unread_messages_count,
-    delete_project_comment,
-    get_all_project_comments,
     create_admin_user,
-    is_admin,
+    update_all_freelancer_stats,
+    update_freelancer_stats,
+    user_cache,
 )
+import async_models as db
+from chat_hub import chat_hub
+from skills import parse_skills, rebuild_user_skills
+from tasks import task_registry
+from uploads import save_blob, is_blob_path, run_upload_io, UploadTooLarge, BLOBS_DIR
+from thumbnails import Thumbnailer, THUMBNAIL_SIZES, THUMBNAIL_FORMATS
+from static_cache import CachedStaticFiles, IMMUTABLE_CACHE_CONTROL
+from upload_gc import UploadCollector
 
 # Создание экземпляра FastAPI приложения
 app = FastAPI()
@@ -83,8 +62,18 @@ if os.getenv("RENDER"):
     # Доверенные хосты для Render
     app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*.onrender.com", "*.render.com"])
 
-# Монтирование статических файлов
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Монтирование статических файлов: шаблоны ссылаются на них через static_url с
+# отпечатком содержимого, такие ссылки кэшируются браузером навсегда
+static_files = CachedStaticFiles(directory="static")
+static_files.prepare()
+app.mount("/static", static_files, name="static")
+
+def static_url(path: str) -> str:
+    """Ссылка на статический файл с отпечатком содержимого"""
+    version = static_files.fingerprint(path)
+    return f"/static/{path}?v={version}" if version else f"/static/{path}"
+
+templates.env.globals["static_url"] = static_url
 
 # Настройка папок для загрузки файлов
 UPLOAD_DIR = Path("uploads")
@@ -95,12 +84,26 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 (UPLOAD_DIR / "projects").mkdir(exist_ok=True)     # Файлы проектов
 (UPLOAD_DIR / "portfolio").mkdir(exist_ok=True)    # Файлы портфолио
 
-# Монтируем папку загрузок как статическую для доступа через URL
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Монтируем папку загрузок как статическую для доступа через URL. Блобы не
+# меняются никогда, файлы под uuid-именами не перезаписываются, но могут быть удалены
+app.mount("/uploads", CachedStaticFiles(
+    directory="uploads", max_age=86400, immutable_prefixes=(f"{BLOBS_DIR}/",)
+), name="uploads")
+
+# Уменьшенные копии аватарок: шаблоны ссылаются на них через фильтр avatar_url
+thumbnailer = Thumbnailer({"uploads": UPLOAD_DIR, "static": Path("static")}, UPLOAD_DIR / "thumbs")
+templates.env.filters["avatar_url"] = thumbnailer.url
+
+# Очистка загрузок, на которые больше нет ссылок: раз в сутки при очередной загрузке или вручную
+upload_collector = UploadCollector(UPLOAD_DIR, thumbnailer)
 
 # Инициализация базы данных
 init_db()
 
+# Выводим активный профиль настроек SQLite
+pragma_report = get_pragma_report()
+print("SQLite: " + ", ".join(f"{key}={value}" for key, value in pragma_report.items()))
+
 # Проверяем и создаем тестовые данные при первом запуске
 def check_and_create_test_data():
     """Проверяет наличие данных и создает тестовые данные при первом запуске"""
@@ -232,9 +235,12 @@ def create_test_data():
         """, (
             user['email'], hashed_password, user['role'], user['name'], user['about_me'],
             user['activity'], user['skills'], user['phone'], user['telegram'],
-            user.get('rating'), user.get('completed_projects')
+            user.get('rating', 0.0), user.get('completed_projects', 0)
         ))
     
+    # Раскладываем навыки тестовых пользователей в индекс навыков
+    rebuild_user_skills(cursor)
+    
     # Получаем клиентов для создания проектов
     cursor.execute("SELECT email FROM Users WHERE role = 'client'")
     clients = [row[0] for row in cursor.fetchall()]
@@ -378,6 +384,10 @@ def create_test_data():
             review['rating'], review['comment']
         ))
     
+    # Накопленные суммы оценок и счетчик завершенных проектов - по вставленным отзывам и откликам
+    for email in freelancers:
+        update_freelancer_stats(email, cursor)
+    
     # Создаем сообщения
     messages = [
         {
@@ -488,35 +498,51 @@ create_admin_user()
 
 # ===== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ДЛЯ РАБОТЫ С ФАЙЛАМИ =====
 
-def save_uploaded_file(file: UploadFile, subfolder: str) -> str:
-    """Сохраняет загруженный файл и возвращает путь к нему"""
+async def save_uploaded_file(file: UploadFile) -> str:
+    """Сохраняет загруженный файл в хранилище блобов (см. uploads.py) и возвращает путь к нему"""
     # Проверяем тип файла
-    allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.pdf', '.doc', '.docx', '.txt'}
     file_extension = Path(file.filename).suffix.lower()
     
-    if file_extension not in allowed_extensions:
+    if file_extension not in ALLOWED_FILE_EXTENSIONS:
         raise HTTPException(status_code=400, detail="Неподдерживаемый тип файла")
     
-    # Проверяем размер файла (максимум 10MB)
-    content = file.file.read()
-    if len(content) > 10 * 1024 * 1024:  # 10MB
+    # Известный заранее размер отсекает файл без чтения, остальные проверяются по мере копирования
+    if file.size is not None and file.size > MAX_FILE_SIZE:
         raise HTTPException(status_code=400, detail="Файл слишком большой")
     
-    # Генерируем уникальное имя файла
-    file_id = str(uuid.uuid4())
-    filename = f"{file_id}{file_extension}"
-    file_path = UPLOAD_DIR / subfolder / filename
-    
-    # Сохраняем файл
-    with open(file_path, "wb") as buffer:
-        buffer.write(content)
+    # Имя файла - хеш содержимого: повторная загрузка того же файла не создает копию
+    try:
+        blob = await save_blob(file.file, UPLOAD_DIR, file_extension, MAX_FILE_SIZE)
+    except UploadTooLarge:
+        raise HTTPException(status_code=400, detail="Файл слишком большой")
     
-    return f"/uploads/{subfolder}/{filename}"
+    upload_collector.maybe_start()
+    return blob["path"]
+
+
+@app.get("/thumbs/{size}/{source:path}")
+async def thumbnail(request: Request, size: int, source: str):
+    """Уменьшенная копия изображения; если ее не построить - перенаправление на оригинал"""
+    if size not in THUMBNAIL_SIZES or thumbnailer.resolve(source) is None:
+        raise HTTPException(status_code=404, detail="Файл не найден")
+    fmt = "webp" if "image/webp" in request.headers.get("accept", "") else "jpg"
+    path = await run_upload_io(thumbnailer.get, size, source, fmt)
+    if path is None:
+        return RedirectResponse(url=f"/{source}", status_code=302)
+    # Содержимое блоба не меняется никогда, остальные файлы могут смениться под тем же именем
+    if is_blob_path(f"/{source}"):
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = "public, max-age=86400"
+    return FileResponse(path, media_type=THUMBNAIL_FORMATS[fmt][1], headers={
+        "Cache-Control": cache_control,
+        "Vary": "Accept",
+    })
 
 
 def delete_file(file_path: str):
-    """Удаляет файл с сервера"""
-    if file_path and file_path.startswith("/uploads/"):
+    """Удаляет файл с сервера (блобы общие - их учитывают ссылки UploadRefs, а не удаление)"""
+    if file_path and file_path.startswith("/uploads/") and not is_blob_path(file_path):
         actual_path = UPLOAD_DIR / file_path[9:]  # Убираем "/uploads/"
         if actual_path.exists():
             actual_path.unlink()
@@ -567,72 +593,68 @@ def format_date_for_display(date_str: str) -> str:
 
 # ===== ФУНКЦИИ АУТЕНТИФИКАЦИИ И АВТОРИЗАЦИИ =====
 
-def get_current_user(request: Request):
+async def load_user_context(email: str):
+    """Загружает пользователя и готовит данные для шаблонов: аватар, портфолио, непрочитанные"""
+    user = await db.get_user_by_email(email)
+    if not user:
+        return None
+    # если это Row, конвертируем в dict
+    if isinstance(user, sqlite3.Row):
+        user = dict(user)
+    if not user.get("avatar"):
+        user["avatar"] = "/static/defaultAvatar.jpg"
+    
+    # Парсим JSON поля
+    if user.get("portfolio_files"):
+        try:
+            user["portfolio_files"] = json.loads(user["portfolio_files"])
+        except Exception as e:
+            user["portfolio_files"] = []
+    else:
+        user["portfolio_files"] = []
+    
+    # Добавляем счетчик непрочитанных сообщений
+    user["unread_messages_count"] = await db.get_unread_messages_count(email)
+    
+    return user
+
+
+async def get_current_user(request: Request):
+    """Возвращает пользователя запроса; загружается один раз и запоминается в request.state"""
+    # Все зависимости и обработчики запроса получают один и тот же объект
+    if hasattr(request.state, "current_user"):
+        return request.state.current_user
+    
+    user = None
+    
     # Сначала проверяем JWT токен
     auth_header = request.headers.get("Authorization")
     if auth_header and auth_header.startswith("Bearer "):
         token = auth_header.split(" ")[1]
         email = verify_token(token)
         if email:
-            user = get_user_by_email(email)
-            if user:
-                if isinstance(user, sqlite3.Row):
-                    user = dict(user)
-                if not user.get("avatar"):
-                    user["avatar"] = "/static/defaultAvatar.jpg"
-                
-                # Парсим JSON поля
-                if user.get("portfolio_files"):
-                    try:
-                        user["portfolio_files"] = json.loads(user["portfolio_files"])
-                    except Exception as e:
-                        user["portfolio_files"] = []
-                else:
-                    user["portfolio_files"] = []
-                
-                # Добавляем счетчик непрочитанных сообщений
-                user["unread_messages_count"] = get_unread_messages_count(email)
-                
-                return user
+            user = await load_user_context(email)
     
     # Fallback на cookie для совместимости
-    email = request.cookies.get("user_email")
-    if not email:
-        return None
-    user = get_user_by_email(email)
-    if user:
-        # если это Row, конвертируем в dict
-        if isinstance(user, sqlite3.Row):
-            user = dict(user)
-        if not user.get("avatar"):
-            user["avatar"] = "/static/defaultAvatar.jpg"
-        
-        # Парсим JSON поля
-        if user.get("portfolio_files"):
-            try:
-                user["portfolio_files"] = json.loads(user["portfolio_files"])
-            except Exception as e:
-                user["portfolio_files"] = []
-        else:
-            user["portfolio_files"] = []
-        
-        # Добавляем счетчик непрочитанных сообщений
-        user["unread_messages_count"] = get_unread_messages_count(email)
-        
-        return user
-    return None
+    if user is None:
+        email = request.cookies.get("user_email")
+        if email:
+            user = await load_user_context(email)
+    
+    request.state.current_user = user
+    return user
 
 
 # Функции-декораторы для проверки авторизации
-def require_login(request: Request):
-    user = get_current_user(request)
+async def require_login(request: Request):
+    user = await get_current_user(request)
     if not user:
         raise HTTPException(status_code=302, detail="Redirect", headers={"Location": "/login"})
     return user
 
 
 def require_role(role: str):
-    def role_checker(user: dict = Depends(require_login)):
+    async def role_checker(user: dict = Depends(require_login)):
         if user["role"] != role:
             raise HTTPException(status_code=403, detail="Нет доступа")
         return user
@@ -641,8 +663,9 @@ def require_role(role: str):
 
 def require_admin():
     """Декоратор для проверки административных прав"""
-    def admin_checker(user: dict = Depends(require_login)):
-        if not is_admin(user["email"]):
+    async def admin_checker(user: dict = Depends(require_login)):
+        # Роль уже загружена вместе с пользователем запроса - повторно Users не читаем
+        if user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Требуются административные права")
         return user
     return admin_checker
@@ -658,7 +681,7 @@ async def login_get(request: Request):
 
 @app.post("/login")
 async def login_post(request: Request, email: str = Form(...), password: str = Form(...)):
-    user = get_user_by_email(email)
+    user = await db.get_user_by_email(email)
     error = None
     if not user:
         error = "Пользователь не найден"
@@ -666,20 +689,21 @@ async def login_post(request: Request, email: str = Form(...), password: str = F
         # sqlite3.Row → dict
         if isinstance(user, sqlite3.Row):
             user = dict(user)
-        if not verify_password(password, user["password"]):
+        if not await db.verify_password(password, user["password"]):
             error = "Неверный пароль"
 
     if error:
         # Возвращаем главную страницу с ошибкой в overlay
-        jobs = get_jobs()
-        jobs = [dict(job) if isinstance(job, sqlite3.Row) else job for job in jobs]
+        jobs, next_cursor = await get_home_jobs()
         return templates.TemplateResponse("index.html", {
             "request": request,
             "jobs": jobs,
             "user": None,
             "login_error": error,
             "selected_status": None,
-            "total_jobs_count": len(jobs)
+            "total_jobs_count": await db.count_jobs(),
+            "next_cursor": next_cursor,
+            "is_first_page": True
         }, status_code=400)
 
     # Создаем JWT токен
@@ -705,22 +729,23 @@ async def register_post(
     password: str = Form(...),
     role: str = Form(...),
 ):
-    existing = get_user_by_email(email)
+    existing = await db.get_user_by_email(email)
     if existing:
         # Возвращаем главную страницу с ошибкой в overlay
-        jobs = get_jobs()
-        jobs = [dict(job) if isinstance(job, sqlite3.Row) else job for job in jobs]
+        jobs, next_cursor = await get_home_jobs()
         return templates.TemplateResponse("index.html", {
             "request": request,
             "jobs": jobs,
             "user": None,
             "register_error": "Email уже зарегистрирован",
             "selected_status": None,
-            "total_jobs_count": len(jobs)
+            "total_jobs_count": await db.count_jobs(),
+            "next_cursor": next_cursor,
+            "is_first_page": True
         }, status_code=400)
 
-    hashed = hash_password(password)
-    create_user(email=email, hashed_password=hashed, role=role, name=name, avatar=None)
+    hashed = await db.hash_password(password)
+    await db.create_user(email=email, hashed_password=hashed, role=role, name=name, avatar=None)
 
     # Создаем JWT токен
     access_token = create_access_token(data={"sub": email})
@@ -741,68 +766,148 @@ async def logout():
 
 # ===== ГЛАВНАЯ СТРАНИЦА И ПРОЕКТЫ =====
 
-@app.get("/")
-async def home(request: Request, status: str = None):
-    # Получаем пользователя без обязательной авторизации
-    user = get_current_user(request)
-    jobs = get_jobs(status)
-    # Конвертируем все Row в dict
-    jobs = [dict(job) if isinstance(job, sqlite3.Row) else job for job in jobs]
-    
-    # Фильтруем проекты в зависимости от авторизации пользователя
-    visible_jobs = []
-    for job in jobs:
-        # Проверяем, есть ли принятые отклики на этот проект
-        applications = get_applications(job["id"])
-        has_accepted = any(app["status"] == "accepted" for app in applications)
+def parse_search_cursor(cursor: str):
+    """Разбирает курсор поиска "режим:окно:rank:id" (режим e - точные формы слов, p - префиксы).
+
+    Пустые rank и id означают начало окна; курсоры старого вида "режим:rank:id" относятся к первому окну.
+    """
+    try:
+        parts = cursor.split(":")
+        if len(parts) == 3:
+            parts.insert(1, "")
+        mode, window, rank, job_id = parts
+        if mode not in ("e", "p"):
+            raise ValueError(mode)
+        window = int(window) if window else None
+        if rank or job_id:
+            return mode == "p", window, float(rank), int(job_id)
+        return mode == "p", window, None, None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор поиска")
+
+
+async def collect_search_page(q: str, viewer_email: str, viewer_role: str, status: str, prefix: bool,
+                              window: int, after_rank: float, after_id: int, limit: int) -> list:
+    """Набирает limit + 1 найденных проектов, переходя к более старым окнам совпадений, когда окно исчерпано"""
+    jobs = []
+    while True:
+        rows = await db.search_jobs(q, viewer_email, viewer_role, status, after_rank, after_id,
+                                    limit + 1 - len(jobs), prefix, window)
+        bounds = rows[0] if rows else None
+        if bounds is None and after_rank is not None:
+            # Проект курсора был последним в окне (или исчез) - границы окна берем без курсора
+            probe = await db.search_jobs(q, viewer_email, viewer_role, status, limit=1, prefix=prefix, window=window)
+            bounds = probe[0] if probe else None
+        jobs.extend(rows)
+        if bounds is None or len(jobs) > limit or not bounds["search_window_full"]:
+            return jobs
+        window, after_rank, after_id = bounds["search_window_end"], None, None
+
+
+async def search_job_page(user: dict, q: str, status: str = None, cursor: str = None, limit: int = ITEMS_PER_PAGE):
+    """Возвращает страницу найденных проектов и курсор следующей страницы.
+
+    Совпадения ранжируются окнами по SEARCH_CANDIDATES самых новых (см. models.search_jobs):
+    внутри окна - по BM25, окна - от новых к старым, поэтому найти можно любой видимый проект.
+    """
+    viewer_email, viewer_role = (user["email"], user["role"]) if user else (None, None)
+    if cursor:
+        prefix, window, after_rank, after_id = parse_search_cursor(cursor)
+    else:
+        prefix, window, after_rank, after_id = False, None, None, None
+    
+    # Сначала ищем точные формы слов - это быстро даже для частых слов. Если их не хватает
+    # на первую страницу, повторяем поиск по префиксам (найдет "логотипа" по "логотип")
+    jobs = await collect_search_page(q, viewer_email, viewer_role, status, prefix, window, after_rank, after_id, limit)
+    if not prefix and cursor is None and len(jobs) <= limit:
+        prefix = True
+        jobs = await collect_search_page(q, viewer_email, viewer_role, status, True, None, None, None, limit)
+    
+    next_cursor = None
+    mode = "p" if prefix else "e"
+    if len(jobs) > limit:
+        last, following = jobs[limit - 1], jobs[limit]
+        if following["search_window_start"] == last["search_window_start"]:
+            next_cursor = f"{mode}:{last['search_window_start']}:{last['search_rank']!r}:{last['id']}"
+        else:
+            # Страница закончилась ровно на конце окна - следующая начинается с нового окна
+            next_cursor = f"{mode}:{following['search_window_start']}::"
+    return jobs[:limit], next_cursor
+
+
+async def get_home_jobs(user: dict = None, status: str = None, before_id: int = None,
+                        q: str = None, after: str = None):
+    """Возвращает страницу видимых пользователю проектов и курсор следующей страницы"""
+    if q:
+        # Поиск: лучшие совпадения первыми, курсор - строка для параметра after
+        jobs, next_cursor = await search_job_page(user, q, status, after)
+    else:
+        # Запрашиваем на один проект больше, чтобы узнать, есть ли следующая страница
+        limit = ITEMS_PER_PAGE + 1
         
+        # Правила видимости применяются в SQL, отклики и участники загружаются пакетно
         if user:
-            # Для авторизованных пользователей - обычная логика
-            if (job["creator_email"] == user["email"] or 
-                job["status"] in ["in_progress", "done"] or
-                not has_accepted):
-                visible_jobs.append(job)
-            elif user["role"] == "freelancer":
-                has_applied = has_user_applied_to_job(job["id"], user["email"])
-                if has_applied:
-                    visible_jobs.append(job)
+            jobs = await db.get_visible_jobs(user["email"], user["role"], status, before_id=before_id, limit=limit)
         else:
-            # Для неавторизованных пользователей показываем только открытые проекты
-            if job["status"] == "open" and not has_accepted:
-                visible_jobs.append(job)
-    
-    # Добавляем информацию об откликах для авторизованных пользователей
-    for job in visible_jobs:
-        job["applications"] = get_applications(job["id"])
-        if user and user["role"] == "freelancer":
-            job["has_applied"] = has_user_applied_to_job(job["id"], user["email"])
-            job["application_status"] = get_user_application_status(job["id"], user["email"])
+            jobs = await db.get_visible_jobs(status=status, before_id=before_id, limit=limit)
         
+        has_next_page = len(jobs) > ITEMS_PER_PAGE
+        jobs = jobs[:ITEMS_PER_PAGE]
+        next_cursor = jobs[-1]["id"] if has_next_page else None
+    
+    if user:
+        jobs = await db.build_job_feed(jobs, user["email"], user["role"])
+    else:
+        jobs = await db.build_job_feed(jobs)
+    
+    for job in jobs:
         # Форматируем дату для отображения
         job["deadline"] = format_date_for_display(job["deadline"])
-        
-        # Получаем имя создателя проекта
-        creator = get_user_by_email(job["creator_email"])
-        if creator and isinstance(creator, sqlite3.Row):
-            creator = dict(creator)
-        job["creator_name"] = creator.get("name") if creator else job["creator_email"]
-        
-        # Получаем участников проекта
-        job["participants"] = get_project_participants(job["id"])
+    
+    return jobs, next_cursor
+
+
+@app.get("/")
+async def home(request: Request, status: str = None, before: int = None, q: str = None, after: str = None):
+    # Получаем пользователя без обязательной авторизации
+    user = await get_current_user(request)
+    q = (q or "").strip()
+    visible_jobs, next_cursor = await get_home_jobs(user, status, before, q, after)
     
     # Получаем общее количество проектов в системе
-    all_jobs = get_jobs()
-    total_jobs_count = len(all_jobs)
+    total_jobs_count = await db.count_jobs()
+    
+    # Рекомендации фрилансеру показываются над первой страницей обычной ленты
+    recommended_jobs = []
+    if user and user["role"] == "freelancer" and not q and before is None:
+        recommended_jobs = await db.get_recommended_jobs(user["email"], RECOMMENDED_JOBS_LIMIT)
     
     return templates.TemplateResponse("index.html", {
         "request": request,
         "jobs": visible_jobs,
         "user": user,
         "selected_status": status,
-        "total_jobs_count": total_jobs_count
+        "search_query": q,
+        "total_jobs_count": total_jobs_count,
+        "recommended_jobs": recommended_jobs,
+        "next_cursor": next_cursor,
+        "is_first_page": before is None and after is None
     })
 
 
+@app.get("/api/jobs/search")
+async def search_jobs_api(request: Request, q: str, status: str = None, cursor: str = None, limit: int = ITEMS_PER_PAGE):
+    """API поиска проектов по словам: лучшие совпадения первыми, keyset-пагинация по cursor"""
+    user = await get_current_user(request)
+    limit = max(1, min(limit, SEARCH_PAGE_LIMIT))
+    jobs, next_cursor = await search_job_page(user, q, status, cursor, limit)
+    return {
+        "status": "success",
+        "jobs": [dict(job) for job in jobs],
+        "next_cursor": next_cursor
+    }
+
+
 # ===== СОЗДАНИЕ И УПРАВЛЕНИЕ ПРОЕКТАМИ =====
 
 @app.get("/jobs/create")
@@ -833,7 +938,7 @@ async def job_create_post(request: Request, user: dict = Depends(require_role("c
         for file in files:
             if file.filename:  # Проверяем, что файл был загружен
                 try:
-                    file_path = save_uploaded_file(file, "projects")
+                    file_path = await save_uploaded_file(file)
                     file_paths.append(file_path)
                 except HTTPException as e:
                     return templates.TemplateResponse("create_job.html", {
@@ -843,14 +948,14 @@ async def job_create_post(request: Request, user: dict = Depends(require_role("c
                     }, status_code=400)
     
     # Создаем проект с файлами
-    create_job(title, description, deadline, user["email"], priority=priority, files=file_paths)
+    await db.create_job(title, description, deadline, user["email"], priority=priority, files=file_paths)
     return RedirectResponse(url="/", status_code=302)
 
 
 # Детальная страница проекта
 @app.get("/jobs/{job_id}")
 async def job_detail(request: Request, job_id: int, user: dict = Depends(require_login)):
-    job = get_job_by_id(job_id)
+    job = await db.get_job_by_id(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Проект не найден")
     
@@ -859,13 +964,13 @@ async def job_detail(request: Request, job_id: int, user: dict = Depends(require
         job = dict(job)
     
     # Получаем отклики на проект
-    applications = get_applications(job_id)
+    applications = await db.get_applications(job_id)
     # Конвертируем все Row в dict
     applications = [dict(app) if isinstance(app, sqlite3.Row) else app for app in applications]
     
     # Добавляем информацию об отклике пользователя для фрилансеров
     if user["role"] == "freelancer":
-        user["application_status"] = get_user_application_status(job_id, user["email"])
+        user["application_status"] = await db.get_user_application_status(job_id, user["email"])
     
     # Парсим файлы проекта
     if job.get("files"):
@@ -876,20 +981,20 @@ async def job_detail(request: Request, job_id: int, user: dict = Depends(require
             job["files"] = []
     
     # Получаем имя создателя проекта
-    creator = get_user_by_email(job["creator_email"])
+    creator = await db.get_user_by_email(job["creator_email"])
     if creator and isinstance(creator, sqlite3.Row):
         creator = dict(creator)
     job["creator_name"] = creator.get("name") if creator else job["creator_email"]
     
     # Получаем комментарии к проекту
-    comments = get_project_comments(job_id)
+    comments = await db.get_project_comments(job_id)
     comments = [dict(comment) if isinstance(comment, sqlite3.Row) else comment for comment in comments]
     
     # Проверяем, может ли пользователь комментировать
-    can_comment = can_user_comment_on_project(job_id, user["email"])
+    can_comment = await db.can_user_comment_on_project(job_id, user["email"])
     
     # Получаем участников проекта
-    participants = get_project_participants(job_id)
+    participants = await db.get_project_participants(job_id)
     
     # Форматируем дату для отображения
     job["deadline"] = format_date_for_display(job["deadline"])
@@ -909,7 +1014,7 @@ async def job_detail(request: Request, job_id: int, user: dict = Depends(require
 @app.post("/jobs/{job_id}/apply")
 async def apply_post(request: Request, job_id: int, user: dict = Depends(require_role("freelancer"))):
     # Получаем проект и проверяем его статус
-    job = get_job_by_id(job_id)
+    job = await db.get_job_by_id(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Проект не найден")
     
@@ -921,14 +1026,14 @@ async def apply_post(request: Request, job_id: int, user: dict = Depends(require
     if job["status"] != "open":
         raise HTTPException(status_code=400, detail="На этот проект нельзя откликнуться")
     
-    apply_to_job(job_id, user["email"])
+    await db.apply_to_job(job_id, user["email"])
     return RedirectResponse(url=f"/jobs/{job_id}", status_code=302)
 
 
 # Редактирование проекта
 @app.get("/jobs/{job_id}/edit")
 async def edit_job_get(request: Request, job_id: int, user: dict = Depends(require_login)):
-    job = get_job_by_id(job_id)
+    job = await db.get_job_by_id(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Проект не найден")
     
@@ -968,7 +1073,7 @@ async def edit_job_post(
     deadline: str = Form(...),
     priority: str = Form("medium")
 ):
-    job = get_job_by_id(job_id)
+    job = await db.get_job_by_id(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Проект не найден")
     
@@ -992,8 +1097,7 @@ async def edit_job_post(
         }, status_code=400)
     
     # Обновляем проект
-    from models import update_job
-    update_job(job_id, title, description, deadline, job["status"], priority)
+    await db.update_job(job_id, title, description, deadline, job["status"], priority)
     
     return RedirectResponse(url=f"/jobs/{job_id}", status_code=302)
 
@@ -1001,7 +1105,7 @@ async def edit_job_post(
 # Удаление проекта
 @app.get("/jobs/{job_id}/delete")
 async def delete_job_get(request: Request, job_id: int, user: dict = Depends(require_login)):
-    job = get_job_by_id(job_id)
+    job = await db.get_job_by_id(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Проект не найден")
     
@@ -1013,11 +1117,28 @@ async def delete_job_get(request: Request, job_id: int, user: dict = Depends(req
         raise HTTPException(status_code=403, detail="Нет доступа")
     
     # Удаляем проект
-    delete_job(job_id)
+    await db.delete_job(job_id)
     
     return RedirectResponse(url="/", status_code=302)
 
 
+@app.get("/jobs/{job_id}/candidates")
+async def job_candidates(job_id: int, limit: int = CANDIDATES_LIMIT, user: dict = Depends(require_login)):
+    """Фрилансеры, чьи профили ближе всего к проекту (для создателя проекта и администратора)"""
+    job = await db.get_job_by_id(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Проект не найден")
+    if job["creator_email"] != user["email"] and user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Нет доступа")
+    
+    limit = max(1, min(limit, CANDIDATES_LIMIT))
+    return {
+        "status": "success",
+        "job_id": job_id,
+        "candidates": await db.get_job_candidates(job_id, limit)
+    }
+
+
 # ===== ПРОФИЛЬ ПОЛЬЗОВАТЕЛЯ =====
 
 @app.get("/profile")
@@ -1042,7 +1163,7 @@ async def profile_post(
 ):
     # Проверяем, не занят ли новый email другим пользователем
     if email and email != user["email"]:
-        existing_user = get_user_by_email(email)
+        existing_user = await db.get_user_by_email(email)
         if existing_user:
             return templates.TemplateResponse("profile.html", {
                 "request": request, 
@@ -1066,7 +1187,9 @@ async def profile_post(
             if user.get("avatar") and user["avatar"].startswith("/uploads/"):
                 delete_file(user["avatar"])
             
-            avatar_path = save_uploaded_file(avatar, "avatars")
+            avatar_path = await save_uploaded_file(avatar)
+            # Копии для страниц строятся сразу, чтобы первый просмотр не ждал их
+            await run_upload_io(thumbnailer.generate, avatar_path.lstrip("/"))
         except HTTPException as e:
             return templates.TemplateResponse("profile.html", {
                 "request": request, 
@@ -1080,7 +1203,7 @@ async def profile_post(
         for file in portfolio_files:
             if file.filename:  # Проверяем, что файл был загружен
                 try:
-                    file_path = save_uploaded_file(file, "portfolio")
+                    file_path = await save_uploaded_file(file)
                     portfolio_file_paths.append(file_path)
                 except HTTPException as e:
                     return templates.TemplateResponse("profile.html", {
@@ -1115,7 +1238,7 @@ async def profile_post(
         portfolio_links_final = existing_links if existing_links else None
     
     # Обновляем профиль
-    update_user_profile(
+    await db.update_user_profile(
         user_id=user["id"],
         name=name if name else None,
         about_me=about_me if about_me else None,
@@ -1130,7 +1253,7 @@ async def profile_post(
     )
     
     # Получаем обновленные данные пользователя
-    updated_user = get_user_by_id(user["id"])
+    updated_user = await db.get_user_by_id(user["id"])
     if updated_user and isinstance(updated_user, sqlite3.Row):
         updated_user = dict(updated_user)
     
@@ -1155,10 +1278,10 @@ async def profile_post(
 @app.get("/applications")
 async def applications_get(request: Request, user: dict = Depends(require_login)):
     if user["role"] == "freelancer":
-        applications = get_applications_by_freelancer(user["email"])
+        applications = await db.get_applications_by_freelancer(user["email"])
         template = "applications_freelancer.html"
     else:
-        applications = get_applications_for_client(user["email"])
+        applications = await db.get_applications_for_client(user["email"])
         template = "applications_client.html"
     
     # Конвертируем все Row в dict
@@ -1173,7 +1296,7 @@ async def applications_get(request: Request, user: dict = Depends(require_login)
 
 @app.post("/applications/{application_id}/accept")
 async def accept_application(request: Request, application_id: int, user: dict = Depends(require_login)):
-    application = get_application_by_id(application_id)
+    application = await db.get_application_by_id(application_id)
     if not application:
         raise HTTPException(status_code=404, detail="Заявка не найдена")
     
@@ -1182,20 +1305,20 @@ async def accept_application(request: Request, application_id: int, user: dict =
         application = dict(application)
     
     # Проверяем, что пользователь - создатель проекта
-    job = get_job_by_id(application["job_id"])
+    job = await db.get_job_by_id(application["job_id"])
     if isinstance(job, sqlite3.Row):
         job = dict(job)
     
     if job["creator_email"] != user["email"]:
         raise HTTPException(status_code=403, detail="Нет доступа")
     
-    update_application_status(application_id, "accepted")
+    await db.update_application_status(application_id, "accepted")
     return RedirectResponse(url="/applications", status_code=302)
 
 
 @app.post("/applications/{application_id}/reject")
 async def reject_application(request: Request, application_id: int, user: dict = Depends(require_login)):
-    application = get_application_by_id(application_id)
+    application = await db.get_application_by_id(application_id)
     if not application:
         raise HTTPException(status_code=404, detail="Заявка не найдена")
     
@@ -1204,21 +1327,21 @@ async def reject_application(request: Request, application_id: int, user: dict =
         application = dict(application)
     
     # Проверяем, что пользователь - создатель проекта
-    job = get_job_by_id(application["job_id"])
+    job = await db.get_job_by_id(application["job_id"])
     if isinstance(job, sqlite3.Row):
         job = dict(job)
     
     if job["creator_email"] != user["email"]:
         raise HTTPException(status_code=403, detail="Нет доступа")
     
-    update_application_status(application_id, "rejected")
+    await db.update_application_status(application_id, "rejected")
     return RedirectResponse(url="/applications", status_code=302)
 
 
 # Завершение проекта
 @app.post("/jobs/{job_id}/complete")
 async def complete_job_post(request: Request, job_id: int, user: dict = Depends(require_role("freelancer"))):
-    job = get_job_by_id(job_id)
+    job = await db.get_job_by_id(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Проект не найден")
     
@@ -1226,11 +1349,11 @@ async def complete_job_post(request: Request, job_id: int, user: dict = Depends(
         job = dict(job)
     
     # Проверяем, что фрилансер принят на проект
-    application_status = get_user_application_status(job_id, user["email"])
+    application_status = await db.get_user_application_status(job_id, user["email"])
     if application_status != "accepted":
         raise HTTPException(status_code=403, detail="Нет доступа")
     
-    complete_job(job_id, user["email"])
+    await db.complete_job(job_id, user["email"])
     return RedirectResponse(url=f"/jobs/{job_id}", status_code=302)
 
 
@@ -1239,12 +1362,12 @@ async def complete_job_post(request: Request, job_id: int, user: dict = Depends(
 @app.get("/reviews")
 async def reviews_get(request: Request, user: dict = Depends(require_login)):
     if user["role"] == "freelancer":
-        reviews = get_reviews_for_freelancer(user["email"])
+        reviews = await db.get_reviews_for_freelancer(user["email"])
         reviews = [dict(review) if isinstance(review, sqlite3.Row) else review for review in reviews]
         template = "reviews_freelancer.html"
     else:
         # Для клиентов показываем проекты, которые можно оценить
-        jobs = get_jobs("done")
+        jobs = await db.get_jobs("done")
         jobs = [dict(job) if isinstance(job, sqlite3.Row) else job for job in jobs]
         # Фильтруем только свои завершенные проекты
         my_jobs = [job for job in jobs if job["creator_email"] == user["email"]]
@@ -1252,7 +1375,7 @@ async def reviews_get(request: Request, user: dict = Depends(require_login)):
         # Добавляем информацию о том, оставлен ли отзыв для каждого проекта
         for job in my_jobs:
             # Получаем принятого фрилансера для проекта
-            applications = get_applications(job["id"])
+            applications = await db.get_applications(job["id"])
             accepted_freelancer = None
             for app in applications:
                 if isinstance(app, sqlite3.Row):
@@ -1262,7 +1385,7 @@ async def reviews_get(request: Request, user: dict = Depends(require_login)):
                     break
             
             if accepted_freelancer:
-                job["has_review"] = has_reviewed_job(job["id"], user["email"], accepted_freelancer)
+                job["has_review"] = await db.has_reviewed_job(job["id"], user["email"], accepted_freelancer)
             else:
                 job["has_review"] = False
         
@@ -1278,7 +1401,7 @@ async def reviews_get(request: Request, user: dict = Depends(require_login)):
 
 @app.get("/jobs/{job_id}/review")
 async def review_form_get(request: Request, job_id: int, user: dict = Depends(require_login)):
-    job = get_job_by_id(job_id)
+    job = await db.get_job_by_id(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Проект не найден")
     
@@ -1290,7 +1413,7 @@ async def review_form_get(request: Request, job_id: int, user: dict = Depends(re
         raise HTTPException(status_code=403, detail="Нет доступа")
     
     # Получаем принятого фрилансера (может быть accepted или completed)
-    applications = get_applications(job_id)
+    applications = await db.get_applications(job_id)
     accepted_freelancer = None
     for app in applications:
         if isinstance(app, sqlite3.Row):
@@ -1303,7 +1426,7 @@ async def review_form_get(request: Request, job_id: int, user: dict = Depends(re
         raise HTTPException(status_code=400, detail="Нет принятого фрилансера")
     
     # Проверяем, не оставил ли уже отзыв
-    if has_reviewed_job(job_id, user["email"], accepted_freelancer):
+    if await db.has_reviewed_job(job_id, user["email"], accepted_freelancer):
         return templates.TemplateResponse("review_form.html", {
             "request": request,
             "user": user,
@@ -1329,7 +1452,7 @@ async def review_form_post(
     rating: int = Form(...),
     comment: str = Form("")
 ):
-    job = get_job_by_id(job_id)
+    job = await db.get_job_by_id(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Проект не найден")
     
@@ -1341,7 +1464,7 @@ async def review_form_post(
         raise HTTPException(status_code=403, detail="Нет доступа")
     
     # Получаем принятого фрилансера (может быть accepted или completed)
-    applications = get_applications(job_id)
+    applications = await db.get_applications(job_id)
     accepted_freelancer = None
     for app in applications:
         if isinstance(app, sqlite3.Row):
@@ -1357,7 +1480,7 @@ async def review_form_post(
     if rating < 1 or rating > 5:
         raise HTTPException(status_code=400, detail="Рейтинг должен быть от 1 до 5")
     
-    create_review(job_id, accepted_freelancer, user["email"], rating, comment)
+    await db.create_review(job_id, accepted_freelancer, user["email"], rating, comment)
     
     # Статистика уже обновляется автоматически в функции create_review
     print(f"Review created and stats updated for freelancer: {accepted_freelancer}")
@@ -1371,17 +1494,52 @@ async def review_form_post(
 async def test_endpoint():
     return {"message": "Server is working", "status": "ok"}
 
-@app.get("/admin/update-stats")
-async def update_all_stats():
-    """Обновляет статистику всех фрилансеров (админская функция)"""
-    from models import update_all_freelancer_stats
-    update_all_freelancer_stats()
-    return {"message": "Статистика всех фрилансеров обновлена", "status": "ok"}
+@app.get("/admin/update-stats", status_code=202)
+async def update_all_stats(user: dict = Depends(require_admin())):
+    """Запускает пересчет статистики всех фрилансеров в фоне"""
+    task = task_registry.start("update_freelancer_stats", update_all_freelancer_stats)
+    return {"message": "Пересчет статистики фрилансеров запущен", "status": "ok", "task": task.to_dict()}
+
+
+@app.post("/admin/upload-gc", status_code=202)
+async def admin_upload_gc(dry_run: bool = True, user: dict = Depends(require_admin())):
+    """Запускает очистку загрузок без ссылок в фоне; по умолчанию только отчет (dry_run)"""
+    task = upload_collector.start(dry_run=dry_run)
+    return {"message": "Очистка загрузок запущена", "status": "ok", "task": task.to_dict()}
+
+
+@app.get("/admin/tasks")
+async def admin_tasks(user: dict = Depends(require_admin())):
+    """Список фоновых задач, новые первыми"""
+    return {"status": "ok", "tasks": [task.to_dict() for task in task_registry.list()]}
+
 
-# Удален тестовый WebSocket endpoint - больше не нужен
+@app.get("/admin/tasks/{task_id}")
+async def admin_task_status(task_id: str, user: dict = Depends(require_admin())):
+    """Состояние, прогресс и длительность фоновой задачи"""
+    task = task_registry.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return {"status": "ok", "task": task.to_dict()}
 
 # ===== API ДЛЯ ЧАТА =====
 
+def has_unread_incoming(messages: list, user_email: str) -> bool:
+    """Есть ли среди сообщений непрочитанные, адресованные пользователю"""
+    return any(msg["receiver_email"] == user_email and not msg["is_read"] for msg in messages)
+
+
+async def get_message_page(user_email: str, other_user_email: str, job_id: int = None, before_id: int = None):
+    """Возвращает страницу сообщений диалога старше before_id и признак наличия более ранних"""
+    # Запрашиваем на одно сообщение больше, чтобы узнать, есть ли более ранние
+    messages = await db.get_message_history(
+        user_email, other_user_email, job_id, before_id=before_id, limit=MESSAGES_PER_PAGE + 1
+    )
+    messages = [dict(msg) if isinstance(msg, sqlite3.Row) else msg for msg in messages]
+    has_older_messages = len(messages) > MESSAGES_PER_PAGE
+    return messages[-MESSAGES_PER_PAGE:], has_older_messages
+
+
 @app.post("/api/messages/send")
 async def send_message_api(
     request: Request,
@@ -1397,18 +1555,20 @@ async def send_message_api(
             return {"status": "error", "message": "Нельзя отправить сообщение самому себе"}
         
         # Проверяем, что получатель существует
-        receiver = get_user_by_email(receiver_email)
+        receiver = await db.get_user_by_email(receiver_email)
         if not receiver:
             return {"status": "error", "message": "Получатель не найден"}
         
         # Сохраняем сообщение в базу данных
         try:
-            create_message(
+            created = await db.create_message(
                 sender_email=user["email"],
                 receiver_email=receiver_email,
                 message=message,
                 job_id=job_id
             )
+            # Доставляем сообщение открытым вкладкам диалога без опроса
+            chat_hub.publish(created)
             return {"status": "success", "message": "Сообщение отправлено"}
         except ValueError as e:
             return {"status": "error", "message": str(e)}
@@ -1434,36 +1594,83 @@ async def get_messages_api(
         last_message_id = request.query_params.get("last_message_id", "0")
         last_message_id = int(last_message_id)
         
-        # Получаем сообщения между пользователями
-        messages = get_messages_between_users(user["email"], other_user_email, job_id)
-        messages = [dict(msg) if isinstance(msg, sqlite3.Row) else msg for msg in messages]
-        
-        # Фильтруем только новые сообщения (с ID больше last_message_id)
-        new_messages = [msg for msg in messages if msg["id"] > last_message_id]
+        # Получаем только новые сообщения (с ID больше last_message_id) - фильтр выполняется в SQL
+        new_messages = await db.get_messages_between_users(
+            user["email"], other_user_email, job_id,
+            after_id=last_message_id, limit=MESSAGES_POLL_LIMIT
+        )
+        new_messages = [dict(msg) if isinstance(msg, sqlite3.Row) else msg for msg in new_messages]
         
-        # Отмечаем сообщения как прочитанные
-        if new_messages:
-            mark_messages_as_read(user["email"], other_user_email, job_id)
+        # Отмечаем сообщения как прочитанные, только если среди новых есть непрочитанные входящие
+        if has_unread_incoming(new_messages, user["email"]):
+            await db.mark_messages_as_read(user["email"], other_user_email, job_id)
         
         return {
             "status": "success",
             "messages": new_messages,
-            "last_message_id": max([msg["id"] for msg in messages]) if messages else 0
+            "last_message_id": new_messages[-1]["id"] if new_messages else last_message_id
         }
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 
+@app.websocket("/ws/chat/{other_user_email}")
+async def chat_websocket(websocket: WebSocket, other_user_email: str, job_id: int = None):
+    """WebSocket с новыми сообщениями диалога; заменяет опрос /api/messages/..."""
+    user = await get_current_user(websocket)
+    if not user:
+        await websocket.close(code=1008)
+        return
+    
+    await websocket.accept()
+    subscription = chat_hub.subscribe(user["email"], other_user_email, job_id)
+    
+    async def forward_messages():
+        while True:
+            message = await subscription.queue.get()
+            if subscription.overflowed:
+                # Часть сообщений потеряна - клиент переподключится и догрузит их запросом
+                await websocket.close(code=1013)
+                return
+            if message["receiver_email"] == user["email"]:
+                await db.mark_messages_as_read(user["email"], other_user_email, job_id)
+            await websocket.send_json(message)
+    
+    forward_task = asyncio.create_task(forward_messages())
+    try:
+        # Клиент ничего не отправляет; ждем отключения
+        while True:
+            await websocket.receive_text()
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        forward_task.cancel()
+        chat_hub.unsubscribe(subscription)
+
+
+@app.get("/api/messages/{other_user_email}/history")
+async def get_message_history_api(
+    other_user_email: str,
+    before_id: int,
+    user: dict = Depends(require_login),
+    job_id: int = None
+):
+    """API для подгрузки более ранних сообщений при прокрутке чата вверх"""
+    messages, has_older_messages = await get_message_page(user["email"], other_user_email, job_id, before_id)
+    return {
+        "status": "success",
+        "messages": messages,
+        "has_more": has_older_messages
+    }
+
+
 # ===== СТРАНИЦЫ ЧАТА И СООБЩЕНИЙ =====
 
 @app.get("/messages")
 async def messages_get(request: Request, user: dict = Depends(require_login)):
-    conversations = get_user_conversations(user["email"])
+    conversations = await db.get_user_conversations(user["email"])
     conversations = [dict(conv) if isinstance(conv, sqlite3.Row) else conv for conv in conversations]
     
-    # Обновляем счетчик непрочитанных сообщений
-    user["unread_messages_count"] = get_unread_messages_count(user["email"])
-    
     return templates.TemplateResponse("messages.html", {
         "request": request,
         "user": user,
@@ -1474,26 +1681,25 @@ async def messages_get(request: Request, user: dict = Depends(require_login)):
 # Чат с конкретным пользователем
 @app.get("/chat/{other_user_email}")
 async def chat_get(request: Request, other_user_email: str, user: dict = Depends(require_login), job_id: int = None):
-    # Получаем сообщения между пользователями
-    messages = get_messages_between_users(user["email"], other_user_email, job_id)
-    messages = [dict(msg) if isinstance(msg, sqlite3.Row) else msg for msg in messages]
+    # Получаем последнюю страницу сообщений, более ранние подгружаются через /history
+    messages, has_older_messages = await get_message_page(user["email"], other_user_email, job_id)
     
     # Получаем информацию о собеседнике
-    other_user = get_user_by_email(other_user_email)
+    other_user = await db.get_user_by_email(other_user_email)
     if other_user and isinstance(other_user, sqlite3.Row):
         other_user = dict(other_user)
     
-    # Отмечаем сообщения как прочитанные
-    mark_messages_as_read(user["email"], other_user_email, job_id)
-    
-    # Обновляем счетчик непрочитанных сообщений
-    user["unread_messages_count"] = get_unread_messages_count(user["email"])
+    # Отмечаем сообщения как прочитанные и обновляем счетчик, если есть непрочитанные входящие
+    if has_unread_incoming(messages, user["email"]):
+        await db.mark_messages_as_read(user["email"], other_user_email, job_id)
+        user["unread_messages_count"] = await db.get_unread_messages_count(user["email"])
     
     return templates.TemplateResponse("chat.html", {
         "request": request,
         "user": user,
         "other_user": other_user,
         "messages": messages,
+        "has_older_messages": has_older_messages,
         "job_id": job_id
     })
 
@@ -1501,7 +1707,7 @@ async def chat_get(request: Request, other_user_email: str, user: dict = Depends
 # Проектный чат
 @app.get("/jobs/{job_id}/chat")
 async def project_chat_get(request: Request, job_id: int, user: dict = Depends(require_login)):
-    job = get_job_by_id(job_id)
+    job = await db.get_job_by_id(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Проект не найден")
     
@@ -1511,7 +1717,7 @@ async def project_chat_get(request: Request, job_id: int, user: dict = Depends(r
     # Определяем собеседника
     if user["email"] == job["creator_email"]:
         # Если пользователь - создатель проекта, находим принятого фрилансера
-        applications = get_applications(job_id)
+        applications = await db.get_applications(job_id)
         other_user_email = None
         for app in applications:
             if isinstance(app, sqlite3.Row):
@@ -1526,51 +1732,77 @@ async def project_chat_get(request: Request, job_id: int, user: dict = Depends(r
     if not other_user_email:
         raise HTTPException(status_code=400, detail="Нет собеседника для чата")
     
-    # Получаем сообщения
-    messages = get_messages_between_users(user["email"], other_user_email, job_id)
-    messages = [dict(msg) if isinstance(msg, sqlite3.Row) else msg for msg in messages]
+    # Получаем последнюю страницу сообщений
+    messages, has_older_messages = await get_message_page(user["email"], other_user_email, job_id)
     
     # Получаем информацию о собеседнике
-    other_user = get_user_by_email(other_user_email)
+    other_user = await db.get_user_by_email(other_user_email)
     if other_user and isinstance(other_user, sqlite3.Row):
         other_user = dict(other_user)
     
-    # Отмечаем сообщения как прочитанные
-    mark_messages_as_read(user["email"], other_user_email, job_id)
-    
-    # Обновляем счетчик непрочитанных сообщений
-    user["unread_messages_count"] = get_unread_messages_count(user["email"])
+    # Отмечаем сообщения как прочитанные и обновляем счетчик, если есть непрочитанные входящие
+    if has_unread_incoming(messages, user["email"]):
+        await db.mark_messages_as_read(user["email"], other_user_email, job_id)
+        user["unread_messages_count"] = await db.get_unread_messages_count(user["email"])
     
     return templates.TemplateResponse("project_chat.html", {
         "request": request,
         "user": user,
         "other_user": other_user,
         "job": job,
-        "messages": messages
+        "messages": messages,
+        "has_older_messages": has_older_messages
     })
 
 
 # ===== ПРОФИЛИ ПОЛЬЗОВАТЕЛЕЙ =====
 
+def parse_profiles_cursor(cursor: str):
+    """Разбирает курсор каталога "rating:completed_projects:id" """
+    try:
+        rating, completed_projects, user_id = cursor.split(":")
+        return float(rating), int(completed_projects), int(user_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор каталога")
+
+
 @app.get("/profiles")
 async def profiles_get(request: Request, user: dict = Depends(require_login), 
-                      role: str = None, min_rating: str = None):
-    # Получаем пользователей с фильтрацией
-    users = get_all_users_with_filters(role, min_rating)
+                      role: str = None, min_rating: str = None, skills: str = None, after: str = None):
+    # Некорректный минимальный рейтинг игнорируется, как и раньше
+    try:
+        rating_value = float(min_rating) if min_rating and min_rating.strip() else None
+    except ValueError:
+        rating_value = None
+    skill_names = list(parse_skills(skills).values())
+    cursor = parse_profiles_cursor(after) if after else None
+    
+    # Запрашиваем на одного пользователя больше, чтобы узнать, есть ли следующая страница
+    users = await db.search_users(role, rating_value, skill_names, after=cursor, limit=ITEMS_PER_PAGE + 1)
     users = [dict(u) if isinstance(u, sqlite3.Row) else u for u in users]
+    next_cursor = None
+    if len(users) > ITEMS_PER_PAGE:
+        users = users[:ITEMS_PER_PAGE]
+        last = users[-1]
+        next_cursor = f"{last['rating']!r}:{last['completed_projects']}:{last['id']}"
     
     return templates.TemplateResponse("profiles.html", {
         "request": request,
         "user": user,
         "users": users,
+        "total_users_count": await db.count_users(role, rating_value, skill_names),
+        "popular_skills": await db.get_popular_skills(),
+        "next_cursor": next_cursor,
+        "is_first_page": after is None,
         "selected_role": role,
-        "selected_min_rating": min_rating
+        "selected_min_rating": rating_value,
+        "selected_skills": ", ".join(skill_names)
     })
 
 
 @app.get("/profile/{user_email}")
 async def user_profile_get(request: Request, user_email: str, user: dict = Depends(require_login)):
-    profile_user = get_user_profile_by_email(user_email)
+    profile_user = await db.get_user_profile_by_email(user_email)
     if not profile_user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
@@ -1593,7 +1825,7 @@ async def user_profile_get(request: Request, user_email: str, user: dict = Depen
     # Получаем отзывы для фрилансера
     reviews = []
     if profile_user["role"] == "freelancer":
-        reviews = get_reviews_for_freelancer(user_email)
+        reviews = await db.get_reviews_for_freelancer(user_email)
         reviews = [dict(r) if isinstance(r, sqlite3.Row) else r for r in reviews]
     
     return templates.TemplateResponse("user_profile.html", {
@@ -1614,13 +1846,13 @@ async def add_project_comment(
     comment: str = Form(...)
 ):
     # Проверяем, может ли пользователь комментировать проект
-    if not can_user_comment_on_project(job_id, user["email"]):
+    if not await db.can_user_comment_on_project(job_id, user["email"]):
         raise HTTPException(status_code=403, detail="Нет доступа к комментированию")
     
     if not comment.strip():
         raise HTTPException(status_code=400, detail="Комментарий не может быть пустым")
     
-    create_project_comment(job_id, user["email"], comment.strip())
+    await db.create_project_comment(job_id, user["email"], comment.strip())
     return RedirectResponse(url=f"/jobs/{job_id}", status_code=302)
 
 
@@ -1645,10 +1877,10 @@ async def remove_portfolio_file(request: Request, user: dict = Depends(require_l
     # Удаляем файл из списка
     updated_files = [f for f in current_files if f != file_path]
     
-    # Обновляем профиль
-    update_user_profile(
+    # Обновляем профиль; пустой список тоже сохраняется, иначе последний файл не удалить
+    await db.update_user_profile(
         user_id=user["id"],
-        portfolio_files=json.dumps(updated_files) if updated_files else None
+        portfolio_files=json.dumps(updated_files)
     )
     
     # Обновляем данные пользователя в сессии
@@ -1676,7 +1908,7 @@ async def remove_portfolio_link(request: Request, user: dict = Depends(require_l
         updated_links_str = None
     
     # Обновляем профиль
-    update_user_profile(
+    await db.update_user_profile(
         user_id=user["id"],
         portfolio_links=updated_links_str
     )
@@ -1690,12 +1922,12 @@ async def remove_portfolio_link(request: Request, user: dict = Depends(require_l
 # ===== АДМИНИСТРАТИВНЫЕ МАРШРУТЫ =====
 
 @app.get("/admin")
-async def admin_panel(request: Request, user: dict = Depends(require_admin)):
+async def admin_panel(request: Request, user: dict = Depends(require_admin())):
     """Панель администратора"""
     # Получаем статистику системы
-    all_jobs = get_jobs()
-    all_users = get_all_users_with_filters()
-    all_comments = get_all_project_comments()
+    all_jobs = await db.get_jobs()
+    all_users = await db.get_all_users_with_filters()
+    all_comments = await db.get_all_project_comments()
     
     # Конвертируем в dict
     all_jobs = [dict(job) if isinstance(job, sqlite3.Row) else job for job in all_jobs]
@@ -1712,29 +1944,29 @@ async def admin_panel(request: Request, user: dict = Depends(require_admin)):
 
 
 @app.post("/admin/comments/{comment_id}/delete")
-async def admin_delete_comment(request: Request, comment_id: int, user: dict = Depends(require_admin)):
+async def admin_delete_comment(request: Request, comment_id: int, user: dict = Depends(require_admin())):
     """Удаление комментария администратором"""
     try:
-        delete_project_comment(comment_id)
+        await db.delete_project_comment(comment_id)
         return {"status": "success", "message": "Комментарий удален"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 
 @app.post("/admin/jobs/{job_id}/delete")
-async def admin_delete_job(request: Request, job_id: int, user: dict = Depends(require_admin)):
+async def admin_delete_job(request: Request, job_id: int, user: dict = Depends(require_admin())):
     """Удаление проекта администратором"""
     try:
-        delete_job(job_id)
+        await db.delete_job(job_id)
         return {"status": "success", "message": "Проект удален"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 
 @app.get("/admin/comments")
-async def admin_comments(request: Request, user: dict = Depends(require_admin)):
+async def admin_comments(request: Request, user: dict = Depends(require_admin())):
     """Страница управления комментариями"""
-    comments = get_all_project_comments()
+    comments = await db.get_all_project_comments()
     comments = [dict(c) if isinstance(c, sqlite3.Row) else c for c in comments]
     
     return templates.TemplateResponse("admin_comments.html", {
@@ -1745,18 +1977,45 @@ async def admin_comments(request: Request, user: dict = Depends(require_admin)):
 
 
 @app.get("/admin/jobs")
-async def admin_jobs(request: Request, user: dict = Depends(require_admin)):
+async def admin_jobs(request: Request, user: dict = Depends(require_admin()), before: int = None):
     """Страница управления проектами"""
-    jobs = get_jobs()
+    jobs = await db.get_jobs(before_id=before, limit=ITEMS_PER_PAGE + 1)
     jobs = [dict(job) if isinstance(job, sqlite3.Row) else job for job in jobs]
     
+    # Курсор следующей страницы - id последнего показанного проекта
+    next_cursor = jobs[ITEMS_PER_PAGE - 1]["id"] if len(jobs) > ITEMS_PER_PAGE else None
+    jobs = jobs[:ITEMS_PER_PAGE]
+    
     return templates.TemplateResponse("admin_jobs.html", {
         "request": request,
         "user": user,
-        "jobs": jobs
+        "jobs": jobs,
+        "total_jobs_count": await db.count_jobs(),
+        "next_cursor": next_cursor,
+        "is_first_page": before is None
     })
 
 
+@app.post("/admin/reconcile-unread")
+async def admin_reconcile_unread(user: dict = Depends(require_admin())):
+    """Пересчитывает счетчики непрочитанных сообщений и исправляет расхождения"""
+    repaired = await db.reconcile_unread_counters()
+    return {"status": "ok", "repaired": repaired}
+
+
+@app.get("/admin/verify-stats")
+async def admin_verify_stats(user: dict = Depends(require_admin())):
+    """Сравнивает накопленную статистику фрилансеров с полным пересчетом"""
+    mismatches = await db.verify_freelancer_aggregates()
+    return {"status": "ok" if not mismatches else "mismatch", "mismatches": mismatches}
+
+
+@app.get("/admin/cache-stats")
+async def admin_cache_stats(user: dict = Depends(require_admin())):
+    """Счетчики попаданий и промахов кэша пользователей"""
+    return {"status": "ok", "user_cache": user_cache.stats()}
+
+
 # ===== ОБРАБОТЧИКИ ОШИБОК =====
 
 @app.exception_handler(404)
@@ -1,34 +1,72 @@
 # Импорты для работы с базой данных и аутентификацией
-from database import get_connection
+from database import db_connection
+from cache import TTLCache
+from skills import sync_user_skills, parse_skills
+from recommendations import recommender
+from uploads import sync_upload_refs
 from passlib.hash import bcrypt
 import sqlite3
+import json
+import re
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 import os
 
 
+# ===== КЭШ ПОЛЬЗОВАТЕЛЕЙ =====
+
+# Записи Users по ключам ("email", email) и ("id", id). Значения - sqlite3.Row (неизменяемые)
+# или None для отсутствующих пользователей. Каждая запись в Users сбрасывает кэш через
+# invalidate_user_cache() после фиксации транзакции
+user_cache = TTLCache(
+	maxsize=int(os.getenv("USER_CACHE_SIZE", "1024")),
+	ttl=float(os.getenv("USER_CACHE_TTL", "30")),
+)
+
+def invalidate_user_cache(email: str = None, user_id: int = None):
+	"""Удаляет из кэша все записи пользователя, найденные по email или id"""
+	keys = {("email", email), ("id", user_id)}
+	user_cache.invalidate_if(
+		lambda key, user: key in keys or (user is not None and (user["email"] == email or user["id"] == user_id))
+	)
+
+
 # ===== БАЗОВЫЕ ФУНКЦИИ ДЛЯ РАБОТЫ С ПОЛЬЗОВАТЕЛЯМИ =====
 
 def get_user(email, password):
 	"""Получает пользователя по email и паролю (устаревшая функция)"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("SELECT * FROM Users WHERE email=? AND password=?", (email, password))
-	user = cursor.fetchone()
-	conn.close()
-	return user
-
-def get_jobs(status=None):
-	"""Получает список проектов с возможностью фильтрации по статусу"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	if status:
-		cursor.execute("SELECT * FROM Jobs WHERE status = ?", (status,))
-	else:
-		cursor.execute("SELECT * FROM Jobs")
-	jobs = cursor.fetchall()
-	conn.close()
-	return jobs
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("SELECT * FROM Users WHERE email=? AND password=?", (email, password))
+		user = cursor.fetchone()
+		return user
+
+# Слова поискового запроса (буквы и цифры любого алфавита) и их предельное количество
+SEARCH_TERM_RE = re.compile(r"[^\W_]+")
+SEARCH_MAX_TERMS = 8
+# Размер окна поиска: сколько самых новых видимых совпадений ранжируется по BM25 за раз
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "500"))
+
+def get_jobs(status=None, before_id: int = None, limit: int = None):
+	"""Получает список проектов (новые первыми) с фильтром по статусу и keyset-пагинацией"""
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		query = "SELECT * FROM Jobs WHERE 1=1"
+		params = []
+		if status:
+			query += " AND status = ?"
+			params.append(status)
+		# Курсор по id вместо OFFSET: любая страница читается одинаково быстро
+		if before_id is not None:
+			query += " AND id < ?"
+			params.append(before_id)
+		query += " ORDER BY id DESC"
+		if limit is not None:
+			query += " LIMIT ?"
+			params.append(limit)
+		cursor.execute(query, params)
+		jobs = cursor.fetchall()
+		return jobs
 
 
 
@@ -76,150 +114,412 @@ def verify_token(token: str):
 # ===== ФУНКЦИИ ДЛЯ РАБОТЫ С ПОЛЬЗОВАТЕЛЯМИ =====
 
 def get_user_by_email(email):
-	"""Получает пользователя по email"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("SELECT * FROM Users WHERE email= ?", (email,))
-	user = cursor.fetchone()
-	conn.close()
-	return user
+	"""Получает пользователя по email (через кэш пользователей)"""
+	return user_cache.get_or_load(("email", email), lambda: _select_user("email", email))
+
+def _select_user(column: str, value):
+	"""Читает запись Users по email или id в обход кэша"""
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute(f"SELECT * FROM Users WHERE {column} = ?", (value,))
+		user = cursor.fetchone()
+		return user
 
 def create_user(email: str, hashed_password: str, role: str, name: str | None = None, avatar: str | None = None):
 	"""Создает нового пользователя в базе данных"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute(
-		"INSERT INTO Users (email, password, role, name, avatar) VALUES (?, ?, ?, ?, ?)",
-		(email, hashed_password, role, name, avatar),
-	)
-	conn.commit()
-	conn.close()
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute(
+			"INSERT INTO Users (email, password, role, name, avatar) VALUES (?, ?, ?, ?, ?)",
+			(email, hashed_password, role, name, avatar),
+		)
+		conn.commit()
+	invalidate_user_cache(email=email)
 
 
 def update_user_profile(user_id: int, name: str = None, about_me: str = None, activity: str = None, 
                        skills: str = None, phone: str = None, telegram: str = None, avatar: str = None, 
                        email: str = None, portfolio_files: str = None, portfolio_links: str = None):
 	"""Обновляет профиль пользователя (только переданные поля)"""
-	conn = get_connection()
-	cursor = conn.cursor()
+	with db_connection() as conn:
+		cursor = conn.cursor()
 	
-	# Строим динамический запрос только для переданных полей
-	updates = []
-	params = []
+		# Строим динамический запрос только для переданных полей
+		updates = []
+		params = []
 	
-	if name is not None:
-		updates.append("name = ?")
-		params.append(name)
-	if about_me is not None:
-		updates.append("about_me = ?")
-		params.append(about_me)
-	if activity is not None:
-		updates.append("activity = ?")
-		params.append(activity)
-	if skills is not None:
-		updates.append("skills = ?")
-		params.append(skills)
-	if phone is not None:
-		updates.append("phone = ?")
-		params.append(phone)
-	if telegram is not None:
-		updates.append("telegram = ?")
-		params.append(telegram)
-	if avatar is not None:
-		updates.append("avatar = ?")
-		params.append(avatar)
-	if email is not None:
-		updates.append("email = ?")
-		params.append(email)
-	if portfolio_files is not None:
-		updates.append("portfolio_files = ?")
-		params.append(portfolio_files)
-	if portfolio_links is not None:
-		updates.append("portfolio_links = ?")
-		params.append(portfolio_links)
-	
-	if updates:
-		params.append(user_id)
-		query = f"UPDATE Users SET {', '.join(updates)} WHERE id = ?"
-		cursor.execute(query, params)
-		conn.commit()
+		if name is not None:
+			updates.append("name = ?")
+			params.append(name)
+		if about_me is not None:
+			updates.append("about_me = ?")
+			params.append(about_me)
+		if activity is not None:
+			updates.append("activity = ?")
+			params.append(activity)
+		if skills is not None:
+			updates.append("skills = ?")
+			params.append(skills)
+		if phone is not None:
+			updates.append("phone = ?")
+			params.append(phone)
+		if telegram is not None:
+			updates.append("telegram = ?")
+			params.append(telegram)
+		if avatar is not None:
+			updates.append("avatar = ?")
+			params.append(avatar)
+		if email is not None:
+			updates.append("email = ?")
+			params.append(email)
+		if portfolio_files is not None:
+			updates.append("portfolio_files = ?")
+			params.append(portfolio_files)
+		if portfolio_links is not None:
+			updates.append("portfolio_links = ?")
+			params.append(portfolio_links)
+	
+		if updates:
+			params.append(user_id)
+			query = f"UPDATE Users SET {', '.join(updates)} WHERE id = ?"
+			cursor.execute(query, params)
+			# Индекс навыков и ссылки на загруженные файлы обновляются в той же транзакции, что и профиль
+			if skills is not None:
+				sync_user_skills(cursor, user_id, skills)
+			if avatar is not None:
+				sync_upload_refs(cursor, "avatar", user_id, [avatar])
+			if portfolio_files is not None:
+				sync_upload_refs(cursor, "portfolio", user_id, json.loads(portfolio_files))
+			conn.commit()
+			# Сбрасываем записи по id и старому email, а также по новому email, если он менялся
+			invalidate_user_cache(email=email, user_id=user_id)
+			if skills is not None or about_me is not None or activity is not None:
+				recommender.mark_user(user_id)
 	
-	conn.close()
 
 
 def get_user_by_id(user_id: int):
-	"""Получает пользователя по ID"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("SELECT * FROM Users WHERE id = ?", (user_id,))
-	user = cursor.fetchone()
-	conn.close()
-	return user
+	"""Получает пользователя по ID (через кэш пользователей)"""
+	return user_cache.get_or_load(("id", user_id), lambda: _select_user("id", user_id))
 
 # ===== ФУНКЦИИ ДЛЯ РАБОТЫ С ПРОЕКТАМИ =====
 
 def create_job(title, description, deadline, creator_email, status="open", priority: str = "medium", files: list = None):
 	"""Создает новый проект в базе данных"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	
-	# Конвертируем список файлов в JSON строку
-	files_json = None
-	if files:
-		import json
-		files_json = json.dumps(files)
-	
-	cursor.execute(
-		"INSERT INTO Jobs (title, description, deadline, status, creator_email, priority, files) VALUES (?, ?, ?, ?, ?, ?, ?)",
-		(title, description, deadline, status, creator_email, priority, files_json)
-	)
-	conn.commit()
-	conn.close()
+	with db_connection() as conn:
+		cursor = conn.cursor()
+	
+		# Конвертируем список файлов в JSON строку
+		files_json = None
+		if files:
+			files_json = json.dumps(files)
+	
+		cursor.execute(
+			"INSERT INTO Jobs (title, description, deadline, status, creator_email, priority, files) VALUES (?, ?, ?, ?, ?, ?, ?)",
+			(title, description, deadline, status, creator_email, priority, files_json)
+		)
+		sync_upload_refs(cursor, "job", cursor.lastrowid, files)
+		conn.commit()
+	recommender.mark_job(cursor.lastrowid)
 
 
 def update_job(job_id, title, description, deadline, status, priority: str = None):
 	"""Обновляет данные проекта"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	if priority is None:
-		cursor.execute(
-			"UPDATE Jobs SET title=?, description=?, deadline=?, status=? WHERE id=?",
-			(title, description, deadline, status, job_id)
-		)
-	else:
-		cursor.execute(
-			"UPDATE Jobs SET title=?, description=?, deadline=?, status=?, priority=? WHERE id=?",
-			(title, description, deadline, status, priority, job_id)
-		)
-	conn.commit()
-	conn.close()
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("SELECT status FROM Jobs WHERE id=?", (job_id,))
+		row = cursor.fetchone()
+		# Проект завершен или перестал быть завершенным - его фрилансеры получают или теряют
+		# завершенный проект, как в complete_job и delete_job
+		affected = []
+		if row is not None and (row['status'] == 'done') != (status == 'done'):
+			cursor.execute(
+				"SELECT freelancer_email FROM Applications WHERE job_id = ? AND status = 'completed'",
+				(job_id,)
+			)
+			affected = [app['freelancer_email'] for app in cursor.fetchall()]
+			delta = 1 if status == 'done' else -1
+			cursor.executemany(
+				"UPDATE Users SET completed_projects = MAX(IFNULL(completed_projects, 0) + ?, 0) WHERE email = ?",
+				[(delta, email) for email in affected]
+			)
+		if priority is None:
+			cursor.execute(
+				"UPDATE Jobs SET title=?, description=?, deadline=?, status=? WHERE id=?",
+				(title, description, deadline, status, job_id)
+			)
+		else:
+			cursor.execute(
+				"UPDATE Jobs SET title=?, description=?, deadline=?, status=?, priority=? WHERE id=?",
+				(title, description, deadline, status, priority, job_id)
+			)
+		conn.commit()
+	for email in affected:
+		invalidate_user_cache(email=email)
+	recommender.mark_job(job_id)
 
 def delete_job(job_id):
 	"""Удаляет проект из базы данных и все связанные данные"""
-	conn = get_connection()
-	cursor = conn.cursor()
+	with db_connection() as conn:
+		cursor = conn.cursor()
+	
+		# Вычитаем отзывы и завершение проекта из накопленной статистики фрилансеров
+		cursor.execute("""
+			SELECT freelancer_email FROM Reviews WHERE job_id = ?
+			UNION
+			SELECT a.freelancer_email FROM Applications a
+			INNER JOIN Jobs j ON j.id = a.job_id
+			WHERE a.job_id = ? AND a.status = 'completed' AND j.status = 'done'
+		""", (job_id, job_id))
+		affected = [row['freelancer_email'] for row in cursor.fetchall()]
+		cursor.execute("""
+			UPDATE Users SET
+				rating_sum = rating_sum - r.total,
+				rating_count = rating_count - r.cnt,
+				rating = CASE WHEN rating_count > r.cnt
+					THEN ROUND(CAST(rating_sum - r.total AS REAL) / (rating_count - r.cnt), 1) ELSE 0.0 END
+			FROM (
+				SELECT freelancer_email, SUM(rating) AS total, COUNT(*) AS cnt
+				FROM Reviews WHERE job_id = ?
+				GROUP BY freelancer_email
+			) AS r
+			WHERE Users.email = r.freelancer_email
+		""", (job_id,))
+		cursor.execute("""
+			UPDATE Users SET completed_projects = completed_projects - 1
+			WHERE email IN (
+				SELECT a.freelancer_email FROM Applications a
+				INNER JOIN Jobs j ON j.id = a.job_id
+				WHERE a.job_id = ? AND a.status = 'completed' AND j.status = 'done'
+			) AND completed_projects > 0
+		""", (job_id,))
 	
-	# Удаляем все связанные данные
-	cursor.execute("DELETE FROM ProjectComments WHERE job_id=?", (job_id,))
-	cursor.execute("DELETE FROM Reviews WHERE job_id=?", (job_id,))
-	cursor.execute("DELETE FROM Applications WHERE job_id=?", (job_id,))
-	cursor.execute("DELETE FROM Messages WHERE job_id=?", (job_id,))
+		# Удаляем все связанные данные
+		cursor.execute("DELETE FROM ProjectComments WHERE job_id=?", (job_id,))
+		cursor.execute("DELETE FROM Reviews WHERE job_id=?", (job_id,))
+		cursor.execute("DELETE FROM Applications WHERE job_id=?", (job_id,))
+		cursor.execute("DELETE FROM Messages WHERE job_id=?", (job_id,))
+		sync_upload_refs(cursor, "job", job_id, [])
 	
-	# Удаляем сам проект
-	cursor.execute("DELETE FROM Jobs WHERE id=?", (job_id,))
+		# Удаляем сам проект
+		cursor.execute("DELETE FROM Jobs WHERE id=?", (job_id,))
 	
-	conn.commit()
-	conn.close()
+		conn.commit()
+	for email in affected:
+		invalidate_user_cache(email=email)
+	recommender.mark_job(job_id)
 	return True
 
 def get_job_by_id(job_id):
 	"""Получает проект по ID"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("SELECT * FROM Jobs WHERE id=?", (job_id,))
-	job = cursor.fetchone()
-	conn.close()
-	return job
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("SELECT * FROM Jobs WHERE id=?", (job_id,))
+		job = cursor.fetchone()
+		return job
+
+def count_jobs():
+	"""Возвращает общее количество проектов в системе"""
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("SELECT COUNT(*) as jobs_count FROM Jobs")
+		result = cursor.fetchone()
+		return result['jobs_count'] if result else 0
+
+def job_visibility_filter(viewer_email: str = None, viewer_role: str = None):
+	"""Условие видимости проекта j для пользователя и его параметры"""
+	has_accepted = """EXISTS (
+		SELECT 1 FROM Applications a
+		WHERE a.job_id = j.id AND a.status = 'accepted'
+	)"""
+
+	if viewer_email:
+		# Создатель видит свои проекты, проекты в работе и завершенные видны всем,
+		# проекты с принятым исполнителем скрыты, если пользователь на них не откликался
+		condition = f"""(
+			j.creator_email = ?
+			OR j.status IN ('in_progress', 'done')
+			OR NOT {has_accepted}
+			OR (? = 'freelancer' AND EXISTS (
+				SELECT 1 FROM Applications a
+				WHERE a.job_id = j.id AND a.freelancer_email = ?
+			))
+		)"""
+		return condition, [viewer_email, viewer_role, viewer_email]
+	# Неавторизованным пользователям показываем только открытые проекты
+	return f"(j.status = 'open' AND NOT {has_accepted})", []
+
+def get_visible_jobs(viewer_email: str = None, viewer_role: str = None, status: str = None,
+                     before_id: int = None, limit: int = None):
+	"""Получает проекты ленты с учетом правил видимости, фильтрация выполняется в SQL"""
+	with db_connection() as conn:
+		cursor = conn.cursor()
+
+		visibility, params = job_visibility_filter(viewer_email, viewer_role)
+		query = f"SELECT j.* FROM Jobs j WHERE {visibility}"
+
+		if status:
+			query += " AND j.status = ?"
+			params.append(status)
+		if before_id is not None:
+			query += " AND j.id < ?"
+			params.append(before_id)
+		query += " ORDER BY j.id DESC"
+		if limit is not None:
+			query += " LIMIT ?"
+			params.append(limit)
+
+		cursor.execute(query, params)
+		jobs = cursor.fetchall()
+		return jobs
+
+def build_search_query(text: str, prefix: bool = False):
+	"""Превращает пользовательский запрос в выражение FTS5, где все слова обязательны"""
+	# Слова берутся в кавычки, поэтому операторы FTS5 (AND, NEAR, "*", ":") в запросе
+	# пользователя ничего не ломают. "ё" в индексе заменена на "е" (fold_yo в database.py)
+	text = (text or "").replace("ё", "е").replace("Ё", "Е")
+	terms = SEARCH_TERM_RE.findall(text)[:SEARCH_MAX_TERMS]
+	if not terms:
+		return None
+	# Префикс находит другие формы слова ("логотип" -> "логотипа"), но для частых слов
+	# заметно дороже точного совпадения
+	suffix = "*" if prefix else ""
+	return " ".join(f'"{term}"{suffix}' for term in terms)
+
+def search_jobs(text: str, viewer_email: str = None, viewer_role: str = None, status: str = None,
+                after_rank: float = None, after_id: int = None, limit: int = None, prefix: bool = False,
+                window: int = None):
+	"""Ищет видимые пользователю проекты по словам запроса в окне совпадений, лучшие (BM25) первыми.
+
+	Окно - SEARCH_CANDIDATES самых новых видимых совпадений с id < window (без window -
+	самых новых вообще). Каждая строка несет границы своего окна: search_window_start
+	(id, с которого окно начинается при повторном запросе), search_window_end (самый
+	старый id окна - граница следующего окна) и search_window_full (окно заполнено,
+	и за ним могут быть более старые совпадения).
+	"""
+	match = build_search_query(text, prefix)
+	if match is None:
+		return []
+	with db_connection() as conn:
+		cursor = conn.cursor()
+
+		# BM25 считается только внутри окна: FTS5 отдает совпадения по rowid без перебора
+		# всего списка, а ранжирование всех совпадений частого слова на миллионе проектов
+		# заняло бы сотни миллисекунд. Видимость и статус проверяются до отсечения окна,
+		# поэтому скрытые от пользователя проекты не занимают в нем места
+		visibility, visibility_params = job_visibility_filter(viewer_email, viewer_role)
+		conditions = ["JobsSearch MATCH ?", visibility]
+		params = [match] + visibility_params
+		if status:
+			conditions.append("j.status = ?")
+			params.append(status)
+		if window is not None:
+			conditions.append("JobsSearch.rowid < ?")
+			params.append(window)
+		params += [SEARCH_CANDIDATES, SEARCH_CANDIDATES]
+
+		query = f"""
+			WITH candidates AS (
+				SELECT JobsSearch.rowid AS id, JobsSearch.rank AS rank
+				FROM JobsSearch
+				INNER JOIN Jobs j ON j.id = JobsSearch.rowid
+				WHERE {" AND ".join(conditions)}
+				ORDER BY JobsSearch.rowid DESC LIMIT ?
+			),
+			bounds AS (
+				SELECT MAX(id) + 1 AS window_start, MIN(id) AS window_end, COUNT(*) >= ? AS window_full
+				FROM candidates
+			)
+			SELECT j.*, c.rank AS search_rank, b.window_start AS search_window_start,
+				b.window_end AS search_window_end, b.window_full AS search_window_full
+			FROM candidates c
+			CROSS JOIN bounds b
+			INNER JOIN Jobs j ON j.id = c.id
+		"""
+		# Курсор - (rank, id) последнего проекта страницы; rank в FTS5 тем меньше, чем лучше совпадение
+		if after_rank is not None and after_id is not None:
+			query += " WHERE (c.rank, c.id) > (?, ?)"
+			params.extend([after_rank, after_id])
+		query += " ORDER BY c.rank, c.id"
+		if limit is not None:
+			query += " LIMIT ?"
+			params.append(limit)
+
+		cursor.execute(query, params)
+		return cursor.fetchall()
+
+def build_job_feed(jobs, viewer_email: str = None, viewer_role: str = None):
+	"""Собирает данные ленты проектов фиксированным числом запросов (без N+1)"""
+	feed = [dict(job) for job in jobs]
+	if not feed:
+		return feed
+
+	job_ids = [job["id"] for job in feed]
+	creator_emails = list({job["creator_email"] for job in feed})
+
+	with db_connection() as conn:
+		cursor = conn.cursor()
+
+		# Создатели проектов одним запросом
+		placeholders = ", ".join("?" for _ in creator_emails)
+		cursor.execute(f"""
+			SELECT email, name, avatar, role
+			FROM Users
+			WHERE email IN ({placeholders})
+		""", creator_emails)
+		creators = {row['email']: row for row in cursor.fetchall()}
+
+		# Все отклики на проекты ленты одним запросом
+		placeholders = ", ".join("?" for _ in job_ids)
+		cursor.execute(f"""
+			SELECT a.*, u.name as freelancer_name, u.avatar as freelancer_avatar, u.role as freelancer_role
+			FROM Applications a
+			LEFT JOIN Users u ON a.freelancer_email = u.email
+			WHERE a.job_id IN ({placeholders})
+			ORDER BY a.id DESC
+		""", job_ids)
+		applications_by_job = {}
+		for row in cursor.fetchall():
+			applications_by_job.setdefault(row['job_id'], []).append(row)
+
+	for job in feed:
+		applications = applications_by_job.get(job["id"], [])
+		job["applications"] = [
+			{key: app[key] for key in app.keys() if key not in ("freelancer_avatar", "freelancer_role")}
+			for app in applications
+		]
+		job["applications_count"] = len(applications)
+		job["has_accepted"] = any(app['status'] == "accepted" for app in applications)
+
+		creator = creators.get(job["creator_email"])
+		job["creator_name"] = creator['name'] if creator and creator['name'] else job["creator_email"]
+
+		# Участники: создатель + принятые фрилансеры (как в get_project_participants)
+		participants = []
+		if creator:
+			participants.append({
+				"creator_email": creator['email'],
+				"name": creator['name'],
+				"avatar": creator['avatar'],
+				"role": creator['role'],
+			})
+		for app in reversed(applications):
+			if app['status'] in ("accepted", "completed") and app['freelancer_role'] is not None:
+				participants.append({
+					"freelancer_email": app['freelancer_email'],
+					"name": app['freelancer_name'],
+					"avatar": app['freelancer_avatar'],
+					"role": app['freelancer_role'],
+					"status": app['status'],
+				})
+		job["participants"] = participants
+
+		if viewer_email and viewer_role == "freelancer":
+			own = next((app for app in applications if app['freelancer_email'] == viewer_email), None)
+			job["has_applied"] = own is not None
+			job["application_status"] = own['status'] if own else None
+
+	return feed
 
 
 
@@ -227,575 +527,842 @@ def get_job_by_id(job_id):
 
 def apply_to_job(job_id: int, freelancer_email: str):
 	"""Добавляет отклик фрилансера на проект"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	try:
-		cursor.execute(
-			"INSERT INTO Applications (job_id, freelancer_email) VALUES (?, ?)",
-			(job_id, freelancer_email)
-		)
-		conn.commit()
-		return True
-	except sqlite3.IntegrityError:
-		return False  # Отклик уже существует
-	finally:
-		conn.close()
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		try:
+			cursor.execute(
+				"INSERT INTO Applications (job_id, freelancer_email) VALUES (?, ?)",
+				(job_id, freelancer_email)
+			)
+			conn.commit()
+			return True
+		except sqlite3.IntegrityError:
+			return False  # Отклик уже существует
 
 def get_applications(job_id: int):
 	"""Получает все отклики на проект"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("""
-		SELECT a.*, u.name as freelancer_name
-		FROM Applications a 
-		LEFT JOIN Users u ON a.freelancer_email = u.email
-		WHERE a.job_id = ?
-		ORDER BY a.id DESC
-	""", (job_id,))
-	apps = cursor.fetchall()
-	conn.close()
-	return apps
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("""
+			SELECT a.*, u.name as freelancer_name
+			FROM Applications a 
+			LEFT JOIN Users u ON a.freelancer_email = u.email
+			WHERE a.job_id = ?
+			ORDER BY a.id DESC
+		""", (job_id,))
+		apps = cursor.fetchall()
+		return apps
 
 def get_applications_by_freelancer(freelancer_email: str):
 	"""Получает все отклики конкретного фрилансера"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("""
-		SELECT a.*, j.title, j.status as job_status, j.creator_email 
-		FROM Applications a 
-		JOIN Jobs j ON a.job_id = j.id 
-		WHERE a.freelancer_email = ?
-		ORDER BY a.id DESC
-	""", (freelancer_email,))
-	apps = cursor.fetchall()
-	conn.close()
-	return apps
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("""
+			SELECT a.*, j.title, j.status as job_status, j.creator_email 
+			FROM Applications a 
+			JOIN Jobs j ON a.job_id = j.id 
+			WHERE a.freelancer_email = ?
+			ORDER BY a.id DESC
+		""", (freelancer_email,))
+		apps = cursor.fetchall()
+		return apps
 
 def get_applications_for_client(creator_email: str):
 	"""Получает все отклики на проекты клиента"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("""
-		SELECT a.*, j.title, j.status as job_status, u.name as freelancer_name, u.about_me, u.skills
-		FROM Applications a 
-		JOIN Jobs j ON a.job_id = j.id 
-		JOIN Users u ON a.freelancer_email = u.email
-		WHERE j.creator_email = ?
-		ORDER BY a.id DESC
-	""", (creator_email,))
-	apps = cursor.fetchall()
-	conn.close()
-	return apps
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("""
+			SELECT a.*, j.title, j.status as job_status, u.name as freelancer_name, u.about_me, u.skills
+			FROM Applications a 
+			JOIN Jobs j ON a.job_id = j.id 
+			JOIN Users u ON a.freelancer_email = u.email
+			WHERE j.creator_email = ?
+			ORDER BY a.id DESC
+		""", (creator_email,))
+		apps = cursor.fetchall()
+		return apps
 
 
 def update_application_status(application_id: int, status: str):
 	"""Обновляет статус отклика (принят/отклонен)"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("UPDATE Applications SET status = ? WHERE id = ?", (status, application_id))
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("UPDATE Applications SET status = ? WHERE id = ?", (status, application_id))
 	
-	# Если заявка принята, обновляем статус проекта на "in_progress"
-	if status == "accepted":
-		cursor.execute("SELECT job_id FROM Applications WHERE id = ?", (application_id,))
-		job_id = cursor.fetchone()['job_id']
-		cursor.execute("UPDATE Jobs SET status = 'in_progress' WHERE id = ?", (job_id,))
+		# Если заявка принята, обновляем статус проекта на "in_progress"
+		if status == "accepted":
+			cursor.execute("SELECT job_id FROM Applications WHERE id = ?", (application_id,))
+			job_id = cursor.fetchone()['job_id']
+			cursor.execute("UPDATE Jobs SET status = 'in_progress' WHERE id = ?", (job_id,))
 	
-	conn.commit()
-	conn.close()
+		conn.commit()
+	# Проект в работе больше не рекомендуется
+	if status == "accepted":
+		recommender.mark_job(job_id)
 
 def get_application_by_id(application_id: int):
 	"""Получает отклик по ID"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("SELECT * FROM Applications WHERE id = ?", (application_id,))
-	app = cursor.fetchone()
-	conn.close()
-	return app
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("SELECT * FROM Applications WHERE id = ?", (application_id,))
+		app = cursor.fetchone()
+		return app
 
 def has_user_applied_to_job(job_id: int, freelancer_email: str):
 	"""Проверяет, откликался ли пользователь на проект"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("SELECT id FROM Applications WHERE job_id = ? AND freelancer_email = ?", (job_id, freelancer_email))
-	result = cursor.fetchone()
-	conn.close()
-	return result is not None
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("SELECT id FROM Applications WHERE job_id = ? AND freelancer_email = ?", (job_id, freelancer_email))
+		result = cursor.fetchone()
+		return result is not None
 
 def get_user_application_status(job_id: int, freelancer_email: str):
 	"""Получает статус отклика пользователя на проект"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("SELECT status FROM Applications WHERE job_id = ? AND freelancer_email = ?", (job_id, freelancer_email))
-	result = cursor.fetchone()
-	conn.close()
-	return result['status'] if result else None
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("SELECT status FROM Applications WHERE job_id = ? AND freelancer_email = ?", (job_id, freelancer_email))
+		result = cursor.fetchone()
+		return result['status'] if result else None
 
 
 def complete_job(job_id: int, freelancer_email: str):
 	"""Завершает проект и обновляет статистику фрилансера"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	# Обновляем статус проекта на "done"
-	cursor.execute("UPDATE Jobs SET status = 'done' WHERE id = ?", (job_id,))
-	# Обновляем статус отклика на "completed"
-	cursor.execute("UPDATE Applications SET status = 'completed' WHERE job_id = ? AND freelancer_email = ?", (job_id, freelancer_email))
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		# Обновляем статус проекта на "done"
+		cursor.execute("UPDATE Jobs SET status = 'done' WHERE id = ?", (job_id,))
+		# Обновляем статус отклика на "completed"
+		cursor.execute(
+			"UPDATE Applications SET status = 'completed' WHERE job_id = ? AND freelancer_email = ? AND status != 'completed'",
+			(job_id, freelancer_email)
+		)
 	
-	# Обновляем статистику фрилансера после завершения проекта
-	update_freelancer_stats(freelancer_email, cursor)
+		# Счетчик растет только при первом завершении, повторный вызов его не меняет
+		if cursor.rowcount:
+			cursor.execute(
+				"UPDATE Users SET completed_projects = IFNULL(completed_projects, 0) + 1 WHERE email = ?",
+				(freelancer_email,)
+			)
 	
-	conn.commit()
-	conn.close()
+		conn.commit()
+	invalidate_user_cache(email=freelancer_email)
+	recommender.mark_job(job_id)
 
 
 # ===== ФУНКЦИИ ДЛЯ РАБОТЫ СО СТАТИСТИКОЙ =====
 
+# Сколько фрилансеров пересчитывается одним запросом в update_all_freelancer_stats
+STATS_BATCH_SIZE = int(os.getenv("STATS_BATCH_SIZE", "5000"))
+
+# Полный пересчет статистики окна фрилансеров (id в (:lo, :hi]) одним запросом.
+# Агрегаты считаются только по фрилансерам окна через индексы по freelancer_email
+# (CROSS JOIN фиксирует порядок: иначе планировщик перебирает все завершенные проекты),
+# строки, где ничего не изменилось, не перезаписываются
+FREELANCER_STATS_BATCH_UPDATE = """
+	UPDATE Users SET
+		rating_sum = s.rating_sum,
+		rating_count = s.rating_count,
+		rating = CASE WHEN s.rating_count > 0
+			THEN ROUND(CAST(s.rating_sum AS REAL) / s.rating_count, 1) ELSE 0.0 END,
+		completed_projects = s.completed_projects
+	FROM (
+		SELECT
+			f.id,
+			IFNULL(r.total, 0) AS rating_sum,
+			IFNULL(r.cnt, 0) AS rating_count,
+			IFNULL(c.cnt, 0) AS completed_projects
+		FROM Users f
+		LEFT JOIN (
+			SELECT rv.freelancer_email, SUM(rv.rating) AS total, COUNT(*) AS cnt
+			FROM Users u
+			INNER JOIN Reviews rv ON rv.freelancer_email = u.email
+			WHERE u.role = 'freelancer' AND u.id > :lo AND u.id <= :hi
+			GROUP BY rv.freelancer_email
+		) AS r ON r.freelancer_email = f.email
+		LEFT JOIN (
+			SELECT a.freelancer_email, COUNT(DISTINCT j.id) AS cnt
+			FROM Users u
+			CROSS JOIN Applications a ON a.freelancer_email = u.email
+			INNER JOIN Jobs j ON j.id = a.job_id
+			WHERE u.role = 'freelancer' AND u.id > :lo AND u.id <= :hi
+			  AND a.status = 'completed' AND j.status = 'done'
+			GROUP BY a.freelancer_email
+		) AS c ON c.freelancer_email = f.email
+		WHERE f.role = 'freelancer' AND f.id > :lo AND f.id <= :hi
+	) AS s
+	WHERE Users.id = s.id
+	  AND (Users.rating_sum != s.rating_sum
+	    OR Users.rating_count != s.rating_count
+	    OR Users.rating IS NOT (CASE WHEN s.rating_count > 0
+	        THEN ROUND(CAST(s.rating_sum AS REAL) / s.rating_count, 1) ELSE 0.0 END)
+	    OR Users.completed_projects IS NOT s.completed_projects)
+"""
+
 def update_freelancer_stats(freelancer_email: str, cursor=None):
-	"""Обновляет рейтинг и количество завершенных проектов для фрилансера"""
+	"""Пересчитывает статистику фрилансера с нуля по отзывам и завершенным проектам"""
+	# С переданным курсором транзакцию фиксирует вызывающий код - он же и сбрасывает
+	# кэш пользователя после commit, иначе другой поток может закэшировать старую запись
 	if cursor is None:
-		conn = get_connection()
-		cursor = conn.cursor()
-		should_close = True
-	else:
-		should_close = False
+		with db_connection() as conn:
+			update_freelancer_stats(freelancer_email, conn.cursor())
+			conn.commit()
+		invalidate_user_cache(email=freelancer_email)
+		return
 	
-	# Получаем средний рейтинг
+	# Суммы оценок и завершенные проекты по исходным таблицам
 	cursor.execute("""
-		SELECT AVG(rating) as avg_rating
-		FROM Reviews 
-		WHERE freelancer_email = ?
+		UPDATE Users SET (rating_sum, rating_count, completed_projects) = (
+			SELECT
+				(SELECT IFNULL(SUM(rating), 0) FROM Reviews WHERE freelancer_email = Users.email),
+				(SELECT COUNT(*) FROM Reviews WHERE freelancer_email = Users.email),
+				(SELECT COUNT(DISTINCT j.id) FROM Jobs j
+				 INNER JOIN Applications a ON j.id = a.job_id
+				 WHERE a.freelancer_email = Users.email AND a.status = 'completed' AND j.status = 'done')
+		)
+		WHERE email = ?
 	""", (freelancer_email,))
-	result = cursor.fetchone()
-	
-	# Считаем количество завершенных проектов
+	# Рейтинг выводится из накопленных сумм так же, как при добавлении отзыва
 	cursor.execute("""
-		SELECT COUNT(DISTINCT j.id) as completed_count
-		FROM Jobs j
-		INNER JOIN Applications a ON j.id = a.job_id
-		WHERE a.freelancer_email = ? AND a.status = 'completed' AND j.status = 'done'
+		UPDATE Users SET rating = CASE WHEN rating_count > 0
+			THEN ROUND(CAST(rating_sum AS REAL) / rating_count, 1) ELSE 0.0 END
+		WHERE email = ?
 	""", (freelancer_email,))
-	completed_result = cursor.fetchone()
-	
-	# Обновляем данные пользователя
-	avg_rating = round(result['avg_rating'], 1) if result and result['avg_rating'] is not None else 0.0
-	completed_projects = completed_result['completed_count'] if completed_result else 0
-	
+
+def add_review_to_stats(cursor, freelancer_email: str, rating: int):
+	"""Учитывает новую оценку в накопленной статистике фрилансера за O(1)"""
+	# В SET справа видны значения до обновления, поэтому рейтинг считается от новых сумм явно
 	cursor.execute("""
-		UPDATE Users 
-		SET rating = ?, completed_projects = ?
+		UPDATE Users SET
+			rating_sum = rating_sum + ?,
+			rating_count = rating_count + 1,
+			rating = ROUND(CAST(rating_sum + ? AS REAL) / (rating_count + 1), 1)
 		WHERE email = ?
-	""", (avg_rating, completed_projects, freelancer_email))
-	
-	print(f"Updated stats for {freelancer_email}: rating={avg_rating}, projects={completed_projects}")
-	
-	if should_close:
-		conn.commit()
-		conn.close()
+	""", (rating, rating, freelancer_email))
 
-def update_all_freelancer_stats():
-	"""Обновляет статистику всех фрилансеров (админская функция)"""
-	conn = get_connection()
-	cursor = conn.cursor()
+def verify_freelancer_aggregates():
+	"""Сравнивает накопленную статистику фрилансеров с полным пересчетом и возвращает расхождения"""
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("""
+			WITH review_totals AS (
+				SELECT freelancer_email, SUM(rating) AS total, COUNT(*) AS cnt
+				FROM Reviews
+				GROUP BY freelancer_email
+			),
+			completed AS (
+				SELECT a.freelancer_email, COUNT(DISTINCT j.id) AS cnt
+				FROM Jobs j
+				INNER JOIN Applications a ON j.id = a.job_id
+				WHERE a.status = 'completed' AND j.status = 'done'
+				GROUP BY a.freelancer_email
+			),
+			expected AS (
+				SELECT
+					u.email,
+					u.rating_sum, IFNULL(r.total, 0) AS expected_rating_sum,
+					u.rating_count, IFNULL(r.cnt, 0) AS expected_rating_count,
+					u.rating, CASE WHEN r.cnt > 0 THEN ROUND(CAST(r.total AS REAL) / r.cnt, 1) ELSE 0.0 END AS expected_rating,
+					u.completed_projects, IFNULL(c.cnt, 0) AS expected_completed_projects
+				FROM Users u
+				LEFT JOIN review_totals r ON r.freelancer_email = u.email
+				LEFT JOIN completed c ON c.freelancer_email = u.email
+				WHERE u.role = 'freelancer'
+			)
+			SELECT * FROM expected
+			WHERE rating_sum != expected_rating_sum
+			   OR rating_count != expected_rating_count
+			   OR rating IS NOT expected_rating
+			   OR completed_projects IS NOT expected_completed_projects
+			ORDER BY email
+		""")
+		return [dict(row) for row in cursor.fetchall()]
+
+def update_all_freelancer_stats(progress=None, batch_size: int = None):
+	"""Пересчитывает статистику всех фрилансеров (админская функция) и возвращает сводку"""
+	batch_size = batch_size or STATS_BATCH_SIZE
+	processed = updated = 0
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("SELECT COUNT(*) FROM Users WHERE role = 'freelancer'")
+		total = cursor.fetchone()[0]
+		if progress:
+			progress(0, total)
 	
-	# Получаем всех фрилансеров
-	cursor.execute("SELECT email FROM Users WHERE role = 'freelancer'")
-	freelancers = cursor.fetchall()
+		# Фрилансеры обрабатываются окнами по id: каждое окно - один UPDATE ... FROM
+		# и своя транзакция, чтобы не держать блокировку записи на весь пересчет
+		last_id = 0
+		while True:
+			cursor.execute("""
+				SELECT MAX(id) AS upper_id, COUNT(*) AS cnt FROM (
+					SELECT id FROM Users
+					WHERE role = 'freelancer' AND id > ?
+					ORDER BY id LIMIT ?
+				)
+			""", (last_id, batch_size))
+			window = cursor.fetchone()
+			if not window['cnt']:
+				break
 	
-	for freelancer in freelancers:
-		update_freelancer_stats(freelancer['email'], cursor)
+			params = {"lo": last_id, "hi": window['upper_id']}
+			cursor.execute(FREELANCER_STATS_BATCH_UPDATE, params)
+			updated += cursor.rowcount
+			conn.commit()
 	
-	conn.commit()
-	conn.close()
-	print(f"Updated stats for {len(freelancers)} freelancers")
+			processed += window['cnt']
+			last_id = window['upper_id']
+			if progress:
+				progress(processed, total)
+	
+	# Изменены записи всех фрилансеров - проще сбросить кэш целиком
+	user_cache.clear()
+	print(f"Updated stats for {processed} freelancers, changed {updated}")
+	return {"freelancers": processed, "updated": updated}
 
 
 # ===== ФУНКЦИИ ДЛЯ РАБОТЫ С ОТЗЫВАМИ =====
 
 def create_review(job_id: int, freelancer_email: str, client_email: str, rating: int, comment: str = None):
 	"""Создает отзыв и обновляет статистику фрилансера"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute(
-		"INSERT INTO Reviews (job_id, freelancer_email, client_email, rating, comment) VALUES (?, ?, ?, ?, ?)",
-		(job_id, freelancer_email, client_email, rating, comment)
-	)
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute(
+			"INSERT INTO Reviews (job_id, freelancer_email, client_email, rating, comment) VALUES (?, ?, ?, ?, ?)",
+			(job_id, freelancer_email, client_email, rating, comment)
+		)
 	
-	# Обновляем статистику фрилансера после добавления отзыва
-	update_freelancer_stats(freelancer_email, cursor)
+		# Обновляем статистику фрилансера в той же транзакции, что и отзыв
+		add_review_to_stats(cursor, freelancer_email, rating)
 	
-	conn.commit()
-	conn.close()
+		conn.commit()
+	invalidate_user_cache(email=freelancer_email)
 
 def get_reviews_for_freelancer(freelancer_email: str):
 	"""Получает все отзывы для фрилансера"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("""
-		SELECT r.*, j.title, u.name as client_name
-		FROM Reviews r
-		JOIN Jobs j ON r.job_id = j.id
-		JOIN Users u ON r.client_email = u.email
-		WHERE r.freelancer_email = ?
-		ORDER BY r.created_at DESC
-	""", (freelancer_email,))
-	reviews = cursor.fetchall()
-	conn.close()
-	return reviews
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("""
+			SELECT r.*, j.title, u.name as client_name
+			FROM Reviews r
+			JOIN Jobs j ON r.job_id = j.id
+			JOIN Users u ON r.client_email = u.email
+			WHERE r.freelancer_email = ?
+			ORDER BY r.created_at DESC
+		""", (freelancer_email,))
+		reviews = cursor.fetchall()
+		return reviews
 
 def get_job_reviews(job_id: int):
 	"""Получает все отзывы по проекту"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("SELECT * FROM Reviews WHERE job_id = ?", (job_id,))
-	reviews = cursor.fetchall()
-	conn.close()
-	return reviews
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("SELECT * FROM Reviews WHERE job_id = ?", (job_id,))
+		reviews = cursor.fetchall()
+		return reviews
 
 def has_reviewed_job(job_id: int, client_email: str, freelancer_email: str):
 	"""Проверяет, оставил ли клиент отзыв по проекту"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("SELECT id FROM Reviews WHERE job_id = ? AND client_email = ? AND freelancer_email = ?", 
-	               (job_id, client_email, freelancer_email))
-	result = cursor.fetchone()
-	conn.close()
-	return result is not None
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("SELECT id FROM Reviews WHERE job_id = ? AND client_email = ? AND freelancer_email = ?", 
+		               (job_id, client_email, freelancer_email))
+		result = cursor.fetchone()
+		return result is not None
 
 
 # ===== ФУНКЦИИ ДЛЯ РАБОТЫ С СООБЩЕНИЯМИ =====
 
 def create_message(sender_email: str, receiver_email: str, message: str, job_id: int = None):
-	"""Создает новое сообщение в чате"""
+	"""Создает новое сообщение в чате и возвращает сохраненную запись"""
 	# Проверяем, что пользователь не пытается отправить сообщение самому себе
 	if sender_email == receiver_email:
 		raise ValueError("Нельзя отправить сообщение самому себе")
 	
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute(
-		"INSERT INTO Messages (sender_email, receiver_email, job_id, message) VALUES (?, ?, ?, ?)",
-		(sender_email, receiver_email, job_id, message)
-	)
-	conn.commit()
-	conn.close()
-
-
-def get_messages_between_users(user1_email: str, user2_email: str, job_id: int = None):
-	"""Получает сообщения между двумя пользователями (обычный или проектный чат)"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	if job_id:
-		cursor.execute("""
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute(
+			"INSERT INTO Messages (sender_email, receiver_email, job_id, message) VALUES (?, ?, ?, ?)",
+			(sender_email, receiver_email, job_id, message)
+		)
+		conn.commit()
+		cursor.execute("SELECT * FROM Messages WHERE id = ?", (cursor.lastrowid,))
+		return dict(cursor.fetchone())
+
+
+# Верхняя граница id сообщения - курсор "с самого нового" для get_message_history
+MAX_MESSAGE_ID = 2 ** 63 - 1
+
+def get_messages_between_users(user1_email: str, user2_email: str, job_id: int = None,
+                               after_id: int = None, limit: int = None):
+	"""Получает сообщения между двумя пользователями (обычный или проектный чат) новее after_id"""
+	# IS ? совпадает и с номером проекта, и с NULL обычного чата; условие повторяется
+	# в каждой ветке OR, чтобы обе шли по idx_messages_pair, где id идет сразу за job_id
+	job_id = job_id or None
+	after_id = after_id or 0
+	pair_params = (user1_email, user2_email, job_id, after_id, user2_email, user1_email, job_id, after_id)
+	pair_condition = """
+		(m.sender_email = ? AND m.receiver_email = ? AND m.job_id IS ? AND m.id > ?) OR 
+		(m.sender_email = ? AND m.receiver_email = ? AND m.job_id IS ? AND m.id > ?)
+	"""
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		if after_id:
+			# Частый случай опроса - новых сообщений нет: отвечаем по индексу, без JOIN с Users
+			cursor.execute(f"SELECT EXISTS (SELECT 1 FROM Messages m WHERE {pair_condition})", pair_params)
+			if not cursor.fetchone()[0]:
+				return []
+		
+		query = f"""
 			SELECT m.*, u.name as sender_name, u.avatar as sender_avatar
 			FROM Messages m
 			JOIN Users u ON m.sender_email = u.email
-			WHERE ((m.sender_email = ? AND m.receiver_email = ?) OR 
-			       (m.sender_email = ? AND m.receiver_email = ?)) 
-			AND m.job_id = ?
-			ORDER BY m.created_at ASC
-		""", (user1_email, user2_email, user2_email, user1_email, job_id))
-	else:
+			WHERE {pair_condition}
+			ORDER BY m.id ASC
+		"""
+		params = list(pair_params)
+		if limit is not None:
+			query += " LIMIT ?"
+			params.append(limit)
+		cursor.execute(query, params)
+		messages = cursor.fetchall()
+		return messages
+
+
+def get_message_history(user1_email: str, user2_email: str, job_id: int = None,
+                        before_id: int = None, limit: int = 50):
+	"""Получает limit последних сообщений диалога старше before_id (по возрастанию id)"""
+	# Каждое направление диалога читается по idx_messages_pair с конца от курсора и
+	# обрывается на limit строк, поэтому стоимость не зависит от длины переписки
+	job_id = job_id or None
+	before_id = before_id or MAX_MESSAGE_ID
+	with db_connection() as conn:
+		cursor = conn.cursor()
 		cursor.execute("""
 			SELECT m.*, u.name as sender_name, u.avatar as sender_avatar
-			FROM Messages m
+			FROM (
+				SELECT * FROM (
+					SELECT * FROM Messages
+					WHERE sender_email = ? AND receiver_email = ? AND job_id IS ? AND id < ?
+					ORDER BY id DESC LIMIT ?
+				)
+				UNION ALL
+				SELECT * FROM (
+					SELECT * FROM Messages
+					WHERE sender_email = ? AND receiver_email = ? AND job_id IS ? AND id < ?
+					ORDER BY id DESC LIMIT ?
+				)
+			) m
 			JOIN Users u ON m.sender_email = u.email
-			WHERE ((m.sender_email = ? AND m.receiver_email = ?) OR 
-			       (m.sender_email = ? AND m.receiver_email = ?)) 
-			AND m.job_id IS NULL
-			ORDER BY m.created_at ASC
-		""", (user1_email, user2_email, user2_email, user1_email))
-	messages = cursor.fetchall()
-	conn.close()
-	return messages
+			ORDER BY m.id DESC
+			LIMIT ?
+		""", (user1_email, user2_email, job_id, before_id, limit,
+		      user2_email, user1_email, job_id, before_id, limit, limit))
+		messages = cursor.fetchall()
+		return messages[::-1]
 
 
 def get_user_conversations(user_email: str):
 	"""Получает все диалоги пользователя (обычные и проектные)"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	
-	# Получаем обычные диалоги с пользователями
-	cursor.execute("""
-		SELECT DISTINCT 
-			CASE 
-				WHEN sender_email = ? THEN receiver_email 
-				ELSE sender_email 
-			END as other_user_email,
-			u.name as other_user_name,
-			u.avatar as other_user_avatar,
-			MAX(m.created_at) as last_message_time,
-			COUNT(CASE WHEN m.receiver_email = ? AND m.is_read = FALSE THEN 1 END) as unread_count,
-			NULL as job_id,
-			NULL as job_title,
-			'user' as conversation_type
-		FROM Messages m
-		JOIN Users u ON (CASE WHEN m.sender_email = ? THEN m.receiver_email ELSE m.sender_email END) = u.email
-		WHERE (m.sender_email = ? OR m.receiver_email = ?) AND m.job_id IS NULL
-		GROUP BY other_user_email, other_user_name, other_user_avatar
-		
-		UNION ALL
-		
-		-- Получаем диалоги по проектам
-		SELECT DISTINCT 
-			NULL as other_user_email,
-			NULL as other_user_name,
-			NULL as other_user_avatar,
-			MAX(m.created_at) as last_message_time,
-			COUNT(CASE WHEN m.receiver_email = ? AND m.is_read = FALSE THEN 1 END) as unread_count,
-			m.job_id,
-			j.title as job_title,
-			'project' as conversation_type
-		FROM Messages m
-		JOIN Jobs j ON m.job_id = j.id
-		WHERE (m.sender_email = ? OR m.receiver_email = ?) AND m.job_id IS NOT NULL
-		GROUP BY m.job_id, j.title
-		
-		ORDER BY last_message_time DESC
-	""", (user_email, user_email, user_email, user_email, user_email, user_email, user_email, user_email))
+	# Сводка из Conversations: у пользователя своя строка на каждый диалог, поэтому список
+	# читается по idx_conversations_user уже в порядке последней активности
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("""
+			SELECT 
+				c.other_email as other_user_email,
+				u.name as other_user_name,
+				u.avatar as other_user_avatar,
+				c.last_message_time,
+				c.unread_count,
+				NULLIF(c.job_id, 0) as job_id,
+				j.title as job_title,
+				CASE WHEN c.job_id = 0 THEN 'user' ELSE 'project' END as conversation_type,
+				c.last_message_id,
+				c.snippet
+			FROM Conversations c
+			JOIN Users u ON c.other_email = u.email
+			LEFT JOIN Jobs j ON c.job_id = j.id
+			WHERE c.user_email = ? AND (c.job_id = 0 OR j.id IS NOT NULL)
+			ORDER BY c.last_message_id DESC
+		""", (user_email,))
 	
-	conversations = cursor.fetchall()
-	conn.close()
-	return conversations
+		conversations = cursor.fetchall()
+		return conversations
 
 
 def mark_messages_as_read(current_user_email: str, other_user_email: str, job_id: int = None):
-	"""Отмечает как прочитанные сообщения, где current_user_email является получателем"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	if job_id:
-		cursor.execute("""
-			UPDATE Messages 
-			SET is_read = TRUE 
-			WHERE sender_email = ? AND receiver_email = ? AND job_id = ?
-		""", (other_user_email, current_user_email, job_id))
-	else:
+	"""Отмечает как прочитанные сообщения, где current_user_email является получателем, возвращает их количество"""
+	# Уже прочитанные строки не перезаписываются
+	with db_connection() as conn:
+		cursor = conn.cursor()
 		cursor.execute("""
 			UPDATE Messages 
 			SET is_read = TRUE 
-			WHERE sender_email = ? AND receiver_email = ? AND job_id IS NULL
-		""", (other_user_email, current_user_email))
-	
-	conn.commit()
-	conn.close()
+			WHERE sender_email = ? AND receiver_email = ? AND job_id IS ? AND is_read = FALSE
+		""", (other_user_email, current_user_email, job_id or None))
+		conn.commit()
+		return cursor.rowcount
 
 def get_unread_messages_count(user_email: str):
 	"""Получает общее количество непрочитанных сообщений для пользователя"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("""
-		SELECT COUNT(*) as unread_count
-		FROM Messages 
-		WHERE receiver_email = ? AND is_read = FALSE
-	""", (user_email,))
-	result = cursor.fetchone()
-	conn.close()
-	return result['unread_count'] if result else 0
+	# Счетчик поддерживается триггерами на Messages - чтение по первичному ключу
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("SELECT unread_count FROM UnreadCounters WHERE user_email = ?", (user_email,))
+		result = cursor.fetchone()
+		return result['unread_count'] if result else 0
+
+def reconcile_unread_counters() -> int:
+	"""Пересчитывает счетчики непрочитанных по Messages и возвращает количество исправленных"""
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		# Первый UPDATE открывает пишущую транзакцию, поэтому оба запроса видят одно состояние Messages
+		cursor.execute("""
+			UPDATE UnreadCounters
+			SET unread_count = (
+				SELECT COUNT(*) FROM Messages
+				WHERE receiver_email = UnreadCounters.user_email AND is_read = FALSE
+			)
+			WHERE unread_count != (
+				SELECT COUNT(*) FROM Messages
+				WHERE receiver_email = UnreadCounters.user_email AND is_read = FALSE
+			)
+		""")
+		repaired = cursor.rowcount
+		cursor.execute("""
+			INSERT INTO UnreadCounters (user_email, unread_count)
+			SELECT receiver_email, COUNT(*) FROM Messages
+			WHERE is_read = FALSE AND receiver_email NOT IN (SELECT user_email FROM UnreadCounters)
+			GROUP BY receiver_email
+		""")
+		repaired += cursor.rowcount
+		conn.commit()
+	if repaired:
+		print(f"Исправлено счетчиков непрочитанных: {repaired}")
+	return repaired
 
 
 # ===== ФУНКЦИИ ДЛЯ РАБОТЫ С ПРОФИЛЯМИ ПОЛЬЗОВАТЕЛЕЙ =====
 
+# До скольких владельцев самого редкого навыка каталог начинает выборку с UserSkills,
+# а не с индекса рейтинга (см. user_filter)
+SKILL_DRIVE_LIMIT = int(os.getenv("SKILL_DRIVE_LIMIT", "2000"))
+
 def get_users_by_role(role: str):
 	"""Получает пользователей по роли с сортировкой по рейтингу"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("SELECT * FROM Users WHERE role = ? ORDER BY rating DESC, completed_projects DESC", (role,))
-	users = cursor.fetchall()
-	conn.close()
-	return users
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("SELECT * FROM Users WHERE role = ? ORDER BY rating DESC, completed_projects DESC", (role,))
+		users = cursor.fetchall()
+		return users
 
 def get_all_users_with_filters(role_filter: str = None, min_rating: str = None):
 	"""Получает всех пользователей с возможностью фильтрации по роли и рейтингу"""
-	conn = get_connection()
-	cursor = conn.cursor()
+	with db_connection() as conn:
+		cursor = conn.cursor()
 	
-	query = "SELECT * FROM Users WHERE 1=1"
-	params = []
+		query = "SELECT * FROM Users WHERE 1=1"
+		params = []
 	
-	if role_filter and role_filter != "all":
-		query += " AND role = ?"
-		params.append(role_filter)
+		if role_filter and role_filter != "all":
+			query += " AND role = ?"
+			params.append(role_filter)
 	
-	if min_rating and min_rating.strip():
-		try:
-			rating_value = float(min_rating)
-			query += " AND rating >= ?"
-			params.append(rating_value)
-		except ValueError:
-			pass
+		if min_rating and min_rating.strip():
+			try:
+				rating_value = float(min_rating)
+				query += " AND rating >= ?"
+				params.append(rating_value)
+			except ValueError:
+				pass
 	
-	query += " ORDER BY rating DESC, completed_projects DESC"
+		query += " ORDER BY rating DESC, completed_projects DESC"
 	
-	cursor.execute(query, params)
-	users = cursor.fetchall()
-	conn.close()
-	return users
+		cursor.execute(query, params)
+		users = cursor.fetchall()
+		return users
+
+def user_filter(cursor, role: str = None, min_rating: float = None, skills: list = None, drive_limit: int = None):
+	"""Источник строк, условие каталога пользователей u по роли, рейтингу и навыкам и параметры.
+
+	Пользователь должен владеть всеми навыками. Размеры списков владельцев известны по
+	Skills.user_count, поэтому план выбирается здесь: если у самого редкого навыка не больше
+	drive_limit владельцев, выборка начинается с его списка в UserSkills, иначе пользователи
+	перебираются по индексу рейтинга с проверкой навыков по первичному ключу UserSkills.
+	"""
+	source = "Users u"
+	conditions = []
+	params = []
+	if role and role != "all":
+		conditions.append("u.role = ?")
+		params.append(role)
+	if min_rating is not None:
+		conditions.append("u.rating >= ?")
+		params.append(min_rating)
+
+	keys = list(parse_skills(",".join(skills or [])))
+	if keys:
+		placeholders = ", ".join("?" * len(keys))
+		cursor.execute(f"SELECT id, user_count FROM Skills WHERE normalized IN ({placeholders})", keys)
+		found = sorted(cursor.fetchall(), key=lambda skill: skill["user_count"])
+		if len(found) < len(keys):
+			# Навыка нет ни у кого - пересечение заведомо пустое
+			return source, "0", []
+		if drive_limit is None or found[0]["user_count"] <= drive_limit:
+			# CROSS JOIN фиксирует порядок: сначала владельцы навыка, затем их строки Users
+			source = "UserSkills d CROSS JOIN Users u ON u.id = d.user_id"
+			conditions.insert(0, "d.skill_id = ?")
+			params.insert(0, found[0]["id"])
+			found = found[1:]
+		for skill in found:
+			conditions.append("EXISTS (SELECT 1 FROM UserSkills WHERE skill_id = ? AND user_id = u.id)")
+			params.append(skill["id"])
+	return source, " AND ".join(conditions) or "1=1", params
+
+def search_users(role: str = None, min_rating: float = None, skills: list = None,
+                 after: tuple = None, limit: int = None):
+	"""Каталог пользователей: лучшие по рейтингу и завершенным проектам первыми, keyset-пагинация"""
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		source, condition, params = user_filter(cursor, role, min_rating, skills, drive_limit=SKILL_DRIVE_LIMIT)
+		query = f"SELECT u.* FROM {source} WHERE {condition}"
+		# Курсор - (rating, completed_projects, id) последнего пользователя страницы;
+		# порядок совпадает с индексами idx_users_role_rating / idx_users_rating
+		if after is not None:
+			query += " AND (u.rating, u.completed_projects, u.id) < (?, ?, ?)"
+			params.extend(after)
+		query += " ORDER BY u.rating DESC, u.completed_projects DESC, u.id DESC"
+		if limit is not None:
+			query += " LIMIT ?"
+			params.append(limit)
+		cursor.execute(query, params)
+		return cursor.fetchall()
+
+def count_users(role: str = None, min_rating: float = None, skills: list = None) -> int:
+	"""Количество пользователей каталога с теми же фильтрами, что и search_users"""
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		# Для подсчета перебираются все совпадения, поэтому всегда начинаем с самого редкого навыка
+		source, condition, params = user_filter(cursor, role, min_rating, skills)
+		cursor.execute(f"SELECT COUNT(*) FROM {source} WHERE {condition}", params)
+		return cursor.fetchone()[0]
+
+def get_popular_skills(limit: int = 20):
+	"""Самые распространенные навыки для подсказок в поиске"""
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute(
+			"SELECT name, user_count FROM Skills WHERE user_count > 0 ORDER BY user_count DESC, name LIMIT ?",
+			(limit,)
+		)
+		return cursor.fetchall()
 
 def get_user_profile_by_email(email: str):
 	"""Получает профиль пользователя по email"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("SELECT * FROM Users WHERE email = ?", (email,))
-	user = cursor.fetchone()
-	conn.close()
-	return user
+	# Профиль - та же запись Users, поэтому запрос и кэш общие с get_user_by_email
+	return get_user_by_email(email)
+
+
+# ===== РЕКОМЕНДАЦИИ =====
+
+# Сколько совпадений брать из индекса рекомендаций до фильтрации правилами видимости
+RECOMMEND_CANDIDATES = int(os.getenv("RECOMMEND_CANDIDATES", "50"))
+
+def get_job_candidates(job_id: int, limit: int = 20):
+	"""Фрилансеры, чьи профили ближе всего к проекту: лучшие первыми, с оценкой и признаком отклика"""
+	job = get_job_by_id(job_id)
+	if job is None:
+		return []
+	scores = dict(recommender.candidates_for_jobs([job], limit)[0])
+	if not scores:
+		return []
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute(f"""
+			SELECT u.id, u.email, u.name, u.avatar, u.skills, u.rating, u.completed_projects,
+				EXISTS (
+					SELECT 1 FROM Applications a WHERE a.job_id = ? AND a.freelancer_email = u.email
+				) AS applied
+			FROM Users u
+			WHERE u.id IN ({', '.join('?' * len(scores))}) AND u.role = 'freelancer'
+		""", [job_id, *scores])
+		candidates = [dict(row, score=round(scores[row['id']], 4)) for row in cursor.fetchall()]
+	candidates.sort(key=lambda user: (-user['score'], user['id']))
+	return candidates
+
+def get_recommended_jobs(user_email: str, limit: int = 5):
+	"""Открытые проекты, близкие к профилю фрилансера, на которые он еще не откликался.
+
+	Пока индекс рекомендаций строится, возвращает пустой список, не задерживая страницу.
+	"""
+	user = get_user_by_email(user_email)
+	if user is None or user['role'] != 'freelancer':
+		return []
+	scores = dict(recommender.jobs_for_users([user], RECOMMEND_CANDIDATES, wait=False)[0])
+	if not scores:
+		return []
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		visibility, params = job_visibility_filter(user_email, user['role'])
+		cursor.execute(f"""
+			SELECT j.* FROM Jobs j
+			WHERE j.id IN ({', '.join('?' * len(scores))}) AND j.status = 'open' AND {visibility}
+			AND NOT EXISTS (
+				SELECT 1 FROM Applications a WHERE a.job_id = j.id AND a.freelancer_email = ?
+			)
+		""", [*scores, *params, user_email])
+		jobs = [dict(row, score=round(scores[row['id']], 4)) for row in cursor.fetchall()]
+	jobs.sort(key=lambda job: (-job['score'], -job['id']))
+	return jobs[:limit]
 
 
 # ===== ФУНКЦИИ ДЛЯ РАБОТЫ С КОММЕНТАРИЯМИ К ПРОЕКТАМ =====
 
 def create_project_comment(job_id: int, user_email: str, comment: str):
 	"""Создает комментарий к проекту"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute(
-		"INSERT INTO ProjectComments (job_id, user_email, comment) VALUES (?, ?, ?)",
-		(job_id, user_email, comment)
-	)
-	conn.commit()
-	conn.close()
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute(
+			"INSERT INTO ProjectComments (job_id, user_email, comment) VALUES (?, ?, ?)",
+			(job_id, user_email, comment)
+		)
+		conn.commit()
 
 def delete_project_comment(comment_id: int):
 	"""Удаляет комментарий к проекту (админская функция)"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("DELETE FROM ProjectComments WHERE id = ?", (comment_id,))
-	conn.commit()
-	conn.close()
-	return True
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("DELETE FROM ProjectComments WHERE id = ?", (comment_id,))
+		conn.commit()
+		return True
 
 def get_project_comments(job_id: int):
 	"""Получает все комментарии к проекту"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("""
-		SELECT c.*, u.name as user_name, u.avatar as user_avatar
-		FROM ProjectComments c
-		JOIN Users u ON c.user_email = u.email
-		WHERE c.job_id = ?
-		ORDER BY c.created_at ASC
-	""", (job_id,))
-	comments = cursor.fetchall()
-	conn.close()
-	return comments
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("""
+			SELECT c.*, u.name as user_name, u.avatar as user_avatar
+			FROM ProjectComments c
+			JOIN Users u ON c.user_email = u.email
+			WHERE c.job_id = ?
+			ORDER BY c.created_at ASC
+		""", (job_id,))
+		comments = cursor.fetchall()
+		return comments
 
 def get_all_project_comments():
 	"""Получает все комментарии в системе (админская функция)"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("""
-		SELECT c.*, u.name as user_name, u.avatar as user_avatar, j.title as job_title
-		FROM ProjectComments c
-		JOIN Users u ON c.user_email = u.email
-		JOIN Jobs j ON c.job_id = j.id
-		ORDER BY c.created_at DESC
-	""")
-	comments = cursor.fetchall()
-	conn.close()
-	return comments
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("""
+			SELECT c.*, u.name as user_name, u.avatar as user_avatar, j.title as job_title
+			FROM ProjectComments c
+			JOIN Users u ON c.user_email = u.email
+			JOIN Jobs j ON c.job_id = j.id
+			ORDER BY c.created_at DESC
+		""")
+		comments = cursor.fetchall()
+		return comments
 
 def can_user_comment_on_project(job_id: int, user_email: str):
 	"""Проверяет, может ли пользователь комментировать проект (только участники)"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	
-	# Получаем проект
-	cursor.execute("SELECT creator_email FROM Jobs WHERE id = ?", (job_id,))
-	job = cursor.fetchone()
-	if not job:
-		conn.close()
-		return False
-	
-	# Проверяем, является ли пользователь создателем проекта
-	if job['creator_email'] == user_email:
-		conn.close()
-		return True
+	with db_connection() as conn:
+		cursor = conn.cursor()
 	
-	# Проверяем, является ли пользователь принятым фрилансером
-	cursor.execute("""
-		SELECT id FROM Applications 
-		WHERE job_id = ? AND freelancer_email = ? AND status IN ('accepted', 'completed')
-	""", (job_id, user_email))
-	application = cursor.fetchone()
+		# Получаем проект
+		cursor.execute("SELECT creator_email FROM Jobs WHERE id = ?", (job_id,))
+		job = cursor.fetchone()
+		if not job:
+			return False
+	
+		# Проверяем, является ли пользователь создателем проекта
+		if job['creator_email'] == user_email:
+			return True
 	
-	conn.close()
-	return application is not None
+		# Проверяем, является ли пользователь принятым фрилансером
+		cursor.execute("""
+			SELECT id FROM Applications 
+			WHERE job_id = ? AND freelancer_email = ? AND status IN ('accepted', 'completed')
+		""", (job_id, user_email))
+		application = cursor.fetchone()
+	
+		return application is not None
 
 def get_project_participants(job_id: int):
 	"""Получает всех участников проекта (создатель + принятые фрилансеры)"""
-	conn = get_connection()
-	cursor = conn.cursor()
+	with db_connection() as conn:
+		cursor = conn.cursor()
 	
-	# Получаем создателя проекта
-	cursor.execute("""
-		SELECT j.creator_email, u.name, u.avatar, u.role
-		FROM Jobs j
-		JOIN Users u ON j.creator_email = u.email
-		WHERE j.id = ?
-	""", (job_id,))
-	creator = cursor.fetchone()
-	
-	# Получаем принятых фрилансеров
-	cursor.execute("""
-		SELECT a.freelancer_email, u.name, u.avatar, u.role, a.status
-		FROM Applications a
-		JOIN Users u ON a.freelancer_email = u.email
-		WHERE a.job_id = ? AND a.status IN ('accepted', 'completed')
-	""", (job_id,))
-	freelancers = cursor.fetchall()
+		# Получаем создателя проекта
+		cursor.execute("""
+			SELECT j.creator_email, u.name, u.avatar, u.role
+			FROM Jobs j
+			JOIN Users u ON j.creator_email = u.email
+			WHERE j.id = ?
+		""", (job_id,))
+		creator = cursor.fetchone()
+	
+		# Получаем принятых фрилансеров
+		cursor.execute("""
+			SELECT a.freelancer_email, u.name, u.avatar, u.role, a.status
+			FROM Applications a
+			JOIN Users u ON a.freelancer_email = u.email
+			WHERE a.job_id = ? AND a.status IN ('accepted', 'completed')
+		""", (job_id,))
+		freelancers = cursor.fetchall()
 	
-	conn.close()
 	
-	participants = []
-	if creator:
-		participants.append(dict(creator))
+		participants = []
+		if creator:
+			participants.append(dict(creator))
 	
-	for freelancer in freelancers:
-		participants.append(dict(freelancer))
+		for freelancer in freelancers:
+			participants.append(dict(freelancer))
 	
-	return participants
+		return participants
 
 
 # ===== АДМИНИСТРАТИВНЫЕ ФУНКЦИИ =====
 
 def create_admin_user():
 	"""Создает перманентного администратора системы"""
-	conn = get_connection()
-	cursor = conn.cursor()
+	with db_connection() as conn:
+		cursor = conn.cursor()
 	
-	# Проверяем, существует ли уже админ
-	cursor.execute("SELECT id FROM Users WHERE email = ?", ("admin@collabhub.com",))
-	existing_admin = cursor.fetchone()
+		# Проверяем, существует ли уже админ
+		cursor.execute("SELECT id FROM Users WHERE email = ?", ("admin@collabhub.com",))
+		existing_admin = cursor.fetchone()
 	
-	if existing_admin:
-		print("Администратор уже существует")
-		conn.close()
-		return
+		if existing_admin:
+			print("Администратор уже существует")
+			return
 	
-	# Создаем администратора
-	admin_password = hash_password("admin123")
-	cursor.execute("""
-		INSERT INTO Users (email, password, role, name, about_me, activity, skills)
-		VALUES (?, ?, ?, ?, ?, ?, ?)
-	""", (
-		"admin@collabhub.com",
-		admin_password,
-		"admin",
-		"Системный администратор",
-		"Администратор платформы CollabHub. Управляет системой и обеспечивает порядок.",
-		"Системное администрирование",
-		"Администрирование, Модерация, Управление системой"
-	))
-	
-	conn.commit()
-	conn.close()
-	print("Перманентный администратор создан: admin@collabhub.com / admin123")
+		# Создаем администратора
+		admin_password = hash_password("admin123")
+		cursor.execute("""
+			INSERT INTO Users (email, password, role, name, about_me, activity, skills)
+			VALUES (?, ?, ?, ?, ?, ?, ?)
+		""", (
+			"admin@collabhub.com",
+			admin_password,
+			"admin",
+			"Системный администратор",
+			"Администратор платформы CollabHub. Управляет системой и обеспечивает порядок.",
+			"Системное администрирование",
+			"Администрирование, Модерация, Управление системой"
+		))
+		sync_user_skills(cursor, cursor.lastrowid, "Администрирование, Модерация, Управление системой")
+	
+		conn.commit()
+		invalidate_user_cache(email="admin@collabhub.com")
+		print("Перманентный администратор создан: admin@collabhub.com / admin123")
 
 def is_admin(user_email: str) -> bool:
 	"""Проверяет, является ли пользователь администратором"""
-	conn = get_connection()
-	cursor = conn.cursor()
-	cursor.execute("SELECT role FROM Users WHERE email = ?", (user_email,))
-	user = cursor.fetchone()
-	conn.close()
-	return user and user['role'] == 'admin'
+	with db_connection() as conn:
+		cursor = conn.cursor()
+		cursor.execute("SELECT role FROM Users WHERE email = ?", (user_email,))
+		user = cursor.fetchone()
+		return user and user['role'] == 'admin'
 
 
 
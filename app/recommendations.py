@@ -0,0 +1,326 @@
+# Рекомендации проектов и исполнителей для CollabHub
+#
+# Тексты проектов (название, описание) и профилей фрилансеров (навыки,
+# деятельность, о себе) превращаются в TF-IDF векторы. Словарь не хранится:
+# слова хешируются в RECOMMEND_FEATURES признаков, поэтому новый текст можно
+# векторизовать без перестройки словаря. Близость - косинус нормированных
+# векторов, лучшие совпадения ищутся одним матричным произведением сразу для
+# пачки запросов.
+#
+# Индекс живет в памяти процесса. Основная матрица хранится транспонированной
+# (признак -> документы): запрос касается только строк своих слов, что на
+# 100 тыс. профилей укладывается в единицы миллисекунд. Изменения проектов и
+# профилей отмечаются через mark_job()/mark_user() и дописываются в небольшой
+# хвост при следующем запросе; старые строки гасятся маской. Полная
+# перестройка (она же обновляет IDF и подхватывает изменения из других
+# процессов) запускается фоновой задачей раз в RECOMMEND_REBUILD_SECONDS.
+
+import os
+import re
+import threading
+import time
+import zlib
+from functools import lru_cache
+
+import numpy as np
+from scipy import sparse
+
+from database import db_connection
+from tasks import task_registry
+
+# Число хешированных признаков
+RECOMMEND_FEATURES = int(os.getenv("RECOMMEND_FEATURES", str(1 << 18)))
+# Период полной перестройки индекса в секундах
+RECOMMEND_REBUILD_SECONDS = float(os.getenv("RECOMMEND_REBUILD_SECONDS", "600"))
+# Сколько измененных документов копить в хвосте до слияния с основной матрицей
+RECOMMEND_COMPACT_ROWS = int(os.getenv("RECOMMEND_COMPACT_ROWS", "1024"))
+# Запросов в одном матричном произведении
+RECOMMEND_QUERY_BATCH = int(os.getenv("RECOMMEND_QUERY_BATCH", "32"))
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+
+# Поля документов и их веса: навыки и название говорят о сути больше описания
+JOB_FIELDS = (("title", 2.0), ("description", 1.0))
+FREELANCER_FIELDS = (("skills", 2.0), ("activity", 1.0), ("about_me", 1.0))
+
+
+@lru_cache(maxsize=200_000)
+def _feature(token: str) -> int:
+    """Номер признака слова (crc32 стабилен между процессами, в отличие от hash())"""
+    return zlib.crc32(token.encode("utf-8")) % RECOMMEND_FEATURES
+
+
+def tokenize(text: str) -> list:
+    """Слова текста без учета регистра, ё приравнена к е"""
+    text = (text or "").casefold().replace("ё", "е")
+    return [token for token in TOKEN_RE.findall(text) if len(token) > 1]
+
+
+def tf_matrix(rows, fields):
+    """Матрица взвешенных частот признаков (строки - документы): (1 + log tf) * вес поля"""
+    matrix = sparse.csr_matrix((len(rows), RECOMMEND_FEATURES), dtype=np.float32)
+    for field, weight in fields:
+        features = []
+        lengths = []
+        for row in rows:
+            tokens = tokenize(row[field])
+            features.extend(map(_feature, tokens))
+            lengths.append(len(tokens))
+        # Повторы одного признака в строке суммируются при построении CSR
+        counts = sparse.csr_matrix(
+            (np.ones(len(features), dtype=np.float32), (np.repeat(np.arange(len(rows)), lengths), features)),
+            shape=(len(rows), RECOMMEND_FEATURES),
+        )
+        counts.data = (1.0 + np.log(counts.data)) * np.float32(weight)
+        matrix = matrix + counts
+    return matrix
+
+
+def inverse_document_frequency(*matrices):
+    """IDF признаков по всем документам: log((1 + N) / (1 + df)) + 1"""
+    documents = sum(matrix.shape[0] for matrix in matrices)
+    df = np.zeros(RECOMMEND_FEATURES, dtype=np.float32)
+    for matrix in matrices:
+        df += np.bincount(matrix.indices, minlength=RECOMMEND_FEATURES)
+    return (np.log((1.0 + documents) / (1.0 + df)) + 1.0).astype(np.float32)
+
+
+def weigh(matrix, idf):
+    """Применяет IDF к матрице частот и нормирует строки до единичной длины"""
+    matrix = matrix.copy()
+    matrix.data *= idf[matrix.indices]
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.csr_matrix(sparse.diags(1.0 / norms) @ matrix, dtype=np.float32)
+
+
+class VectorIndex:
+    """Нормированные векторы документов и поиск ближайших по косинусу.
+
+    Объект не меняется после создания: update() возвращает новый индекс,
+    поэтому запросы читают его без блокировок.
+    """
+
+    def __init__(self, ids, matrix):
+        self.main_ids = np.asarray(ids, dtype=np.int64)
+        self.postings = matrix.T.tocsr()  # признак -> документы основной части
+        self.tail_ids = np.empty(0, dtype=np.int64)
+        self.tail = sparse.csr_matrix((0, RECOMMEND_FEATURES), dtype=np.float32)
+        self.alive = np.ones(len(self.main_ids), dtype=bool)
+        self.ids = self.main_ids
+        self.rows = dict(zip(self.main_ids.tolist(), range(len(self.main_ids))))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def update(self, changed_ids, ids, matrix):
+        """Новый индекс без документов changed_ids и с добавленными строками matrix для ids"""
+        index = object.__new__(VectorIndex)
+        index.__dict__.update(self.__dict__)
+        index.alive = self.alive.copy()
+        index.rows = dict(self.rows)
+        for doc_id in changed_ids:
+            row = index.rows.pop(doc_id, None)
+            if row is not None:
+                index.alive[row] = False
+
+        # Пустые векторы (профиль без текста) не найдутся ни одним запросом
+        keep = np.flatnonzero(matrix.getnnz(axis=1))
+        if len(keep):
+            first_row = len(index.ids)
+            added_ids = np.asarray(ids, dtype=np.int64)[keep]
+            index.tail = sparse.vstack([self.tail, matrix[keep]], format="csr")
+            index.tail_ids = np.concatenate([self.tail_ids, added_ids])
+            index.ids = np.concatenate([index.main_ids, index.tail_ids])
+            index.alive = np.concatenate([index.alive, np.ones(len(keep), dtype=bool)])
+            index.rows.update(zip(added_ids.tolist(), range(first_row, first_row + len(keep))))
+
+        dead = len(index.alive) - len(index.rows)
+        if index.tail.shape[0] > RECOMMEND_COMPACT_ROWS or dead > max(RECOMMEND_COMPACT_ROWS, len(index.rows) // 4):
+            return index.compact()
+        return index
+
+    def compact(self):
+        """Сливает хвост с основной матрицей и убирает погашенные строки"""
+        matrix = sparse.vstack([self.postings.T, self.tail], format="csr")[self.alive]
+        return VectorIndex(self.ids[self.alive], matrix)
+
+    def top_k(self, queries, k: int) -> list:
+        """Для каждой строки queries - до k пар (id, косинус) с положительной близостью, лучшие первыми"""
+        results = []
+        for start in range(0, queries.shape[0], RECOMMEND_QUERY_BATCH):
+            batch = queries[start:start + RECOMMEND_QUERY_BATCH]
+            scores = (batch @ self.postings).toarray()
+            if self.tail.shape[0]:
+                scores = np.hstack([scores, (batch @ self.tail.T).toarray()])
+            scores[:, ~self.alive] = 0.0
+            for row in scores:
+                best = np.flatnonzero(row > 0)
+                if len(best) > k:
+                    best = best[np.argpartition(-row[best], k - 1)[:k]]
+                best = best[np.lexsort((self.ids[best], -row[best]))]
+                results.append([(int(self.ids[i]), float(row[i])) for i in best])
+        return results
+
+
+class IndexState:
+    """Снимок индексов: общий IDF, проекты и фрилансеры"""
+
+    def __init__(self, idf, jobs: VectorIndex, freelancers: VectorIndex):
+        self.idf = idf
+        self.jobs = jobs
+        self.freelancers = freelancers
+        self.built_at = time.monotonic()
+
+
+def load_jobs(cursor, job_ids=None):
+    """Открытые проекты - кандидаты в рекомендации (все или из списка id)"""
+    query = "SELECT id, title, description FROM Jobs WHERE status = 'open'"
+    if job_ids is not None:
+        query += f" AND id IN ({', '.join('?' * len(job_ids))})"
+    return cursor.execute(query, list(job_ids or [])).fetchall()
+
+
+def load_freelancers(cursor, user_ids=None):
+    """Профили фрилансеров (все или из списка id)"""
+    query = "SELECT id, skills, activity, about_me FROM Users WHERE role = 'freelancer'"
+    if user_ids is not None:
+        query += f" AND id IN ({', '.join('?' * len(user_ids))})"
+    return cursor.execute(query, list(user_ids or [])).fetchall()
+
+
+class Recommender:
+    """Индекс рекомендаций процесса: ленивое построение, дозапись изменений, фоновая перестройка"""
+
+    def __init__(self, rebuild_seconds: float = RECOMMEND_REBUILD_SECONDS):
+        self.rebuild_seconds = rebuild_seconds
+        self._state = None
+        # Растет при reset(): перестройка, начатая до сброса, не подменит индекс
+        self._generation = 0
+        self._build_lock = threading.Lock()
+        self._marks_lock = threading.Lock()
+        self._dirty_jobs = set()
+        self._dirty_users = set()
+        # Изменения, примененные к старому индексу во время фоновой перестройки
+        self._replay = None
+
+    def mark_job(self, job_id: int):
+        """Отмечает измененный, созданный или удаленный проект"""
+        with self._marks_lock:
+            self._dirty_jobs.add(job_id)
+
+    def mark_user(self, user_id: int):
+        """Отмечает измененный профиль пользователя"""
+        with self._marks_lock:
+            self._dirty_users.add(user_id)
+
+    def reset(self):
+        """Сбрасывает индекс; он будет построен заново при следующем запросе"""
+        with self._build_lock, self._marks_lock:
+            self._state = None
+            self._generation += 1
+            self._dirty_jobs.clear()
+            self._dirty_users.clear()
+
+    def build(self) -> IndexState:
+        """Строит индексы по всем открытым проектам и фрилансерам"""
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            jobs = load_jobs(cursor)
+            freelancers = load_freelancers(cursor)
+        job_tf = tf_matrix(jobs, JOB_FIELDS)
+        freelancer_tf = tf_matrix(freelancers, FREELANCER_FIELDS)
+        idf = inverse_document_frequency(job_tf, freelancer_tf)
+        return IndexState(
+            idf,
+            VectorIndex([job["id"] for job in jobs], weigh(job_tf, idf)),
+            VectorIndex([user["id"] for user in freelancers], weigh(freelancer_tf, idf)),
+        )
+
+    def rebuild(self, progress=None) -> dict:
+        """Полная перестройка индекса без остановки запросов (фоновая задача)"""
+        with self._marks_lock:
+            generation = self._generation
+            self._replay = (set(), set())
+        try:
+            state = self.build()
+        finally:
+            with self._marks_lock:
+                replay_jobs, replay_users = self._replay
+                self._replay = None
+                self._dirty_jobs |= replay_jobs
+                self._dirty_users |= replay_users
+        with self._build_lock:
+            if generation == self._generation:
+                self._state = state
+        return {"jobs": len(state.jobs), "freelancers": len(state.freelancers)}
+
+    def current(self, wait: bool = True):
+        """Актуальный снимок индекса с примененными отметками изменений.
+
+        Если индекс еще не построен, при wait=True он строится в текущем потоке,
+        иначе построение запускается в фоне и возвращается None.
+        """
+        state = self._state
+        if state is None:
+            if not wait:
+                task_registry.start("rebuild_recommendations", self.rebuild)
+                return None
+            with self._build_lock:
+                if self._state is None:
+                    self._state = self.build()
+                state = self._state
+        elif time.monotonic() - state.built_at > self.rebuild_seconds:
+            task_registry.start("rebuild_recommendations", self.rebuild)
+
+        with self._marks_lock:
+            job_ids, user_ids = self._dirty_jobs, self._dirty_users
+            self._dirty_jobs, self._dirty_users = set(), set()
+            if self._replay is not None:
+                self._replay[0].update(job_ids)
+                self._replay[1].update(user_ids)
+        if job_ids or user_ids:
+            with self._build_lock:
+                if self._state is not None:
+                    state = self._state = self._apply(self._state, job_ids, user_ids)
+        return state
+
+    @staticmethod
+    def _apply(state: IndexState, job_ids: set, user_ids: set) -> IndexState:
+        """Новый снимок с перечитанными из базы проектами и профилями"""
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            jobs = load_jobs(cursor, job_ids) if job_ids else []
+            freelancers = load_freelancers(cursor, user_ids) if user_ids else []
+        # Отмеченные id убираются из индекса; вернутся только найденные (открытые проекты, фрилансеры)
+        updated = IndexState(
+            state.idf,
+            state.jobs.update(job_ids, [job["id"] for job in jobs], weigh(tf_matrix(jobs, JOB_FIELDS), state.idf)),
+            state.freelancers.update(
+                user_ids, [user["id"] for user in freelancers],
+                weigh(tf_matrix(freelancers, FREELANCER_FIELDS), state.idf),
+            ),
+        )
+        updated.built_at = state.built_at
+        return updated
+
+    def candidates_for_jobs(self, jobs, k: int) -> list:
+        """Для каждого проекта - до k ближайших фрилансеров [(user_id, косинус)]"""
+        state = self.current()
+        queries = weigh(tf_matrix(jobs, JOB_FIELDS), state.idf)
+        return state.freelancers.top_k(queries, k)
+
+    def jobs_for_users(self, users, k: int, wait: bool = True) -> list:
+        """Для каждого профиля - до k ближайших открытых проектов [(job_id, косинус)].
+
+        С wait=False пока индекс строится, возвращает пустые списки.
+        """
+        state = self.current(wait)
+        if state is None:
+            return [[] for _ in users]
+        queries = weigh(tf_matrix(users, FREELANCER_FIELDS), state.idf)
+        return state.jobs.top_k(queries, k)
+
+
+# Общий индекс процесса
+recommender = Recommender()
@@ -3,129 +3,25 @@
 Скрипт для пересоздания базы данных с правильными FOREIGN KEY
 Запустите этот скрипт один раз для создания базы с правильными связями
 """
-import sqlite3
 import os
 import sys
 
 # Добавляем путь к модулям
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from database import get_connection
+from database import get_connection, drop_all_tables, init_db
 
 def recreate_db_with_fk():
     """Пересоздает базу данных с правильными FOREIGN KEY"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Включаем FOREIGN KEY
-    cursor.execute("PRAGMA foreign_keys = ON")
-    
     print("Удаление старых таблиц...")
-    # Удаляем таблицы в правильном порядке (с учетом зависимостей)
-    cursor.execute("DROP TABLE IF EXISTS Messages")
-    cursor.execute("DROP TABLE IF EXISTS Reviews")
-    cursor.execute("DROP TABLE IF EXISTS Applications")
-    cursor.execute("DROP TABLE IF EXISTS ProjectComments")
-    cursor.execute("DROP TABLE IF EXISTS Jobs")
-    cursor.execute("DROP TABLE IF EXISTS Users")
-    
-    print("Создание таблицы Users...")
-    cursor.execute("""
-        CREATE TABLE Users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL,
-            name TEXT,
-            avatar TEXT,
-            about_me TEXT,
-            activity TEXT,
-            skills TEXT,
-            rating REAL DEFAULT 0.0,
-            completed_projects INTEGER DEFAULT 0,
-            phone TEXT,
-            telegram TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            portfolio_files TEXT,
-            portfolio_links TEXT
-        )
-    """)
-    
-    print("Создание таблицы Jobs с FOREIGN KEY...")
-    cursor.execute("""
-        CREATE TABLE Jobs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            description TEXT NOT NULL,
-            deadline TEXT NOT NULL,
-            status TEXT NOT NULL,
-            creator_email TEXT NOT NULL,
-            priority TEXT DEFAULT 'medium',
-            files TEXT,
-            FOREIGN KEY (creator_email) REFERENCES Users(email)
-        )
-    """)
+    drop_all_tables()
     
-    print("Создание таблицы Applications с FOREIGN KEY...")
-    cursor.execute("""
-        CREATE TABLE Applications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            job_id INTEGER NOT NULL,
-            freelancer_email TEXT NOT NULL,
-            status TEXT NOT NULL DEFAULT 'pending',
-            UNIQUE(job_id, freelancer_email),
-            FOREIGN KEY (job_id) REFERENCES Jobs(id),
-            FOREIGN KEY (freelancer_email) REFERENCES Users(email)
-        )
-    """)
+    # Схема создается теми же миграциями, что и при запуске приложения
+    print("Создание таблиц...")
+    init_db()
     
-    print("Создание таблицы Reviews с FOREIGN KEY...")
-    cursor.execute("""
-        CREATE TABLE Reviews (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            job_id INTEGER NOT NULL,
-            freelancer_email TEXT NOT NULL,
-            client_email TEXT NOT NULL,
-            rating INTEGER NOT NULL CHECK (rating >= 1 AND rating <= 5),
-            comment TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(job_id, freelancer_email, client_email),
-            FOREIGN KEY (job_id) REFERENCES Jobs(id),
-            FOREIGN KEY (freelancer_email) REFERENCES Users(email),
-            FOREIGN KEY (client_email) REFERENCES Users(email)
-        )
-    """)
-    
-    print("Создание таблицы Messages с FOREIGN KEY...")
-    cursor.execute("""
-        CREATE TABLE Messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            sender_email TEXT NOT NULL,
-            receiver_email TEXT NOT NULL,
-            job_id INTEGER,
-            message TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            is_read BOOLEAN DEFAULT FALSE,
-            FOREIGN KEY (sender_email) REFERENCES Users(email),
-            FOREIGN KEY (receiver_email) REFERENCES Users(email),
-            FOREIGN KEY (job_id) REFERENCES Jobs(id)
-        )
-    """)
-    
-    print("Создание таблицы ProjectComments с FOREIGN KEY...")
-    cursor.execute("""
-        CREATE TABLE ProjectComments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            job_id INTEGER NOT NULL,
-            user_email TEXT NOT NULL,
-            comment TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (job_id) REFERENCES Jobs(id),
-            FOREIGN KEY (user_email) REFERENCES Users(email)
-        )
-    """)
-    
-    conn.commit()
+    conn = get_connection()
+    cursor = conn.cursor()
     
     # Проверяем FOREIGN KEY
     print("\n" + "="*50)
@@ -164,4 +60,3 @@ if __name__ == "__main__":
         recreate_db_with_fk()
     else:
         print("Отменено.")
-
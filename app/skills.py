@@ -0,0 +1,56 @@
+# Нормализованный индекс навыков пользователей для CollabHub
+#
+# В профиле навыки вводятся свободным текстом через запятую (Users.skills).
+# Для поиска они раскладываются в справочник Skills и таблицу связей
+# UserSkills: одинаковые навыки с разным регистром и пробелами ("React",
+# " react ") становятся одной записью, а выборка пользователей по набору
+# навыков идет по первичному ключу UserSkills, а не перебором строк Users.
+#
+# Приведение к нижнему регистру делается в Python: lower() в SQLite
+# понимает только латиницу, поэтому SQL-миграция не смогла бы разобрать
+# кириллические навыки так же, как профиль.
+
+
+def normalize_skill(name: str) -> str:
+    """Ключ навыка: без лишних пробелов и без учета регистра"""
+    return " ".join(name.split()).casefold()
+
+
+def parse_skills(skills: str) -> dict:
+    """Разбирает строку навыков через запятую: ключ -> название в написании пользователя"""
+    parsed = {}
+    for part in (skills or "").split(","):
+        name = " ".join(part.split())
+        if name:
+            parsed.setdefault(normalize_skill(name), name)
+    return parsed
+
+
+def sync_user_skills(cursor, user_id: int, skills: str):
+    """Приводит связи пользователя с навыками в соответствие со строкой Users.skills"""
+    wanted = parse_skills(skills)
+    if wanted:
+        cursor.executemany(
+            "INSERT INTO Skills (name, normalized) VALUES (?, ?) ON CONFLICT (normalized) DO NOTHING",
+            [(name, key) for key, name in wanted.items()]
+        )
+    placeholders = ", ".join("?" * len(wanted))
+    cursor.execute(
+        f"DELETE FROM UserSkills WHERE user_id = ? AND skill_id NOT IN "
+        f"(SELECT id FROM Skills WHERE normalized IN ({placeholders}))",
+        [user_id, *wanted]
+    )
+    if wanted:
+        cursor.execute(
+            f"INSERT OR IGNORE INTO UserSkills (user_id, skill_id) "
+            f"SELECT ?, id FROM Skills WHERE normalized IN ({placeholders})",
+            [user_id, *wanted]
+        )
+
+
+def rebuild_user_skills(cursor):
+    """Заново строит связи навыков для всех пользователей (миграция, тестовые данные)"""
+    cursor.execute("DELETE FROM UserSkills")
+    users = cursor.execute("SELECT id, skills FROM Users WHERE skills IS NOT NULL AND skills != ''").fetchall()
+    for user_id, skills in users:
+        sync_user_skills(cursor, user_id, skills)
@@ -0,0 +1,213 @@
+# Кэширование статики и загрузок для CollabHub
+#
+# Обычный StaticFiles не задает Cache-Control, поэтому браузер на каждой
+# странице заново сверяет main.css, скрипты и иконки. CachedStaticFiles
+# добавляет к нему политику кэширования:
+#
+# - шаблоны ссылаются на статику через static_url("css/main.css"), который
+#   дописывает к ссылке отпечаток содержимого (?v=<хеш>). Ссылка с верным
+#   отпечатком отдается как immutable на год: при изменении файла меняется
+#   и ссылка, поэтому повторные просмотры страниц не делают запросов к
+#   статике вовсе. Ссылки без отпечатка или со старым отпечатком
+#   кэшируются на max_age и сверяются по ETag;
+# - ETag строгий и считается по SHA-256 содержимого, а не по времени
+#   изменения, поэтому не меняется после пересборки или копирования файлов;
+#   If-None-Match отвечается 304 без тела;
+# - CSS и JS сжимаются в gzip и brotli один раз при первом обращении (или в
+#   prepare при запуске) и хранятся в памяти; клиенту отдается лучший из
+#   вариантов, который он принимает по Accept-Encoding.
+#
+# Хеши и сжатые варианты привязаны ко времени изменения и размеру файла и
+# пересчитываются, если файл поменялся; запись удаленного файла убирается
+# при первом запросе, не нашедшем его. Файлы в immutable_prefixes (блобы
+# загрузок) уже названы по хешу содержимого: их ETag берется из имени, и
+# файл для него не читается. brotli - необязательная зависимость: без нее
+# отдается только gzip.
+
+import gzip
+import hashlib
+import os
+import stat
+from email.utils import formatdate
+from mimetypes import guess_type
+from urllib.parse import parse_qs
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+
+try:
+    import brotli
+except ImportError:  # brotli не установлен - сжимаем только gzip
+    brotli = None
+
+# Кэш ссылок, которые не меняются никогда: отпечатки статики и блобы загрузок
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Длина отпечатка в ссылке
+FINGERPRINT_LENGTH = 12
+# Расширения файлов, для которых заранее строятся сжатые варианты
+PRECOMPRESS_EXTENSIONS = {".css", ".js"}
+# Меньшие файлы не сжимаются: выигрыш меньше накладных расходов
+PRECOMPRESS_MIN_SIZE = 512
+
+# Кодировка Content-Encoding -> функция сжатия, в порядке предпочтения
+COMPRESSORS = {"gzip": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+if brotli is not None:
+    COMPRESSORS = {"br": lambda data: brotli.compress(data, quality=11), **COMPRESSORS}
+
+_HASH_CHUNK_SIZE = 256 * 1024
+
+
+def accepted_encodings(header: str) -> set:
+    """Кодировки из Accept-Encoding, которые клиент принимает (q > 0)"""
+    encodings = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles с отпечатками ссылок, строгими ETag и сжатыми вариантами CSS/JS"""
+
+    def __init__(self, *args, max_age: int = 0, immutable_prefixes=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        # Сколько секунд кэшировать ссылки без верного отпечатка (0 - сверять каждый раз)
+        self.max_age = max_age
+        # Подпапки, файлы в которых никогда не меняются под своим именем ("blobs/")
+        self.immutable_prefixes = tuple(immutable_prefixes)
+        # Те же подпапки полными путями, как их возвращает lookup_path
+        self._immutable_paths = tuple(
+            os.path.join(self.resolve_directory(directory), prefix.replace("/", os.sep))
+            for directory in self.all_directories for prefix in self.immutable_prefixes
+        )
+        # Полный путь -> {"key": (mtime, размер), "sha256", "variants": {кодировка: байты}}
+        self._entries = {}
+
+    def entry(self, full_path: str, stat_result: os.stat_result) -> dict:
+        """Хеш и сжатые варианты файла; пересчитываются, только если файл изменился"""
+        key = (stat_result.st_mtime_ns, stat_result.st_size)
+        entry = self._entries.get(full_path)
+        if entry is not None and entry["key"] == key:
+            return entry
+
+        compress = (os.path.splitext(full_path)[1].lower() in PRECOMPRESS_EXTENSIONS
+                    and stat_result.st_size >= PRECOMPRESS_MIN_SIZE)
+        if not compress and full_path.startswith(self._immutable_paths):
+            # Имя блоба - хеш его содержимого (<хеш><расш.>)
+            entry = {"key": key, "sha256": os.path.basename(full_path).split(".")[0], "variants": {}}
+            self._entries[full_path] = entry
+            return entry
+
+        digest = hashlib.sha256()
+        chunks = []
+        with open(full_path, "rb") as source:
+            while chunk := source.read(_HASH_CHUNK_SIZE):
+                digest.update(chunk)
+                if compress:
+                    chunks.append(chunk)
+        variants = {}
+        if compress:
+            data = b"".join(chunks)
+            for encoding, compressor in COMPRESSORS.items():
+                compressed = compressor(data)
+                # Вариант, не ставший меньше оригинала, не нужен
+                if len(compressed) < len(data):
+                    variants[encoding] = compressed
+
+        entry = {"key": key, "sha256": digest.hexdigest(), "variants": variants}
+        self._entries[full_path] = entry
+        return entry
+
+    def resolve_directory(self, directory) -> str:
+        """Полный путь каталога так же, как его считает StaticFiles.lookup_path"""
+        return os.path.abspath(directory) if self.follow_symlink else os.path.realpath(directory)
+
+    def lookup_path(self, path: str):
+        # Вызывается в пуле потоков: заодно считаем хеш и сжатие, чтобы
+        # file_response в цикле событий брал их из памяти
+        full_path, stat_result = super().lookup_path(path)
+        if stat_result is None:
+            # Файл удален - его хеш и сжатые варианты больше не нужны
+            for directory in self.all_directories:
+                joined_path = os.path.join(directory, path)
+                self._entries.pop(self.resolve_directory(joined_path), None)
+        elif stat.S_ISREG(stat_result.st_mode):
+            self.entry(full_path, stat_result)
+        return full_path, stat_result
+
+    def fingerprint(self, path: str):
+        """Отпечаток содержимого файла по пути внутри каталога или None, если файла нет"""
+        full_path, stat_result = self.lookup_path(path)
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+            return None
+        return self.entry(full_path, stat_result)["sha256"][:FINGERPRINT_LENGTH]
+
+    def prepare(self):
+        """Считает хеши и сжатые варианты всех файлов каталога заранее, при запуске"""
+        for directory in self.all_directories:
+            # Ключи - полные пути, под которыми файлы ищет lookup_path
+            for dirpath, _, filenames in os.walk(self.resolve_directory(directory)):
+                for filename in filenames:
+                    full_path = os.path.join(dirpath, filename)
+                    self.entry(full_path, os.stat(full_path))
+
+    def cache_control(self, scope, sha256: str) -> str:
+        """Cache-Control ответа: immutable для ссылок, содержимое которых не меняется"""
+        path = self.get_path(scope).replace(os.sep, "/")
+        version = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("v", [""])[0]
+        if version == sha256[:FINGERPRINT_LENGTH] or path.startswith(self.immutable_prefixes):
+            return IMMUTABLE_CACHE_CONTROL
+        if self.max_age:
+            return f"public, max-age={self.max_age}"
+        return "no-cache"
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        entry = self.entry(full_path, stat_result)
+        headers = {"Cache-Control": self.cache_control(scope, entry["sha256"])}
+        if entry["variants"]:
+            headers["Vary"] = "Accept-Encoding"
+
+        # Диапазоны отдаются только из несжатого файла
+        encoding = None
+        if "range" not in request_headers:
+            accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+            encoding = next((name for name in entry["variants"] if name in accepted), None)
+
+        # Строгий ETag у каждого представления свой: сжатые байты отличаются от исходных
+        etag = entry["sha256"][:32] + (f"-{encoding}" if encoding else "")
+        headers["ETag"] = f'"{etag}"'
+
+        if encoding is None:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        else:
+            headers["Content-Encoding"] = encoding
+            headers["Last-Modified"] = formatdate(stat_result.st_mtime, usegmt=True)
+            media_type = guess_type(full_path)[0] or "text/plain"
+            response = Response(entry["variants"][encoding], status_code=status_code, headers=headers,
+                                media_type=media_type)
+        if self.is_not_modified(response.headers, request_headers):
+            return Response(status_code=304, headers={
+                name: value for name, value in response.headers.items()
+                if name in ("cache-control", "etag", "vary", "last-modified")
+            })
+        return response
+
+    def is_not_modified(self, response_headers: Headers, request_headers: Headers) -> bool:
+        # При наличии If-None-Match дата изменения не учитывается (RFC 9110, 13.1.3)
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is None:
+            return super().is_not_modified(response_headers, request_headers)
+        if if_none_match.strip() == "*":
+            return True
+        etag = response_headers.get("etag")
+        return etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
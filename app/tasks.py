@@ -0,0 +1,131 @@
+# Фоновые задачи для CollabHub
+#
+# Долгие административные операции (пересчет статистики, очистка файлов)
+# не должны выполняться внутри запроса: при большом объеме данных запрос
+# упирается в таймаут. Маршрут запускает задачу через task_registry и сразу
+# возвращает ее id, а состояние, прогресс и длительность доступны по
+# /admin/tasks/{id}.
+#
+# Задачи выполняются в отдельном пуле потоков, чтобы не занимать потоки
+# async_models, обслуживающие обычные запросы. Реестр живет в памяти
+# процесса и хранит ограниченную историю последних задач.
+
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Одновременно выполняемых задач
+TASK_WORKERS = int(os.getenv("TASK_WORKERS", "2"))
+# Сколько завершенных задач хранить для просмотра
+TASK_HISTORY_SIZE = int(os.getenv("TASK_HISTORY_SIZE", "50"))
+
+
+class Task:
+    """Фоновая задача: состояние, прогресс и результат"""
+
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = "pending"  # pending -> running -> done | failed
+        self.done = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def report(self, done: int, total: int = None):
+        """Обновляет прогресс; вызывается из потока задачи"""
+        self.done = done
+        if total is not None:
+            self.total = total
+
+    @property
+    def running(self) -> bool:
+        return self.status in ("pending", "running")
+
+    @property
+    def duration(self):
+        """Длительность выполнения в секундах (для незавершенной - на текущий момент)"""
+        if self.started_at is None:
+            return None
+        return round((self.finished_at or time.time()) - self.started_at, 3)
+
+    def to_dict(self) -> dict:
+        """Состояние задачи для JSON ответа"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "done": self.done,
+            "total": self.total,
+            "progress": round(self.done / self.total, 3) if self.total else None,
+            "duration": self.duration,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class TaskRegistry:
+    """Запуск фоновых задач и учет их состояния"""
+
+    def __init__(self, workers: int = TASK_WORKERS, history_size: int = TASK_HISTORY_SIZE):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="task")
+        self._tasks = OrderedDict()
+        self._lock = threading.Lock()
+        self.history_size = history_size
+
+    def start(self, name: str, func, *args, **kwargs) -> Task:
+        """Запускает func(*args, progress=task.report, **kwargs) в фоне.
+
+        Если задача с тем же именем еще выполняется, возвращает ее вместо
+        запуска второй копии.
+        """
+        with self._lock:
+            for task in self._tasks.values():
+                if task.name == name and task.running:
+                    return task
+            task = Task(name)
+            self._tasks[task.id] = task
+            self._trim()
+        self._executor.submit(self._run, task, func, args, kwargs)
+        return task
+
+    def _run(self, task: Task, func, args, kwargs):
+        task.status = "running"
+        task.started_at = time.time()
+        try:
+            task.result = func(*args, progress=task.report, **kwargs)
+            task.status = "done"
+        except Exception as e:
+            task.error = str(e)
+            task.status = "failed"
+            traceback.print_exc()
+        finally:
+            task.finished_at = time.time()
+        print(f"Задача {task.name} ({task.id}): {task.status} за {task.duration} с")
+
+    def _trim(self):
+        """Удаляет самые старые завершенные задачи сверх лимита истории"""
+        finished = [task_id for task_id, task in self._tasks.items() if not task.running]
+        for task_id in finished[:max(0, len(self._tasks) - self.history_size)]:
+            del self._tasks[task_id]
+
+    def get(self, task_id: str):
+        """Возвращает задачу по id или None"""
+        with self._lock:
+            return self._tasks.get(task_id)
+
+    def list(self) -> list:
+        """Задачи, новые первыми"""
+        with self._lock:
+            return list(reversed(self._tasks.values()))
+
+
+# Общий реестр процесса
+task_registry = TaskRegistry()
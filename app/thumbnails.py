@@ -0,0 +1,137 @@
+# Уменьшенные копии аватарок для CollabHub
+#
+# Аватарки показываются кружками 24-80 px, а загружаются фотографиями на
+# несколько мегабайт. Шаблоны ссылаются на /thumbs/<размер>/<исходный путь>
+# через фильтр avatar_url: размер подбирается из THUMBNAIL_SIZES под
+# экраны с двойной плотностью пикселей.
+#
+# Копия строится при загрузке аватарки или лениво при первом запросе и
+# хранится на диске в THUMBNAIL_DIR рядом с загрузками, в WebP и JPEG
+# (для браузеров без WebP). Повторные запросы отдают готовый файл.
+#
+# Pillow - необязательная зависимость: без нее фильтр возвращает исходный
+# путь, и аватарки показываются как раньше.
+
+import os
+import re
+import tempfile
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow не установлен - отдаем оригиналы
+    Image = None
+
+# Стороны квадратных копий в пикселях
+THUMBNAIL_SIZES = (48, 96, 160)
+# Качество сжатия копий
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+# Расширения исходных файлов, для которых строятся копии
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+# Формат копии -> (формат Pillow, MIME-тип)
+THUMBNAIL_FORMATS = {"webp": ("WEBP", "image/webp"), "jpg": ("JPEG", "image/jpeg")}
+
+DEFAULT_AVATAR = "/static/defaultAvatar.jpg"
+
+_SAFE_PATH_RE = re.compile(r"[\w./-]+")
+
+
+def thumbnail_size(css_size: int) -> int:
+    """Наименьший размер копии, достаточный для css_size на экране с двойной плотностью"""
+    for size in THUMBNAIL_SIZES:
+        if size >= css_size * 2:
+            return size
+    return THUMBNAIL_SIZES[-1]
+
+
+class Thumbnailer:
+    """Построение и кэш уменьшенных копий изображений из каталогов roots"""
+
+    def __init__(self, roots: dict, cache_dir: Path):
+        # Первый сегмент URL -> каталог на диске: {"uploads": Path("uploads"), "static": Path("static")}
+        self.roots = {name: Path(root) for name, root in roots.items()}
+        self.cache_dir = Path(cache_dir)
+
+    @property
+    def available(self) -> bool:
+        return Image is not None
+
+    def url(self, path: str, css_size: int) -> str:
+        """Ссылка на копию аватарки для показа в css_size пикселей (фильтр avatar_url)"""
+        path = path or DEFAULT_AVATAR
+        if not self.available or self.resolve(path.lstrip("/")) is None:
+            return path
+        return f"/thumbs/{thumbnail_size(css_size)}{path}"
+
+    def resolve(self, source: str):
+        """Файл изображения по пути без ведущего слеша ("uploads/blobs/..") или None"""
+        root_name, _, relative = source.partition("/")
+        root = self.roots.get(root_name)
+        # Пустые сегменты и "." дали бы второй ключ кэша для того же исходника
+        if (root is None or not _SAFE_PATH_RE.fullmatch(relative)
+                or {"", ".", ".."} & set(relative.split("/")) or Path(relative).suffix.lower() not in IMAGE_EXTENSIONS):
+            return None
+        path = root / relative
+        # Копии сами лежат под корнем uploads: копия копии порождала бы бесконечную
+        # цепочку все более глубоких файлов из одного исходника
+        if Path(os.path.abspath(path)).is_relative_to(os.path.abspath(self.cache_dir)):
+            return None
+        return path
+
+    def cached_path(self, size: int, source: str, fmt: str) -> Path:
+        """Где лежит копия: <cache_dir>/<размер>/<исходный путь>.<формат>"""
+        return self.cache_dir / str(size) / f"{source}.{fmt}"
+
+    def source_path(self, cached: Path):
+        """Исходный файл копии из кэша или None, если путь не похож на копию"""
+        size, _, rest = Path(cached).relative_to(self.cache_dir).as_posix().partition("/")
+        source, _, fmt = rest.rpartition(".")
+        if not size.isdigit() or fmt not in THUMBNAIL_FORMATS:
+            return None
+        return self.resolve(source)
+
+    def get(self, size: int, source: str, fmt: str = "webp"):
+        """Путь к готовой копии, при необходимости строит ее; None, если копию не построить"""
+        path = self.cached_path(size, source, fmt)
+        if path.exists():
+            return path
+        if self.generate(source, sizes=(size,), formats=(fmt,)):
+            return path
+        return None
+
+    def generate(self, source: str, sizes=THUMBNAIL_SIZES, formats=tuple(THUMBNAIL_FORMATS)) -> bool:
+        """Строит копии изображения во всех размерах и форматах за одно чтение исходника"""
+        file_path = self.resolve(source)
+        if not self.available or file_path is None or not file_path.is_file():
+            return False
+        try:
+            with Image.open(file_path) as image:
+                image = ImageOps.exif_transpose(image)
+                image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+                for size in sizes:
+                    thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+                    for fmt in formats:
+                        self._save(thumbnail, self.cached_path(size, source, fmt), fmt)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            print(f"Не удалось построить копию {source}: {e}")
+            return False
+        return True
+
+    @staticmethod
+    def _save(image, path: Path, fmt: str):
+        """Атомарно записывает копию: параллельный запрос не увидит недописанный файл"""
+        pillow_format, _ = THUMBNAIL_FORMATS[fmt]
+        if pillow_format == "JPEG" and image.mode == "RGBA":
+            # У JPEG нет прозрачности - подкладываем белый фон
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=".thumb-", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as target:
+                image.save(target, pillow_format, quality=THUMBNAIL_QUALITY)
+            os.replace(temp_path, path)
+        except BaseException:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
@@ -0,0 +1,241 @@
+# Сборка мусора в каталоге загрузок для CollabHub
+#
+# Файлы загрузок остаются на диске после того, как на них перестают
+# ссылаться: удаленные проекты, файлы, убранные из портфолио, смененные
+# аватарки, загрузки формы, оборвавшиеся на одном из нескольких файлов, и
+# временные файлы упавших загрузок. UploadCollector периодически делает
+# mark-and-sweep каталога загрузок:
+#
+# - mark: все пути /uploads/..., упомянутые в Users.avatar,
+#   Users.portfolio_files и Jobs.files. Пути ищутся регулярным выражением
+#   в тексте поля, поэтому поле с битым JSON не приводит к удалению файлов;
+# - sweep: обход каталога; удаляются файлы без ссылок, которые старше
+#   периода ожидания, и уменьшенные копии, исходник которых уже удален.
+#   Период ожидания защищает загрузки, поле владельца которых еще не
+#   сохранено. Для блобов время берется из UploadBlobs.uploaded_at -
+#   повторная загрузка того же содержимого продлевает жизнь файла.
+#
+# Блоб удаляется в транзакции BEGIN IMMEDIATE, которая заново проверяет
+# ref_count и uploaded_at: ссылка, появившаяся после mark, или параллельная
+# загрузка того же содержимого (store_blob сначала обновляет запись) блоб
+# сохраняют.
+#
+# Обход ограничен UPLOAD_GC_OPS_PER_SECOND файловыми операциями в секунду,
+# чтобы очистка большого каталога не забирала диск у обычных запросов.
+# Запуск с dry_run=True ничего не удаляет и только возвращает отчет.
+# Пустые каталоги не удаляются: загрузка могла только что создать каталог
+# для нового блоба.
+
+import itertools
+import os
+import re
+import time
+from pathlib import Path
+
+from database import db_connection
+from tasks import task_registry
+from uploads import BLOBS_DIR
+
+# Сколько секунд файл без ссылок живет до удаления
+UPLOAD_GC_GRACE_SECONDS = float(os.getenv("UPLOAD_GC_GRACE_SECONDS", str(24 * 3600)))
+# Ограничение файловых операций (просмотр и удаление файла) в секунду; 0 - без ограничения
+UPLOAD_GC_OPS_PER_SECOND = float(os.getenv("UPLOAD_GC_OPS_PER_SECOND", "500"))
+# Как часто очистка запускается автоматически; 0 - только вручную
+UPLOAD_GC_INTERVAL_SECONDS = float(os.getenv("UPLOAD_GC_INTERVAL_SECONDS", str(24 * 3600)))
+# Сколько удаляемых файлов перечислять в отчете
+UPLOAD_GC_SAMPLE_SIZE = 50
+
+_UPLOAD_REF_RE = re.compile(r"/uploads/[\w./-]+")
+
+
+class Throttle:
+    """Ограничивает число операций в секунду, засыпая между ними"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        self.next_at = max(self.next_at, now) + self.interval
+
+
+def referenced_uploads() -> set:
+    """Все пути /uploads/..., на которые ссылаются поля БД"""
+    with db_connection() as conn:
+        rows = conn.execute("""
+            SELECT avatar FROM Users WHERE avatar LIKE '%/uploads/%'
+            UNION ALL
+            SELECT portfolio_files FROM Users WHERE portfolio_files LIKE '%/uploads/%'
+            UNION ALL
+            SELECT files FROM Jobs WHERE files LIKE '%/uploads/%'
+        """).fetchall()
+    return {path for row in rows for path in _UPLOAD_REF_RE.findall(row[0])}
+
+
+class UploadCollector:
+    """Удаление файлов каталога загрузок, на которые не ссылается БД"""
+
+    def __init__(self, root: Path, thumbnailer=None, interval_seconds: float = UPLOAD_GC_INTERVAL_SECONDS):
+        self.root = Path(root)
+        # Копии в thumbnailer.cache_dir проверяются по наличию исходника, а не по ссылкам
+        self.thumbnailer = thumbnailer
+        self.interval_seconds = interval_seconds
+        # Первая автоматическая очистка - через интервал после запуска процесса
+        self._last_started = time.monotonic()
+
+    def start(self, dry_run: bool = True):
+        """Запускает очистку фоновой задачей и возвращает задачу"""
+        self._last_started = time.monotonic()
+        name = "upload_gc_dry_run" if dry_run else "upload_gc"
+        return task_registry.start(name, self.collect, dry_run=dry_run)
+
+    def maybe_start(self):
+        """Запускает очистку, если с прошлого запуска прошло больше interval_seconds"""
+        if self.interval_seconds and time.monotonic() - self._last_started > self.interval_seconds:
+            self.start(dry_run=False)
+
+    def collect(self, dry_run: bool = True, grace_seconds: float = UPLOAD_GC_GRACE_SECONDS,
+                ops_per_second: float = UPLOAD_GC_OPS_PER_SECOND, progress=None) -> dict:
+        """Mark-and-sweep каталога загрузок; возвращает отчет об удаленных (при dry_run - удаляемых) файлах"""
+        referenced = referenced_uploads()
+        modifier = f"-{int(grace_seconds)} seconds"
+        with db_connection() as conn:
+            blobs = {row["path"]: (row["ref_count"], row["expired"]) for row in conn.execute(
+                "SELECT path, ref_count, uploaded_at < datetime('now', ?) AS expired FROM UploadBlobs",
+                (modifier,)
+            )}
+        cutoff = time.time() - grace_seconds
+        throttle = Throttle(ops_per_second)
+        report = {
+            "dry_run": dry_run, "grace_seconds": grace_seconds, "referenced": len(referenced),
+            "scanned": 0, "in_grace": 0, "orphans": 0, "orphan_bytes": 0,
+            "deleted": 0, "freed_bytes": 0, "stale_rows": 0, "sample": [],
+        }
+
+        thumbs_dir = self.thumbnailer.cache_dir if self.thumbnailer else None
+        scans = [self._scan(self.root, throttle, skip=thumbs_dir)]
+        if thumbs_dir is not None:
+            # Копии проверяются последними: копии только что удаленных файлов - тоже мусор
+            scans.append(self._scan(thumbs_dir, throttle))
+        seen_blobs = set()
+        for entry in itertools.chain(*scans):
+            report["scanned"] += 1
+            if progress and report["scanned"] % 100 == 0:
+                progress(report["scanned"])
+            url = "/uploads/" + Path(entry.path).relative_to(self.root).as_posix()
+            if url in blobs:
+                seen_blobs.add(url)
+            orphan = self._classify(entry, url, referenced, blobs, cutoff, thumbs_dir)
+            if orphan is not None:
+                self._sweep(entry, url, *orphan, dry_run, throttle, modifier, report)
+
+        # Записи о блобах, файлов которых уже нет на диске
+        for url, (ref_count, expired) in blobs.items():
+            if url not in seen_blobs and not ref_count and expired:
+                report["stale_rows"] += 1
+                if not dry_run:
+                    self._delete_blob_row(url, modifier)
+
+        if progress:
+            progress(report["scanned"], report["scanned"])
+        print(f"Очистка загрузок{' (пробный запуск)' if dry_run else ''}: просмотрено {report['scanned']}, "
+              f"без ссылок {report['orphans']} ({report['orphan_bytes']} байт), удалено {report['deleted']}")
+        return report
+
+    def _scan(self, directory: Path, throttle: Throttle, skip: Path = None):
+        """Файлы каталога и подкаталогов, не быстрее ограничения throttle"""
+        skip = os.path.abspath(skip) if skip is not None else None
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if os.path.abspath(entry.path) != skip:
+                    yield from self._scan(Path(entry.path), throttle, skip)
+            elif entry.is_file(follow_symlinks=False):
+                throttle.wait()
+                yield entry
+
+    def _classify(self, entry, url: str, referenced: set, blobs: dict, cutoff: float, thumbs_dir):
+        """(вид, срок ожидания истек) для файла без ссылок; None, если файл нужен"""
+        if thumbs_dir is not None and Path(entry.path).is_relative_to(thumbs_dir):
+            source = self.thumbnailer.source_path(entry.path)
+            if source is not None and source.is_file():
+                return None
+            return "thumb", entry.stat().st_mtime < cutoff
+        if url in referenced:
+            return None
+        if entry.name.endswith(".part"):
+            return "partial", entry.stat().st_mtime < cutoff
+        if url.startswith(f"/uploads/{BLOBS_DIR}/"):
+            if url in blobs:
+                ref_count, expired = blobs[url]
+                return "blob", bool(expired) and not ref_count
+            return "blob", entry.stat().st_mtime < cutoff
+        return "file", entry.stat().st_mtime < cutoff
+
+    def _sweep(self, entry, url: str, kind: str, expired: bool, dry_run: bool,
+               throttle: Throttle, modifier: str, report: dict):
+        """Учитывает файл без ссылок в отчете и удаляет его, если срок ожидания истек"""
+        if not expired:
+            report["in_grace"] += 1
+            return
+        try:
+            size = entry.stat().st_size
+        except FileNotFoundError:
+            return
+        report["orphans"] += 1
+        report["orphan_bytes"] += size
+        if len(report["sample"]) < UPLOAD_GC_SAMPLE_SIZE:
+            report["sample"].append({"path": url, "kind": kind, "size": size})
+        if dry_run:
+            return
+
+        throttle.wait()
+        if kind == "blob":
+            deleted = self._delete_blob(Path(entry.path), url, modifier)
+        else:
+            try:
+                os.unlink(entry.path)
+                deleted = True
+            except FileNotFoundError:
+                deleted = False
+        if deleted:
+            report["deleted"] += 1
+            report["freed_bytes"] += size
+
+    @staticmethod
+    def _delete_blob(path: Path, url: str, modifier: str) -> bool:
+        """Удаляет блоб и его запись, если на него по-прежнему нет ссылок и он не загружался заново"""
+        with db_connection() as conn:
+            # Блокировка записи: store_blob и sync_upload_refs ждут, пока файл не удален
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT ref_count, uploaded_at < datetime('now', ?) AS expired FROM UploadBlobs WHERE path = ?",
+                (modifier, url)
+            ).fetchone()
+            # Файл без записи (загрузка упала до нее) проверен по времени изменения
+            if row is not None and (row["ref_count"] or not row["expired"]):
+                conn.rollback()
+                return False
+            conn.execute("DELETE FROM UploadBlobs WHERE path = ?", (url,))
+            path.unlink(missing_ok=True)
+            conn.commit()
+        return True
+
+    @staticmethod
+    def _delete_blob_row(url: str, modifier: str):
+        """Удаляет запись о блобе без файла, если на него нет ссылок"""
+        with db_connection() as conn:
+            conn.execute("""
+                DELETE FROM UploadBlobs
+                WHERE path = ? AND ref_count = 0 AND uploaded_at < datetime('now', ?)
+            """, (url, modifier))
+            conn.commit()
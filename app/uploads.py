@@ -0,0 +1,149 @@
+# Сохранение загруженных файлов для CollabHub
+#
+# Файл из формы не читается в память целиком: содержимое копируется кусками
+# по UPLOAD_CHUNK_SIZE во временный файл, и копирование прерывается, как
+# только превышен допустимый размер. Копирование блокирует поток, поэтому
+# выполняется в отдельном ограниченном пуле потоков, а не в цикле событий.
+# На одну загрузку в памяти находится не больше одного куска, на все сразу -
+# не больше UPLOAD_WORKERS кусков.
+#
+# Файлы хранятся по хешу содержимого: SHA-256 считается по тем же кускам во
+# время копирования, и файл кладется в uploads/blobs/<2 символа>/<хеш><расш.>.
+# Повторная загрузка того же аватара или PDF находит готовый блоб: временный
+# файл удаляется без fsync и переименования, а на диске остается одна копия.
+# Блоб определяется хешем и расширением: те же байты, загруженные как .txt и
+# как .png, хранятся двумя файлами, и каждый отдается со своим типом.
+# Новый блоб сбрасывается на диск (fsync) и атомарно переименовывается в
+# итоговое имя, поэтому недописанный файл никогда не виден по своей ссылке.
+#
+# Блобы общие, поэтому файл не удаляется вместе с полем владельца: ссылки
+# Users.avatar, Users.portfolio_files и Jobs.files учитываются в UploadRefs
+# (sync_upload_refs в транзакции изменения владельца), а триггеры ведут
+# UploadBlobs.ref_count. Файлы без ссылок удаляет сборщик мусора upload_gc.
+
+import asyncio
+import functools
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from constants import MAX_FILE_SIZE
+from database import db_connection
+
+# Размер куска копирования
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(256 * 1024)))
+# Одновременно записываемых загрузок
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+
+# Папка блобов внутри каталога загрузок и их публичный префикс
+BLOBS_DIR = "blobs"
+BLOB_URL_PREFIX = f"/uploads/{BLOBS_DIR}/"
+
+_upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+
+
+class UploadTooLarge(ValueError):
+    """Загрузка превысила допустимый размер"""
+
+
+def fsync_directory(directory: Path):
+    """Сбрасывает на диск запись каталога, чтобы переименование пережило сбой питания"""
+    # На Windows каталог нельзя открыть для fsync - там переименование остается как есть
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def copy_limited(source, target, max_size: int = MAX_FILE_SIZE, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """Копирует source в target кусками, считая SHA-256; возвращает (хеш, размер)"""
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := source.read(chunk_size):
+        size += len(chunk)
+        if size > max_size:
+            raise UploadTooLarge(f"Файл больше {max_size} байт")
+        digest.update(chunk)
+        target.write(chunk)
+    return digest.hexdigest(), size
+
+
+def is_blob_path(path: str) -> bool:
+    """Ссылка указывает на файл хранилища блобов"""
+    return bool(path) and path.startswith(BLOB_URL_PREFIX)
+
+
+def store_blob(source, root: Path, extension: str, max_size: int = MAX_FILE_SIZE,
+               chunk_size: int = UPLOAD_CHUNK_SIZE) -> dict:
+    """Сохраняет поток в хранилище блобов под каталогом загрузок root.
+
+    Возвращает {"sha256", "path", "size", "created"}; created=False, если такое
+    содержимое уже было и новый файл не записывался.
+    """
+    root = Path(root)
+    blobs = root / BLOBS_DIR
+    blobs.mkdir(parents=True, exist_ok=True)
+    # Временный файл в той же файловой системе: os.replace атомарен только в ее пределах
+    fd, temp_path = tempfile.mkstemp(dir=blobs, prefix=".upload-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as target:
+            sha256, size = copy_limited(source, target, max_size, chunk_size)
+            # Запись обновляется до проверки файла: свежий uploaded_at не дает сборщику
+            # мусора (upload_gc) удалить блоб, который эта загрузка переиспользует, а
+            # если он успел удалить файл раньше - файл ниже будет записан заново.
+            # Расширение входит в путь: по нему /uploads выбирает Content-Type
+            path = f"{BLOB_URL_PREFIX}{sha256[:2]}/{sha256}{extension.lower()}"
+            with db_connection() as conn:
+                conn.execute("""
+                    INSERT INTO UploadBlobs (path, sha256, size) VALUES (?, ?, ?)
+                    ON CONFLICT (path) DO UPDATE SET uploaded_at = CURRENT_TIMESTAMP
+                """, (path, sha256, size))
+                conn.commit()
+            file_path = root / path[len("/uploads/"):]
+            created = not file_path.exists()
+            if created:
+                target.flush()
+                os.fsync(target.fileno())
+        if created:
+            file_path.parent.mkdir(exist_ok=True)
+            os.replace(temp_path, file_path)
+            fsync_directory(file_path.parent)
+        else:
+            os.unlink(temp_path)
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+    return {"sha256": sha256, "path": path, "size": size, "created": created}
+
+
+async def run_upload_io(func, *args, **kwargs):
+    """Выполняет блокирующую работу с файлами загрузок в пуле потоков загрузок"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_upload_executor, functools.partial(func, *args, **kwargs))
+
+
+async def save_blob(source, root: Path, extension: str, max_size: int = MAX_FILE_SIZE) -> dict:
+    """Выполняет store_blob в пуле потоков загрузок"""
+    return await run_upload_io(store_blob, source, root, extension, max_size)
+
+
+def sync_upload_refs(cursor, owner_type: str, owner_id: int, paths):
+    """Приводит ссылки владельца на блобы в соответствие со списком путей его поля"""
+    wanted = sorted({path for path in paths or [] if is_blob_path(path)})
+    placeholders = ", ".join("?" * len(wanted))
+    cursor.execute(
+        f"DELETE FROM UploadRefs WHERE owner_type = ? AND owner_id = ? AND path NOT IN ({placeholders})",
+        [owner_type, owner_id, *wanted]
+    )
+    if wanted:
+        # Ссылка ставится только на известный блоб
+        cursor.execute(
+            f"INSERT OR IGNORE INTO UploadRefs (owner_type, owner_id, path) "
+            f"SELECT ?, ?, path FROM UploadBlobs WHERE path IN ({placeholders})",
+            [owner_type, owner_id, *wanted]
+        )
@@ -1,22 +1,14 @@
 import sqlite3
-from database import init_db
+from database import init_db, drop_all_tables
+
+# Удаляем таблицы и создаем их заново миграциями
+drop_all_tables()
+init_db()
 
 conn = sqlite3.connect('freelance.db')
 conn.execute('PRAGMA foreign_keys = ON')
 cursor = conn.cursor()
 
-# Удаляем таблицы
-cursor.execute('DROP TABLE IF EXISTS Messages')
-cursor.execute('DROP TABLE IF EXISTS Reviews')
-cursor.execute('DROP TABLE IF EXISTS Applications')
-cursor.execute('DROP TABLE IF EXISTS ProjectComments')
-cursor.execute('DROP TABLE IF EXISTS Jobs')
-cursor.execute('DROP TABLE IF EXISTS Users')
-conn.commit()
-
-# Создаем таблицы заново
-init_db()
-
 # Проверяем SQL определения
 tables = ['Jobs', 'Applications', 'Reviews', 'Messages', 'ProjectComments']
 for table in tables:
@@ -12,7 +12,8 @@ import sys
 sys.path.insert(0, str(Path(__file__).parent.parent / 'app'))
 
 from database import init_db, get_connection
-from models import create_user, get_user_by_email
+from models import create_user, get_user_by_email, user_cache
+from recommendations import recommender
 
 
 @pytest.fixture
@@ -22,9 +23,11 @@ def test_db():
     fd, db_path = tempfile.mkstemp(suffix='.db')
     os.close(fd)
     
-    # Инициализируем БД
+    # Инициализируем БД; кэш пользователей и индекс рекомендаций процесса не должны пережить смену базы
     os.environ['DATABASE_URL'] = db_path
     init_db()
+    user_cache.clear()
+    recommender.reset()
     
     yield db_path
     
@@ -45,3 +45,122 @@ class TestAPI:
         """Тест страницы профиля без авторизации"""
         response = client.get("/profile")
         assert response.status_code == 302  # Redirect to login
+
+
+class TestRequestUserContext:
+    """Тесты загрузки пользователя один раз на запрос"""
+    
+    @pytest.fixture
+    def client(self, test_db):
+        """Создает клиента и администратора с обычным пользователем"""
+        from models import create_user, hash_password
+        create_user('admin@example.com', hash_password('secret'), 'admin', 'Admin')
+        create_user('client@example.com', hash_password('secret'), 'client', 'Client')
+        return TestClient(app)
+    
+    @pytest.fixture
+    def lookups(self, monkeypatch):
+        """Считает обращения к БД за пользователем и его правами"""
+        import async_models
+        calls = []
+        for name in ('get_user_by_email', 'get_unread_messages_count', 'is_admin'):
+            original = getattr(async_models, name)
+            
+            async def counting(*args, _name=name, _original=original, **kwargs):
+                calls.append(_name)
+                return await _original(*args, **kwargs)
+            
+            monkeypatch.setattr(async_models, name, counting)
+        return calls
+    
+    def test_admin_page_resolves_user_once(self, client, lookups):
+        """Пользователь и счетчик читаются один раз, права берутся из той же записи"""
+        response = client.get("/admin", cookies={"user_email": "admin@example.com"})
+        assert response.status_code == 200
+        assert sorted(lookups) == ['get_unread_messages_count', 'get_user_by_email']
+    
+    def test_admin_pages_require_admin_role(self, client):
+        """Административные страницы закрыты для остальных пользователей"""
+        response = client.get("/admin", cookies={"user_email": "client@example.com"})
+        assert response.status_code == 403
+        response = client.get("/admin/jobs", cookies={"user_email": "client@example.com"})
+        assert response.status_code == 403
+        response = client.get("/admin/update-stats", cookies={"user_email": "client@example.com"})
+        assert response.status_code == 403
+
+
+class TestJobSearchAPI:
+    """Тесты поиска проектов через API и главную страницу"""
+    
+    @pytest.fixture
+    def client(self, test_db):
+        """Создает заказчика и несколько проектов про дизайн"""
+        from models import create_user, create_job
+        create_user('client@example.com', 'hash', 'client', 'Client')
+        for i in range(3):
+            create_job(f'Дизайн баннера {i}', 'Нужен баннер', '2099-01-01', 'client@example.com')
+        create_job('Перевод документации', 'Технический текст', '2099-01-01', 'client@example.com')
+        return TestClient(app)
+    
+    def test_api_pages_through_results(self, client):
+        """API отдает найденные проекты страницами по курсору"""
+        first = client.get("/api/jobs/search", params={"q": "дизайн", "limit": 2}).json()
+        assert len(first["jobs"]) == 2
+        second = client.get("/api/jobs/search", params={"q": "дизайн", "limit": 2, "cursor": first["next_cursor"]}).json()
+        assert second["next_cursor"] is None
+        titles = [job["title"] for job in first["jobs"] + second["jobs"]]
+        assert sorted(titles) == [f'Дизайн баннера {i}' for i in range(3)]
+        
+        response = client.get("/api/jobs/search", params={"q": "дизайн", "cursor": "broken"})
+        assert response.status_code == 400
+    
+    def test_pages_cross_candidate_windows(self, client, monkeypatch):
+        """Поиск проходит все окна совпадений: каждый видимый проект ровно один раз"""
+        import models
+        monkeypatch.setattr(models, 'SEARCH_CANDIDATES', 2)
+        for i in range(3, 8):
+            models.create_job(f'Дизайн баннера {i}', 'Нужен баннер', '2099-01-01', 'client@example.com')
+        # Самые новые совпадения скрыты от гостей и не должны давать пустых страниц
+        for job in models.get_jobs()[:2]:
+            models.update_job(job['id'], job['title'], 'Нужен баннер', '2099-01-01', 'in_progress')
+        
+        for limit in (1, 2, 3):
+            titles, cursor = [], None
+            while True:
+                page = client.get("/api/jobs/search", params={"q": "дизайн", "limit": limit, "cursor": cursor}).json()
+                assert page["jobs"] or not titles
+                titles += [job["title"] for job in page["jobs"]]
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    break
+            assert sorted(titles) == [f'Дизайн баннера {i}' for i in range(6)]
+    
+    def test_home_page_search(self, client):
+        """Параметр q на главной показывает только найденные проекты"""
+        response = client.get("/", params={"q": "документации"})
+        assert response.status_code == 200
+        assert 'Перевод документации' in response.text
+        assert 'Дизайн баннера' not in response.text
+
+
+class TestProfilesDirectory:
+    """Тесты каталога пользователей"""
+    
+    @pytest.fixture
+    def client(self, test_db):
+        """Создает фрилансеров с навыками и авторизованного клиента"""
+        from models import create_user, get_user_by_email, update_user_profile
+        for email, skills in (('py@example.com', 'Python, SQL'), ('js@example.com', 'JavaScript')):
+            create_user(email, 'hash', 'freelancer', email.split('@')[0])
+            update_user_profile(get_user_by_email(email)['id'], skills=skills)
+        return TestClient(app, cookies={"user_email": 'py@example.com'})
+    
+    def test_filter_by_skills(self, client):
+        """Фильтр по навыкам показывает только подходящих пользователей"""
+        response = client.get("/profiles", params={"skills": "sql, PYTHON"})
+        assert response.status_code == 200
+        assert 'py@example.com' in response.text
+        assert 'js@example.com' not in response.text
+        
+        response = client.get("/profiles", params={"after": "broken"})
+        assert response.status_code == 400
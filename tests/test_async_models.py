@@ -0,0 +1,67 @@
+"""
+Тесты асинхронного слоя доступа к данным
+"""
+import asyncio
+import threading
+import time
+
+import async_models
+from models import create_user, hash_password
+
+
+class TestAsyncModels:
+    """Тесты выполнения функций models.py вне цикла событий"""
+
+    def test_wrapper_returns_model_result(self, test_db):
+        """Асинхронная обертка возвращает то же, что и синхронная функция"""
+        create_user("async@example.com", hash_password("secret"), "client", "Async User")
+
+        async def scenario():
+            user = await async_models.get_user_by_email("async@example.com")
+            valid = await async_models.verify_password("secret", user["password"])
+            invalid = await async_models.verify_password("wrong", user["password"])
+            return user, valid, invalid
+
+        user, valid, invalid = asyncio.run(scenario())
+        assert user["name"] == "Async User"
+        assert valid is True
+        assert invalid is False
+
+    def test_calls_run_in_dedicated_threads(self):
+        """Запросы к БД и хэширование идут в своих пулах потоков"""
+        def thread_name():
+            return threading.current_thread().name
+
+        async def scenario():
+            return await async_models.run_db(thread_name), await async_models.run_hash(thread_name)
+
+        db_thread, hash_thread = asyncio.run(scenario())
+        assert db_thread.startswith("db")
+        assert hash_thread.startswith("bcrypt")
+
+    def test_event_loop_responsive_during_login_storm(self):
+        """Хэширование паролей не останавливает цикл событий"""
+        hashed = hash_password("secret")
+
+        async def scenario():
+            gaps = []
+            done = asyncio.Event()
+
+            async def ticker():
+                last = time.perf_counter()
+                while not done.is_set():
+                    await asyncio.sleep(0.001)
+                    now = time.perf_counter()
+                    gaps.append(now - last)
+                    last = now
+
+            tick_task = asyncio.create_task(ticker())
+            await asyncio.gather(*(async_models.verify_password("secret", hashed) for _ in range(8)))
+            done.set()
+            await tick_task
+            return gaps
+
+        gaps = asyncio.run(scenario())
+        assert gaps
+        # Без пула потоков каждая проверка bcrypt блокировала бы цикл на сотни миллисекунд
+        assert max(gaps) < 0.05
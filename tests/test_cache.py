@@ -0,0 +1,78 @@
+"""
+Тесты кэша в памяти процесса
+"""
+from cache import TTLCache
+
+
+class FakeClock:
+    """Управляемые часы для проверки времени жизни записей"""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    """Тесты LRU-кэша с временем жизни"""
+    
+    def test_hit_and_miss_counters(self):
+        """Повторное чтение попадает в кэш, загрузчик вызывается один раз"""
+        cache = TTLCache(maxsize=4, ttl=10)
+        loads = []
+        
+        for _ in range(3):
+            assert cache.get_or_load("key", lambda: loads.append(1) or "value") == "value"
+        
+        assert len(loads) == 1
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["size"]) == (2, 1, 1)
+    
+    def test_none_is_cached(self):
+        """Отсутствующий объект тоже кэшируется"""
+        cache = TTLCache()
+        loads = []
+        
+        cache.get_or_load("missing", lambda: loads.append(1))
+        cache.get_or_load("missing", lambda: loads.append(1))
+        
+        assert len(loads) == 1
+    
+    def test_entries_expire(self):
+        """Устаревшая запись считается промахом и удаляется"""
+        clock = FakeClock()
+        cache = TTLCache(ttl=5, clock=clock)
+        cache.set("key", "value")
+        
+        clock.now = 4.9
+        assert cache.get("key") == "value"
+        clock.now = 5.0
+        assert cache.get("key") is None
+        assert cache.stats()["expirations"] == 1
+        assert cache.stats()["size"] == 0
+    
+    def test_least_recently_used_evicted(self):
+        """При переполнении вытесняется давно не использованная запись"""
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.stats()["evictions"] == 1
+    
+    def test_invalidate_if(self):
+        """Выборочный сброс по ключу и значению"""
+        cache = TTLCache()
+        cache.set(("email", "a"), {"id": 1})
+        cache.set(("id", 1), {"id": 1})
+        cache.set(("id", 2), {"id": 2})
+        
+        cache.invalidate_if(lambda key, value: value["id"] == 1)
+        
+        assert cache.stats()["size"] == 1
+        assert cache.get(("id", 2)) == {"id": 2}
@@ -0,0 +1,88 @@
+"""
+Тесты доставки сообщений чата через WebSocket
+"""
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from main import app
+from chat_hub import ChatHub, conversation_key
+from models import create_user, create_access_token, hash_password
+
+
+def auth_headers(email):
+    """Заголовок авторизации с JWT токеном пользователя"""
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+
+class TestChatHub:
+    """Тесты хаба публикации сообщений"""
+
+    def test_key_ignores_participant_order(self):
+        """Диалог не зависит от порядка собеседников, обычный чат отделен от проектного"""
+        assert conversation_key("a@example.com", "b@example.com") == conversation_key("b@example.com", "a@example.com")
+        assert conversation_key("a@example.com", "b@example.com", 0) == conversation_key("a@example.com", "b@example.com")
+        assert conversation_key("a@example.com", "b@example.com", 1) != conversation_key("a@example.com", "b@example.com")
+
+    def test_publish_reaches_only_conversation_subscribers(self):
+        """Сообщение получают только подписчики своего диалога"""
+        async def scenario():
+            hub = ChatHub()
+            pair = hub.subscribe("a@example.com", "b@example.com")
+            project = hub.subscribe("a@example.com", "b@example.com", 7)
+            other = hub.subscribe("a@example.com", "c@example.com")
+            message = {"id": 1, "sender_email": "b@example.com", "receiver_email": "a@example.com", "job_id": None}
+            delivered = hub.publish(message)
+            return delivered, pair.queue.qsize(), project.queue.qsize(), other.queue.qsize()
+
+        assert asyncio.run(scenario()) == (1, 1, 0, 0)
+
+    def test_overflow_and_unsubscribe(self):
+        """Переполненная подписка помечается, отписка освобождает диалог"""
+        async def scenario():
+            hub = ChatHub()
+            subscription = hub.subscribe("a@example.com", "b@example.com")
+            message = {"id": 1, "sender_email": "a@example.com", "receiver_email": "b@example.com"}
+            for _ in range(subscription.queue.maxsize + 1):
+                hub.publish(message)
+            overflowed = subscription.overflowed
+            hub.unsubscribe(subscription)
+            return overflowed, hub.subscriber_count()
+
+        assert asyncio.run(scenario()) == (True, 0)
+
+
+class TestChatWebSocket:
+    """Тесты WebSocket эндпоинта чата"""
+
+    @pytest.fixture
+    def users(self, test_db):
+        """Создает двух собеседников"""
+        create_user("alice@example.com", hash_password("secret"), "client", "Alice")
+        create_user("bob@example.com", hash_password("secret"), "freelancer", "Bob")
+        return "alice@example.com", "bob@example.com"
+
+    def test_message_pushed_to_recipient(self, users):
+        """Отправленное сообщение приходит собеседнику по сокету и отмечается прочитанным"""
+        alice, bob = users
+        with TestClient(app) as client:
+            with client.websocket_connect(f"/ws/chat/{bob}", headers=auth_headers(alice)) as websocket:
+                response = client.post("/api/messages/send", headers=auth_headers(bob),
+                                       data={"receiver_email": alice, "message": "Привет"})
+                assert response.json()["status"] == "success"
+                message = websocket.receive_json()
+            unread = client.get(f"/api/messages/{alice}", headers=auth_headers(bob)).json()
+
+        assert message["message"] == "Привет"
+        assert message["sender_email"] == bob
+        assert message["id"] > 0
+        assert all(msg["is_read"] for msg in unread["messages"])
+
+    def test_unauthenticated_connection_rejected(self, users):
+        """Без авторизации соединение закрывается"""
+        _, bob = users
+        with TestClient(app) as client:
+            with pytest.raises(WebSocketDisconnect):
+                with client.websocket_connect(f"/ws/chat/{bob}") as websocket:
+                    websocket.receive_json()
@@ -0,0 +1,293 @@
+"""
+Тесты для слоя работы с базой данных
+"""
+import sqlite3
+import threading
+import pytest
+from database import (
+    ConnectionPool, db_connection, get_pool, get_connection, get_pragma_report,
+    init_db, get_schema_version, MIGRATIONS, INDEXES,
+)
+import models
+
+
+class TestConnectionPool:
+    """Тесты пула подключений"""
+    
+    def test_connections_are_configured_once(self, test_db):
+        """Подключения из пула уже настроены и переиспользуются"""
+        with db_connection() as conn:
+            assert conn.row_factory is sqlite3.Row
+            assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+            first = conn
+        
+        with db_connection() as conn:
+            assert conn is first
+    
+    def test_pool_follows_database_path(self, test_db):
+        """Пул пересоздается при смене пути к БД"""
+        assert get_pool().db_path == test_db
+    
+    def test_uncommitted_transaction_is_rolled_back(self, test_db):
+        """Незавершенная транзакция откатывается при возврате подключения"""
+        with db_connection() as conn:
+            conn.execute("INSERT INTO Users (email, password, role) VALUES ('tx@example.com', 'x', 'client')")
+            assert conn.in_transaction
+        
+        with db_connection() as conn:
+            assert not conn.in_transaction
+            row = conn.execute("SELECT id FROM Users WHERE email = 'tx@example.com'").fetchone()
+            assert row is None
+    
+    def test_broken_connection_is_replaced(self, test_db):
+        """Закрытое подключение не выдается повторно"""
+        pool = ConnectionPool(test_db, max_size=2)
+        conn = pool.acquire()
+        pool.release(conn)
+        conn.close()
+        
+        with pool.connection() as fresh:
+            assert fresh is not conn
+            assert fresh.execute("SELECT 1").fetchone()[0] == 1
+        pool.close()
+    
+    def test_pool_is_bounded(self, test_db):
+        """Пул не выдает больше max_size подключений одновременно"""
+        pool = ConnectionPool(test_db, max_size=1, timeout=0.1)
+        conn = pool.acquire()
+        with pytest.raises(TimeoutError):
+            pool.acquire()
+        
+        # После возврата подключение снова доступно, в том числе из другого потока
+        pool.release(conn)
+        result = []
+        thread = threading.Thread(target=lambda: result.append(pool.acquire()))
+        thread.start()
+        thread.join()
+        assert result == [conn]
+        pool.release(conn)
+        pool.close()
+
+
+class TestPragmaProfiles:
+    """Тесты профилей настроек SQLite"""
+    
+    def test_default_profile_enables_wal(self, test_db, monkeypatch):
+        """Профиль по умолчанию включает WAL и таймаут ожидания блокировки"""
+        monkeypatch.delenv("DB_PRAGMA_PROFILE", raising=False)
+        monkeypatch.delenv("RENDER", raising=False)
+        report = get_pragma_report()
+        assert report["profile"] == "development"
+        assert report["journal_mode"] == "wal"
+        assert report["busy_timeout"] == 5000
+        assert report["synchronous"] == 1  # NORMAL
+        assert report["temp_store"] == 2  # MEMORY
+    
+    def test_profile_is_selected_by_environment(self, test_db, monkeypatch):
+        """Профиль выбирается переменной окружения"""
+        monkeypatch.setenv("DB_PRAGMA_PROFILE", "legacy")
+        conn = get_connection()
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 2  # FULL
+        conn.close()
+        
+        monkeypatch.setenv("DB_PRAGMA_PROFILE", "unknown")
+        with pytest.raises(ValueError):
+            get_connection()
+    
+    def test_readers_do_not_block_writer(self, test_db):
+        """В режиме WAL открытая читающая транзакция не мешает записи"""
+        reader = get_connection()
+        reader.execute("BEGIN")
+        reader.execute("SELECT COUNT(*) FROM Users").fetchone()
+        
+        with db_connection() as writer:
+            writer.execute("INSERT INTO Users (email, password, role) VALUES ('w@example.com', 'x', 'client')")
+            writer.commit()
+        
+        reader.rollback()
+        reader.close()
+
+
+class TestMigrations:
+    """Тесты миграций схемы"""
+    
+    def test_restart_keeps_data(self, test_db):
+        """Повторная инициализация не удаляет данные и ничего не применяет"""
+        with db_connection() as conn:
+            conn.execute("INSERT INTO Users (email, password, role) VALUES ('keep@example.com', 'x', 'client')")
+            conn.commit()
+        
+        assert init_db() == []
+        
+        with db_connection() as conn:
+            row = conn.execute("SELECT email FROM Users WHERE email = 'keep@example.com'").fetchone()
+            assert row is not None
+            assert get_schema_version(conn) == MIGRATIONS[-1][0]
+    
+    def test_legacy_database_is_adopted(self, tmp_path, monkeypatch):
+        """БД, созданная до появления миграций, принимается без потери данных"""
+        db_path = str(tmp_path / "legacy.db")
+        monkeypatch.setenv("DATABASE_URL", db_path)
+        legacy = sqlite3.connect(db_path)
+        legacy.execute(MIGRATIONS[0][2][0])
+        legacy.execute("INSERT INTO Users (email, password, role) VALUES ('old@example.com', 'x', 'client')")
+        legacy.commit()
+        legacy.close()
+        
+        assert init_db() == [version for version, _, _ in MIGRATIONS]
+        with db_connection() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM Users").fetchone()[0] == 1
+    
+    def test_unread_counters_backfilled(self, tmp_path, monkeypatch):
+        """Счетчики непрочитанных заполняются по сообщениям, существовавшим до миграции"""
+        db_path = str(tmp_path / "messages.db")
+        monkeypatch.setenv("DATABASE_URL", db_path)
+        legacy = sqlite3.connect(db_path)
+        for statement in MIGRATIONS[0][2]:
+            legacy.execute(statement)
+        legacy.execute("INSERT INTO Users (email, password, role) VALUES ('a@example.com', 'x', 'client')")
+        legacy.execute("INSERT INTO Users (email, password, role) VALUES ('b@example.com', 'x', 'client')")
+        for is_read in (0, 0, 1):
+            legacy.execute(
+                "INSERT INTO Messages (sender_email, receiver_email, message, is_read) VALUES ('a@example.com', 'b@example.com', 'hi', ?)",
+                (is_read,),
+            )
+        legacy.commit()
+        legacy.close()
+        
+        init_db()
+        assert models.get_unread_messages_count("b@example.com") == 2
+        assert models.get_unread_messages_count("a@example.com") == 0
+    
+    def test_search_index_backfilled(self, tmp_path, monkeypatch):
+        """Проекты, существовавшие до миграции, попадают в поисковый индекс"""
+        db_path = str(tmp_path / "jobs.db")
+        monkeypatch.setenv("DATABASE_URL", db_path)
+        legacy = sqlite3.connect(db_path)
+        for statement in MIGRATIONS[0][2]:
+            legacy.execute(statement)
+        legacy.execute("INSERT INTO Users (email, password, role) VALUES ('c@example.com', 'x', 'client')")
+        legacy.execute(
+            "INSERT INTO Jobs (title, description, deadline, creator_email, status) "
+            "VALUES ('Перевод статьи', 'Текст', '2099-01-01', 'c@example.com', 'open')"
+        )
+        legacy.commit()
+        legacy.close()
+        
+        init_db()
+        assert [job["title"] for job in models.search_jobs("перевод")] == ["Перевод статьи"]
+    
+    def test_upload_refs_rekeyed_by_path(self, tmp_path, monkeypatch):
+        """Блобы и ссылки на них переносятся на ключ по пути, триггеры продолжают вести счетчик"""
+        import database
+        
+        monkeypatch.setenv("DATABASE_URL", str(tmp_path / "blobs.db"))
+        monkeypatch.setattr(database, "MIGRATIONS", [m for m in MIGRATIONS if m[0] < 10])
+        init_db()
+        path = "/uploads/blobs/ab/abc.png"
+        with db_connection() as conn:
+            conn.execute("INSERT INTO UploadBlobs (sha256, path, size) VALUES ('abc', ?, 3)", (path,))
+            conn.execute("INSERT INTO UploadRefs (owner_type, owner_id, sha256) VALUES ('user', 1, 'abc')")
+            conn.commit()
+        
+        monkeypatch.setattr(database, "MIGRATIONS", MIGRATIONS)
+        init_db()
+        with db_connection() as conn:
+            assert conn.execute("SELECT path FROM UploadRefs").fetchall()[0]["path"] == path
+            assert conn.execute("SELECT ref_count FROM UploadBlobs").fetchone()[0] == 1
+            conn.execute("DELETE FROM UploadRefs")
+            assert conn.execute("SELECT ref_count FROM UploadBlobs").fetchone()[0] == 0
+            conn.rollback()
+    
+    def test_conversations_split_per_user(self, tmp_path, monkeypatch):
+        """Сводка по парам участников переносится в строки каждого участника"""
+        import database
+        
+        monkeypatch.setenv("DATABASE_URL", str(tmp_path / "inbox.db"))
+        monkeypatch.setattr(database, "MIGRATIONS", [m for m in MIGRATIONS if m[0] < 11])
+        init_db()
+        models.create_user("a@example.com", "x", "client", "A")
+        models.create_user("b@example.com", "x", "client", "B")
+        models.create_message("a@example.com", "b@example.com", "first")
+        models.create_message("b@example.com", "a@example.com", "second")
+        
+        monkeypatch.setattr(database, "MIGRATIONS", MIGRATIONS)
+        init_db()
+        for email, other, unread in (("a@example.com", "b@example.com", 1), ("b@example.com", "a@example.com", 1)):
+            conversation, = models.get_user_conversations(email)
+            assert (conversation["other_user_email"], conversation["snippet"]) == (other, "second")
+            assert conversation["unread_count"] == unread
+    
+    def test_failed_migration_is_rolled_back(self, test_db, monkeypatch):
+        """Ошибка в миграции откатывает все ее шаги"""
+        import database
+        
+        broken = (MIGRATIONS[-1][0] + 1, "Сломанная миграция", [
+            "CREATE TABLE Temp (id INTEGER)",
+            "SELECT * FROM MissingTable",
+        ])
+        monkeypatch.setattr(database, "MIGRATIONS", MIGRATIONS + [broken])
+        
+        with pytest.raises(sqlite3.OperationalError):
+            init_db()
+        
+        with db_connection() as conn:
+            assert get_schema_version(conn) == MIGRATIONS[-1][0]
+            table = conn.execute("SELECT name FROM sqlite_master WHERE name = 'Temp'").fetchone()
+            assert table is None
+
+
+def query_plans(func, *args):
+    """Выполняет функцию модели и возвращает планы всех ее SELECT-запросов"""
+    statements = []
+    # Пул выдает последнее возвращенное подключение, поэтому функция получит это же
+    with db_connection() as conn:
+        conn.set_trace_callback(statements.append)
+    try:
+        func(*args)
+    finally:
+        with db_connection() as conn:
+            conn.set_trace_callback(None)
+            plans = []
+            for statement in statements:
+                if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+                    rows = conn.execute("EXPLAIN QUERY PLAN " + statement).fetchall()
+                    plans.append(" | ".join(row["detail"] for row in rows))
+    return plans
+
+
+class TestIndexes:
+    """Тесты использования индексов горячими запросами"""
+    
+    def test_catalogue_is_created(self, test_db):
+        """Все индексы каталога созданы миграциями"""
+        with db_connection() as conn:
+            names = {row["name"] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert set(INDEXES) <= names
+    
+    @pytest.mark.parametrize("func, args, index", [
+        (models.get_messages_between_users, ("a@example.com", "b@example.com"), "idx_messages_pair"),
+        (models.get_messages_between_users, ("a@example.com", "b@example.com", 1), "idx_messages_pair"),
+        (models.get_messages_between_users, ("a@example.com", "b@example.com", None, 5), "idx_messages_pair"),
+        (models.get_message_history, ("a@example.com", "b@example.com"), "idx_messages_pair"),
+        (models.get_message_history, ("a@example.com", "b@example.com", 1, 10), "idx_messages_pair"),
+        (models.get_unread_messages_count, ("a@example.com",), "sqlite_autoindex_UnreadCounters_1"),
+        (models.get_user_conversations, ("a@example.com",), "idx_conversations_user"),
+        (models.get_applications_for_client, ("a@example.com",), "idx_jobs_creator"),
+        (models.get_applications_by_freelancer, ("a@example.com",), "idx_applications_freelancer"),
+        (models.get_reviews_for_freelancer, ("a@example.com",), "idx_reviews_freelancer"),
+        (models.get_project_comments, (1,), "idx_comments_job"),
+        (models.get_jobs, ("open",), "idx_jobs_status"),
+    ])
+    def test_query_uses_index(self, test_db, func, args, index):
+        """Запрос использует предназначенный для него индекс"""
+        plans = query_plans(func, *args)
+        assert plans
+        assert any(index in plan for plan in plans), plans
+    
+    def test_conversations_read_without_sort(self, test_db):
+        """Список диалогов читается одним проходом по индексу, без сортировки и группировки"""
+        plans = [plan for plan in query_plans(models.get_user_conversations, "a@example.com")
+                 if "idx_conversations_user" in plan]
+        assert len(plans) == 1
+        assert "TEMP B-TREE" not in plans[0] and "COMPOUND" not in plans[0], plans
@@ -2,7 +2,16 @@
 Тесты для моделей данных
 """
 import pytest
-from models import create_job, get_job_by_id, apply_to_job, get_applications
+
+import models
+from models import (
+    create_job, get_job_by_id, apply_to_job, get_applications,
+    create_user, get_jobs, update_application_status, build_job_feed, count_jobs,
+    get_visible_jobs, update_job,
+    get_project_participants, has_user_applied_to_job, get_user_application_status,
+    create_message, get_messages_between_users, get_message_history, mark_messages_as_read, hash_password,
+    get_user_conversations, delete_job, search_jobs, build_search_query,
+)
 
 
 class TestModels:
@@ -69,3 +78,588 @@ class TestModels:
         # Несуществующий проект
         job = get_job_by_id(99999)
         assert job is None
+
+
+class TestJobFeed:
+    """Тесты пакетной сборки ленты проектов"""
+    
+    @pytest.fixture
+    def feed_data(self, test_db):
+        """Создает клиента, двух фрилансеров и проекты с откликами"""
+        create_user('client@example.com', 'hash', 'client', name='Client')
+        create_user('f1@example.com', 'hash', 'freelancer', name='Freelancer One')
+        create_user('f2@example.com', 'hash', 'freelancer', name='Freelancer Two')
+        create_job('Job A', 'Desc A', '2099-01-01', 'client@example.com')
+        create_job('Job B', 'Desc B', '2099-01-02', 'client@example.com')
+        job_b, job_a = [job['id'] for job in get_jobs()]
+        apply_to_job(job_a, 'f1@example.com')
+        apply_to_job(job_a, 'f2@example.com')
+        apply_to_job(job_b, 'f2@example.com')
+        accepted = [app for app in get_applications(job_b) if app['freelancer_email'] == 'f2@example.com'][0]
+        update_application_status(accepted['id'], 'accepted')
+        return job_a, job_b
+    
+    def test_feed_matches_per_job_lookups(self, feed_data):
+        """Лента совпадает с результатами поштучных запросов"""
+        feed = build_job_feed(get_jobs(), 'f2@example.com', 'freelancer')
+        assert len(feed) == 2
+        
+        for job in feed:
+            expected_apps = [dict(app) for app in get_applications(job['id'])]
+            assert job['applications'] == expected_apps
+            assert job['applications_count'] == len(expected_apps)
+            assert job['participants'] == get_project_participants(job['id'])
+            assert job['creator_name'] == 'Client'
+            assert job['has_applied'] == has_user_applied_to_job(job['id'], 'f2@example.com')
+            assert job['application_status'] == get_user_application_status(job['id'], 'f2@example.com')
+    
+    def test_feed_uses_fixed_number_of_connections(self, feed_data, monkeypatch):
+        """Количество подключений не зависит от числа проектов"""
+        import models
+        
+        for i in range(20):
+            create_job(f'Extra {i}', 'Desc', '2099-01-01', 'client@example.com')
+        
+        opened = []
+        original = models.db_connection
+        
+        def counting_connection():
+            opened.append(1)
+            return original()
+        
+        monkeypatch.setattr(models, 'db_connection', counting_connection)
+        feed = build_job_feed(get_jobs(), 'f1@example.com', 'freelancer')
+        
+        assert len(feed) == 22
+        assert len(opened) == 2  # get_jobs + build_job_feed
+    
+    def test_visible_jobs_hide_taken_projects(self, feed_data):
+        """Проекты с принятым исполнителем скрыты от посторонних"""
+        job_a, job_b = feed_data
+        
+        # Неавторизованные видят только открытые проекты без принятого исполнителя
+        assert [job['id'] for job in get_visible_jobs()] == [job_a]
+        
+        # Проекты в работе видны всем авторизованным пользователям
+        assert {job['id'] for job in get_visible_jobs('f1@example.com', 'freelancer')} == {job_a, job_b}
+        
+        # Открытый проект с принятым исполнителем виден только откликнувшимся
+        update_job(job_b, 'Job B', 'Desc B', '2099-01-02', 'open')
+        assert {job['id'] for job in get_visible_jobs('f2@example.com', 'freelancer')} == {job_a, job_b}
+        assert [job['id'] for job in get_visible_jobs('f1@example.com', 'freelancer')] == [job_a]
+        update_job(job_b, 'Job B', 'Desc B', '2099-01-02', 'in_progress')
+        
+        # Создатель видит все свои проекты
+        assert {job['id'] for job in get_visible_jobs('client@example.com', 'client')} == {job_a, job_b}
+        
+        # Фильтр по статусу применяется поверх правил видимости
+        assert [job['id'] for job in get_visible_jobs('client@example.com', 'client', 'in_progress')] == [job_b]
+    
+    def test_keyset_pagination(self, feed_data):
+        """Страницы по курсору не пересекаются и покрывают все проекты"""
+        for i in range(5):
+            create_job(f'Extra {i}', 'Desc', '2099-01-01', 'client@example.com')
+        
+        all_ids = [job['id'] for job in get_jobs()]
+        assert all_ids == sorted(all_ids, reverse=True)
+        
+        seen, cursor = [], None
+        while True:
+            page = get_jobs(before_id=cursor, limit=3)
+            if not page:
+                break
+            seen.extend(job['id'] for job in page)
+            cursor = page[-1]['id']
+        assert seen == all_ids
+        
+        visible = get_visible_jobs('client@example.com', 'client', before_id=all_ids[1], limit=2)
+        assert [job['id'] for job in visible] == all_ids[2:4]
+    
+    def test_empty_feed(self, test_db):
+        """Пустая лента не обращается к связанным таблицам"""
+        assert build_job_feed([]) == []
+        assert count_jobs() == 0
+
+
+class TestMessageCursor:
+    """Тесты инкрементальной загрузки сообщений"""
+    
+    @pytest.fixture
+    def conversation(self, test_db):
+        """Создает диалог из пяти сообщений и сообщение в проектном чате"""
+        create_user('a@example.com', hash_password('x'), 'client', 'A')
+        create_user('b@example.com', hash_password('x'), 'freelancer', 'B')
+        ids = []
+        for i in range(5):
+            sender, receiver = ('a@example.com', 'b@example.com') if i % 2 == 0 else ('b@example.com', 'a@example.com')
+            ids.append(create_message(sender, receiver, f'msg {i}')['id'])
+        create_job('Project', 'Desc', '2099-01-01', 'a@example.com')
+        create_message('b@example.com', 'a@example.com', 'project msg', get_jobs()[0]['id'])
+        return ids
+    
+    def test_after_id_and_limit(self, conversation):
+        """Возвращаются только сообщения новее курсора, по возрастанию id"""
+        all_messages = get_messages_between_users('a@example.com', 'b@example.com')
+        assert [m['id'] for m in all_messages] == conversation
+        
+        newer = get_messages_between_users('b@example.com', 'a@example.com', after_id=conversation[1])
+        assert [m['id'] for m in newer] == conversation[2:]
+        assert newer[0]['sender_name'] == 'A'
+        
+        limited = get_messages_between_users('a@example.com', 'b@example.com', after_id=conversation[0], limit=2)
+        assert [m['id'] for m in limited] == conversation[1:3]
+    
+    def test_no_new_messages_skips_join(self, conversation):
+        """Без новых сообщений выполняется только проверка EXISTS"""
+        from database import db_connection
+        
+        statements = []
+        with db_connection() as conn:
+            conn.set_trace_callback(statements.append)
+        try:
+            assert get_messages_between_users('a@example.com', 'b@example.com', after_id=conversation[-1]) == []
+        finally:
+            with db_connection() as conn:
+                conn.set_trace_callback(None)
+        
+        queries = [statement for statement in statements if 'Messages' in statement]
+        assert len(queries) == 1
+        assert 'EXISTS' in queries[0]
+        assert 'JOIN' not in queries[0]
+    
+    def test_history_pages_walk_back_from_newest(self, conversation):
+        """История отдается страницами от новых к старым без пропусков"""
+        latest = get_message_history('a@example.com', 'b@example.com', limit=2)
+        assert [m['id'] for m in latest] == conversation[3:]
+        
+        older = get_message_history('b@example.com', 'a@example.com', before_id=latest[0]['id'], limit=2)
+        assert [m['id'] for m in older] == conversation[1:3]
+        
+        oldest = get_message_history('a@example.com', 'b@example.com', before_id=older[0]['id'], limit=2)
+        assert [m['id'] for m in oldest] == conversation[:1]
+        assert get_message_history('a@example.com', 'b@example.com', before_id=conversation[0]) == []
+    
+    def test_mark_as_read_touches_only_unread(self, conversation):
+        """Повторная отметка прочитанного ничего не меняет"""
+        assert mark_messages_as_read('b@example.com', 'a@example.com') == 3
+        assert mark_messages_as_read('b@example.com', 'a@example.com') == 0
+
+
+class TestJobSearch:
+    """Тесты полнотекстового поиска по проектам"""
+    
+    @pytest.fixture
+    def catalog(self, test_db):
+        """Создает заказчика и проекты с разными текстами"""
+        create_user('client@example.com', 'hash', 'client', name='Client')
+        create_job('Верстка лендинга', 'Нужен дизайн и адаптивная верстка', '2099-01-01', 'client@example.com')
+        create_job('Дизайн логотипа', 'Ёмкий знак для кофейни', '2099-01-01', 'client@example.com')
+        create_job('Дизайнер интерфейсов', 'Макеты мобильного приложения', '2099-01-01', 'client@example.com')
+        return {job['title']: job['id'] for job in get_jobs()}
+    
+    def titles(self, rows):
+        return [row['title'] for row in rows]
+    
+    def test_title_match_ranks_first(self, catalog):
+        """Совпадение в заголовке важнее совпадения в описании, регистр не важен"""
+        assert self.titles(search_jobs('ДИЗАЙН')) == ['Дизайн логотипа', 'Верстка лендинга']
+    
+    def test_yo_and_prefix(self, catalog):
+        """"ё" и "е" не различаются, префиксный режим находит другие формы слова"""
+        assert self.titles(search_jobs('емкий')) == ['Дизайн логотипа']
+        assert self.titles(search_jobs('логотип')) == []
+        assert self.titles(search_jobs('логотип', prefix=True)) == ['Дизайн логотипа']
+        assert set(self.titles(search_jobs('дизайн', prefix=True))) == set(catalog)
+    
+    def test_index_follows_job_changes(self, catalog):
+        """Изменение и удаление проекта сразу отражаются в поиске"""
+        update_job(catalog['Верстка лендинга'], 'Верстка магазина', 'Каталог товаров', '2099-01-01', 'open')
+        assert self.titles(search_jobs('лендинга')) == []
+        assert self.titles(search_jobs('магазина')) == ['Верстка магазина']
+        delete_job(catalog['Дизайн логотипа'])
+        assert self.titles(search_jobs('дизайн')) == []
+    
+    def test_visibility_and_keyset_pages(self, catalog):
+        """Поиск соблюдает видимость проектов, страницы по курсору не пересекаются"""
+        update_job(catalog['Дизайнер интерфейсов'], 'Дизайнер интерфейсов', 'Макеты', '2099-01-01', 'in_progress')
+        assert 'Дизайнер интерфейсов' not in self.titles(search_jobs('дизайн', prefix=True))
+        
+        full = search_jobs('дизайн', 'client@example.com', 'client', prefix=True)
+        seen, cursor = [], (None, None)
+        while True:
+            page = search_jobs('дизайн', 'client@example.com', 'client', after_rank=cursor[0],
+                               after_id=cursor[1], limit=1, prefix=True)
+            if not page:
+                break
+            seen.extend(row['id'] for row in page)
+            cursor = (page[-1]['search_rank'], page[-1]['id'])
+        assert seen == [row['id'] for row in full]
+        assert len(seen) == 3
+    
+    def test_hidden_matches_do_not_fill_window(self, catalog, monkeypatch):
+        """Скрытые проекты не занимают окно совпадений, более старые видны в следующем окне"""
+        monkeypatch.setattr(models, 'SEARCH_CANDIDATES', 1)
+        update_job(catalog['Дизайнер интерфейсов'], 'Дизайнер интерфейсов', 'Макеты', '2099-01-01', 'in_progress')
+        first = search_jobs('дизайн')
+        assert self.titles(first) == ['Дизайн логотипа']
+        assert first[0]['search_window_full']
+        older = search_jobs('дизайн', window=first[0]['search_window_end'])
+        assert self.titles(older) == ['Верстка лендинга']
+    
+    def test_query_operators_are_escaped(self, catalog):
+        """Операторы FTS5 в запросе пользователя считаются обычным текстом"""
+        assert build_search_query('дизайн OR "верстка*"') == '"дизайн" "OR" "верстка"'
+        assert build_search_query('  ,.!  ') is None
+        assert search_jobs('NEAR(') == []
+
+
+class TestUserCache:
+    """Тесты кэширования записей пользователей"""
+    
+    def test_repeated_lookups_hit_cache(self, test_db, monkeypatch):
+        """Повторные чтения пользователя не обращаются к БД"""
+        import models
+        create_user('cached@example.com', hash_password('x'), 'client', 'Cached')
+        
+        opened = []
+        original = models.db_connection
+        
+        def counting_connection():
+            opened.append(1)
+            return original()
+        
+        monkeypatch.setattr(models, 'db_connection', counting_connection)
+        user = models.get_user_by_email('cached@example.com')
+        assert models.get_user_profile_by_email('cached@example.com')['name'] == 'Cached'
+        assert models.get_user_by_id(user['id'])['email'] == 'cached@example.com'
+        assert models.get_user_by_id(user['id'])['email'] == 'cached@example.com'
+        
+        assert len(opened) == 2  # по email и по id
+    
+    def test_writes_invalidate_cache(self, test_db):
+        """Создание и изменение пользователя сразу видны при чтении"""
+        import models
+        assert models.get_user_by_email('new@example.com') is None
+        create_user('new@example.com', hash_password('x'), 'freelancer', 'New')
+        user = models.get_user_by_email('new@example.com')
+        assert user['name'] == 'New'
+        
+        models.get_user_by_id(user['id'])
+        models.update_user_profile(user['id'], name='Renamed', email='renamed@example.com')
+        assert models.get_user_by_id(user['id'])['name'] == 'Renamed'
+        assert models.get_user_by_email('renamed@example.com')['name'] == 'Renamed'
+        assert models.get_user_by_email('new@example.com') is None
+    
+    def test_stats_update_invalidates_cache(self, test_db):
+        """Пересчет рейтинга фрилансера виден через кэш"""
+        import models
+        create_user('client@example.com', hash_password('x'), 'client', 'Client')
+        create_user('worker@example.com', hash_password('x'), 'freelancer', 'Worker')
+        create_job('Job', 'Desc', '2099-01-01', 'client@example.com')
+        job_id = get_jobs()[0]['id']
+        
+        assert models.get_user_by_email('worker@example.com')['rating'] in (0, None)
+        models.create_review(job_id, 'worker@example.com', 'client@example.com', 5, 'Отлично')
+        assert models.get_user_by_email('worker@example.com')['rating'] == 5
+
+
+class TestUnreadCounters:
+    """Тесты счетчиков непрочитанных сообщений"""
+    
+    @pytest.fixture
+    def users(self, test_db):
+        """Создает двух собеседников и проект"""
+        create_user('a@example.com', hash_password('x'), 'client', 'A')
+        create_user('b@example.com', hash_password('x'), 'freelancer', 'B')
+        create_job('Project', 'Desc', '2099-01-01', 'a@example.com')
+        return get_jobs()[0]['id']
+    
+    def test_counter_follows_messages(self, users):
+        """Счетчик меняется при отправке, прочтении и удалении сообщений"""
+        import models
+        job_id = users
+        create_message('a@example.com', 'b@example.com', 'one')
+        create_message('a@example.com', 'b@example.com', 'two')
+        create_message('a@example.com', 'b@example.com', 'project', job_id)
+        create_message('b@example.com', 'a@example.com', 'reply')
+        assert models.get_unread_messages_count('b@example.com') == 3
+        assert models.get_unread_messages_count('a@example.com') == 1
+        
+        mark_messages_as_read('b@example.com', 'a@example.com')
+        assert models.get_unread_messages_count('b@example.com') == 1
+        
+        models.delete_job(job_id)
+        assert models.get_unread_messages_count('b@example.com') == 0
+        assert models.get_unread_messages_count('nobody@example.com') == 0
+    
+    def test_reconcile_repairs_drift(self, users):
+        """Сверка исправляет испорченные и недостающие счетчики"""
+        import models
+        from database import db_connection
+        create_message('a@example.com', 'b@example.com', 'one')
+        create_message('b@example.com', 'a@example.com', 'two')
+        with db_connection() as conn:
+            conn.execute("UPDATE UnreadCounters SET unread_count = 42 WHERE user_email = 'b@example.com'")
+            conn.execute("DELETE FROM UnreadCounters WHERE user_email = 'a@example.com'")
+            conn.commit()
+        
+        assert models.reconcile_unread_counters() == 2
+        assert models.get_unread_messages_count('b@example.com') == 1
+        assert models.get_unread_messages_count('a@example.com') == 1
+        assert models.reconcile_unread_counters() == 0
+
+
+class TestFreelancerAggregates:
+    """Тесты накопительной статистики фрилансеров"""
+
+    @pytest.fixture
+    def jobs(self, test_db):
+        """Создает заказчика, фрилансера и два проекта с откликами"""
+        create_user('client@example.com', hash_password('x'), 'client', 'Client')
+        create_user('worker@example.com', hash_password('x'), 'freelancer', 'Worker')
+        for title in ('First', 'Second'):
+            create_job(title, 'Desc', '2099-01-01', 'client@example.com')
+        job_ids = sorted(job['id'] for job in get_jobs())
+        for job_id in job_ids:
+            apply_to_job(job_id, 'worker@example.com')
+        return job_ids
+
+    def test_reviews_and_completion_update_aggregates(self, jobs):
+        """Отзывы и завершение проектов учитываются без пересчета, повторное завершение не считается"""
+        import models
+        for job_id, rating in zip(jobs, (5, 4)):
+            models.complete_job(job_id, 'worker@example.com')
+            models.create_review(job_id, 'worker@example.com', 'client@example.com', rating, 'Отзыв')
+        models.complete_job(jobs[0], 'worker@example.com')
+
+        worker = models.get_user_by_email('worker@example.com')
+        assert (worker['rating_sum'], worker['rating_count'], worker['rating']) == (9, 2, 4.5)
+        assert worker['completed_projects'] == 2
+        assert models.verify_freelancer_aggregates() == []
+
+    def test_delete_job_subtracts_its_stats(self, jobs):
+        """Удаление проекта вычитает его отзыв и завершение"""
+        import models
+        for job_id, rating in zip(jobs, (5, 2)):
+            models.complete_job(job_id, 'worker@example.com')
+            models.create_review(job_id, 'worker@example.com', 'client@example.com', rating, 'Отзыв')
+
+        delete_job(jobs[1])
+        worker = models.get_user_by_email('worker@example.com')
+        assert (worker['rating_sum'], worker['rating_count'], worker['rating']) == (5, 1, 5.0)
+        assert worker['completed_projects'] == 1
+        assert models.verify_freelancer_aggregates() == []
+
+    def test_reopening_done_job_updates_completed(self, jobs):
+        """Перевод завершенного проекта в работу и обратно меняет счетчик завершенных проектов"""
+        import models
+        models.complete_job(jobs[0], 'worker@example.com')
+        models.update_job(jobs[0], 'First', 'Desc', '2099-01-01', 'in_progress')
+        assert models.get_user_by_email('worker@example.com')['completed_projects'] == 0
+        assert models.verify_freelancer_aggregates() == []
+
+        models.update_job(jobs[0], 'First', 'Desc', '2099-01-01', 'done')
+        models.update_job(jobs[0], 'First (ред.)', 'Desc', '2099-01-01', 'done')
+        assert models.get_user_by_email('worker@example.com')['completed_projects'] == 1
+        assert models.verify_freelancer_aggregates() == []
+
+    def test_seed_data_is_consistent(self, test_db):
+        """Тестовые данные при первом запуске согласованы с полным пересчетом"""
+        import main
+        import models
+        main.check_and_create_test_data()
+        assert models.get_user_by_email('freelancer3@test.com')['rating_count'] == 1
+        assert models.verify_freelancer_aggregates() == []
+
+    def test_verify_reports_drift(self, jobs):
+        """Сверка находит расхождение, полный пересчет его исправляет"""
+        import models
+        from database import db_connection
+        models.create_review(jobs[0], 'worker@example.com', 'client@example.com', 3, 'Отзыв')
+        with db_connection() as conn:
+            conn.execute("UPDATE Users SET rating_sum = 10 WHERE email = 'worker@example.com'")
+            conn.commit()
+
+        mismatches = models.verify_freelancer_aggregates()
+        assert [(row['email'], row['rating_sum'], row['expected_rating_sum']) for row in mismatches] == [
+            ('worker@example.com', 10, 3)
+        ]
+        models.update_freelancer_stats('worker@example.com')
+        assert models.verify_freelancer_aggregates() == []
+
+    def test_bulk_recompute_repairs_all_batches(self, jobs):
+        """Пакетный пересчет исправляет всех фрилансеров и сообщает прогресс"""
+        import models
+        from database import db_connection
+        create_user('other@example.com', hash_password('x'), 'freelancer', 'Other')
+        models.complete_job(jobs[0], 'worker@example.com')
+        models.create_review(jobs[0], 'worker@example.com', 'client@example.com', 4, 'Отзыв')
+        with db_connection() as conn:
+            conn.execute("UPDATE Users SET rating_sum = 0, rating_count = 0, rating = 0, completed_projects = 7 WHERE role = 'freelancer'")
+            conn.commit()
+
+        reports = []
+        result = models.update_all_freelancer_stats(progress=lambda done, total: reports.append((done, total)), batch_size=1)
+        assert result == {"freelancers": 2, "updated": 2}
+        assert reports == [(0, 2), (1, 2), (2, 2)]
+        assert models.verify_freelancer_aggregates() == []
+        assert models.get_user_by_email('worker@example.com')['rating'] == 4.0
+        # Повторный пересчет не перезаписывает неизменившиеся строки
+        assert models.update_all_freelancer_stats()["updated"] == 0
+
+
+# Исходный запрос списка диалогов по всем сообщениям - эталон для сводки Conversations
+LEGACY_CONVERSATIONS_QUERY = """
+    SELECT CASE WHEN sender_email = :me THEN receiver_email ELSE sender_email END as other_user_email,
+        MAX(m.created_at) as last_message_time,
+        COUNT(CASE WHEN m.receiver_email = :me AND m.is_read = FALSE THEN 1 END) as unread_count,
+        NULL as job_id, 'user' as conversation_type
+    FROM Messages m
+    WHERE (m.sender_email = :me OR m.receiver_email = :me) AND m.job_id IS NULL
+    GROUP BY other_user_email
+    UNION ALL
+    SELECT CASE WHEN sender_email = :me THEN receiver_email ELSE sender_email END as other_user_email,
+        MAX(m.created_at), COUNT(CASE WHEN m.receiver_email = :me AND m.is_read = FALSE THEN 1 END),
+        m.job_id, 'project'
+    FROM Messages m
+    WHERE (m.sender_email = :me OR m.receiver_email = :me) AND m.job_id IS NOT NULL
+    GROUP BY m.job_id, other_user_email
+"""
+
+
+class TestConversations:
+    """Тесты сводки диалогов для списка сообщений"""
+    
+    @pytest.fixture
+    def inbox(self, test_db):
+        """Создает переписку в обычных и проектных чатах"""
+        for email in ('a@example.com', 'b@example.com', 'c@example.com'):
+            create_user(email, hash_password('x'), 'client', email[0].upper())
+        create_job('Project', 'Desc', '2099-01-01', 'a@example.com')
+        job_id = get_jobs()[0]['id']
+        create_message('a@example.com', 'b@example.com', 'hello b')
+        create_message('b@example.com', 'a@example.com', 'hi a')
+        create_message('c@example.com', 'a@example.com', 'from c')
+        create_message('b@example.com', 'a@example.com', 'about project', job_id)
+        create_message('c@example.com', 'a@example.com', 'project from c', job_id)
+        create_message('b@example.com', 'a@example.com', 'latest from b')
+        return job_id
+    
+    def summary(self, email):
+        """Диалоги пользователя без служебных полей сводки"""
+        return sorted((
+            (c['other_user_email'], c['last_message_time'], c['unread_count'], c['job_id'], c['conversation_type'])
+            for c in get_user_conversations(email)
+        ), key=str)
+    
+    def legacy_summary(self, email):
+        """Диалоги пользователя, посчитанные исходным запросом по Messages"""
+        from database import db_connection
+        with db_connection() as conn:
+            rows = conn.execute(LEGACY_CONVERSATIONS_QUERY, {"me": email}).fetchall()
+        return sorted((tuple(row) for row in rows), key=str)
+    
+    def test_matches_legacy_query(self, inbox):
+        """Сводка совпадает с агрегацией по всем сообщениям"""
+        for email in ('a@example.com', 'b@example.com', 'c@example.com'):
+            assert self.summary(email) == self.legacy_summary(email)
+        
+        mark_messages_as_read('a@example.com', 'b@example.com')
+        mark_messages_as_read('a@example.com', 'c@example.com', inbox)
+        assert self.summary('a@example.com') == self.legacy_summary('a@example.com')
+    
+    def test_ordered_by_last_activity(self, inbox):
+        """Диалоги упорядочены по последнему сообщению и несут его текст"""
+        conversations = get_user_conversations('a@example.com')
+        assert [c['snippet'] for c in conversations] == ['latest from b', 'project from c', 'about project', 'from c']
+        assert conversations[0]['other_user_name'] == 'B'
+        assert conversations[1]['job_title'] == 'Project'
+        assert (conversations[1]['other_user_email'], conversations[1]['unread_count']) == ('c@example.com', 1)
+        # У отправителя своя строка диалога, без непрочитанных
+        assert [(c['other_user_email'], c['unread_count']) for c in get_user_conversations('c@example.com')] == [
+            ('a@example.com', 0), ('a@example.com', 0),
+        ]
+    
+    def test_deleted_messages_leave_summary(self, inbox):
+        """Удаление сообщений проекта убирает его диалог из списка"""
+        delete_job(inbox)
+        assert [c['conversation_type'] for c in get_user_conversations('a@example.com')] == ['user', 'user']
+        assert self.summary('a@example.com') == self.legacy_summary('a@example.com')
+
+
+class TestUserDirectory:
+    """Тесты каталога пользователей по навыкам"""
+
+    @pytest.fixture
+    def users(self, test_db):
+        """Создает пользователей с навыками и рейтингами"""
+        import models
+        profiles = [
+            ('a@example.com', 'freelancer', 'Python, SQL', 4.8),
+            ('b@example.com', 'freelancer', ' python ,Django', 4.8),
+            ('c@example.com', 'freelancer', 'Python, Django, sql', 3.5),
+            ('d@example.com', 'client', 'Python', 0.0),
+            ('e@example.com', 'freelancer', 'Дизайн, Ёлка', 5.0),
+        ]
+        for email, role, skills, rating in profiles:
+            create_user(email, hash_password('x'), role, email[0].upper())
+            user = models.get_user_by_email(email)
+            models.update_user_profile(user['id'], skills=skills)
+            with models.db_connection() as conn:
+                conn.execute("UPDATE Users SET rating = ? WHERE id = ?", (rating, user['id']))
+                conn.commit()
+        return profiles
+
+    def emails(self, **filters):
+        import models
+        return [user['email'] for user in models.search_users(**filters)]
+
+    def test_skills_are_normalized(self, users):
+        """Навыки в разном регистре и с пробелами становятся одной записью справочника"""
+        import models
+        popular = {skill['name'].casefold(): skill['user_count'] for skill in models.get_popular_skills()}
+        assert popular['python'] == 4
+        assert popular['sql'] == 2
+        assert popular['django'] == 2
+        assert self.emails(skills=['ДИЗАЙН', 'ёлка']) == ['e@example.com']
+
+    def test_profile_update_resyncs_skills(self, users):
+        """Изменение навыков в профиле обновляет связи и счетчики"""
+        import models
+        user = models.get_user_by_email('a@example.com')
+        models.update_user_profile(user['id'], skills='Rust')
+        popular = {skill['name'].casefold(): skill['user_count'] for skill in models.get_popular_skills()}
+        assert popular['python'] == 3
+        assert popular['sql'] == 1
+        assert popular['rust'] == 1
+        assert self.emails(skills=['sql']) == ['c@example.com']
+
+    def test_skill_intersection_with_role_and_rating(self, users):
+        """Пользователь должен владеть всеми навыками и проходить остальные фильтры"""
+        assert self.emails(skills=['python', 'django']) == ['b@example.com', 'c@example.com']
+        assert self.emails(skills=['python', 'sql'], min_rating=4.0) == ['a@example.com']
+        assert self.emails(role='client', skills=['python']) == ['d@example.com']
+        assert self.emails(skills=['python', 'cobol']) == []
+
+    def test_both_plans_agree(self, users, monkeypatch):
+        """Выборка от списка навыка и от индекса рейтинга дает одинаковый результат"""
+        import models
+        expected = self.emails(skills=['django', 'python'])
+        monkeypatch.setattr(models, 'SKILL_DRIVE_LIMIT', 0)
+        assert self.emails(skills=['django', 'python']) == expected
+
+    def test_keyset_pages_cover_all(self, users):
+        """Страницы по курсору идут по рейтингу без пропусков и повторов"""
+        import models
+        seen = []
+        after = None
+        while True:
+            page = models.search_users(after=after, limit=2)
+            if not page:
+                break
+            seen.extend(user['email'] for user in page)
+            last = page[-1]
+            after = (last['rating'], last['completed_projects'], last['id'])
+        assert seen == ['e@example.com', 'b@example.com', 'a@example.com', 'c@example.com', 'd@example.com']
+        assert models.count_users() == 5
+        assert models.count_users(role='freelancer', skills=['python']) == 3
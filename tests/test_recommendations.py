@@ -0,0 +1,111 @@
+"""
+Тесты рекомендаций проектов и исполнителей
+"""
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from models import (
+    create_user, create_job, get_jobs, get_user_by_email, update_user_profile, update_job,
+    apply_to_job, hash_password, get_job_candidates, get_recommended_jobs,
+)
+from recommendations import VectorIndex, recommender, tf_matrix, weigh, inverse_document_frequency, JOB_FIELDS
+
+
+class TestVectorIndex:
+    """Тесты индекса векторов"""
+
+    def index_for(self, texts):
+        rows = [{"title": text, "description": ""} for text in texts]
+        matrix = tf_matrix(rows, JOB_FIELDS)
+        return weigh(matrix, inverse_document_frequency(matrix))
+
+    def test_updates_match_fresh_index(self, monkeypatch):
+        """Дозапись в хвост и слияние дают те же результаты, что и индекс с нуля"""
+        monkeypatch.setattr("recommendations.RECOMMEND_COMPACT_ROWS", 2)
+        texts = ["python django", "python sql", "дизайн логотипа", "ёлка на сайт", "sql отчеты"]
+        matrix = self.index_for(texts + ["python python"])
+        queries = matrix[[0, 3]]
+
+        index = VectorIndex([1, 2, 3, 4, 5], matrix[:5])
+        index = index.update([2], [2], matrix[[5]])  # документ 2 изменен
+        assert index.tail.shape[0] == 1
+        index = index.update([3], [], matrix[:0])  # документ 3 удален
+        expected = VectorIndex([1, 2, 4, 5], matrix[[0, 5, 3, 4]])
+        assert index.top_k(queries, 3) == expected.top_k(queries, 3)
+
+        compacted = index.update([6, 7], [6, 7], matrix[[1, 2]])
+        assert compacted.tail.shape[0] == 0 and len(compacted) == 6
+        assert compacted.top_k(queries, 3)[1][0][0] == 4
+        assert np.isclose(compacted.top_k(queries, 1)[0][0][1], 1.0)
+
+
+class TestRecommendations:
+    """Тесты подбора кандидатов и рекомендаций проектов"""
+
+    @pytest.fixture
+    def market(self, test_db):
+        """Заказчик с проектами и фрилансеры с разными навыками"""
+        create_user('client@example.com', hash_password('x'), 'client', 'Client')
+        profiles = {
+            'py@example.com': ('Python, Django', 'Бэкенд на Python и REST API'),
+            'design@example.com': ('Figma, Иллюстрации', 'Дизайн логотипов и баннеров'),
+            'empty@example.com': (None, None),
+        }
+        for email, (skills, about) in profiles.items():
+            create_user(email, hash_password('x'), 'freelancer', email.split('@')[0])
+            update_user_profile(get_user_by_email(email)['id'], skills=skills, about_me=about)
+        create_job('Бэкенд на Django', 'Нужен Python разработчик для API', '2099-01-01', 'client@example.com')
+        create_job('Логотип для кафе', 'Дизайн логотипа и баннеров в Figma', '2099-01-01', 'client@example.com')
+        return {job['title']: job['id'] for job in get_jobs()}
+
+    def test_candidates_ranked_by_similarity(self, market):
+        """Кандидаты на проект упорядочены по близости профиля, пустые профили не предлагаются"""
+        candidates = get_job_candidates(market['Бэкенд на Django'])
+        assert [c['email'] for c in candidates] == ['py@example.com']
+        assert candidates[0]['score'] > 0 and not candidates[0]['applied']
+
+        apply_to_job(market['Логотип для кафе'], 'design@example.com')
+        candidates = get_job_candidates(market['Логотип для кафе'])
+        assert candidates[0]['email'] == 'design@example.com' and candidates[0]['applied']
+
+    def test_index_follows_changes(self, market):
+        """Изменения профиля и проекта попадают в индекс без полной перестройки"""
+        recommender.current()
+        user = get_user_by_email('empty@example.com')
+        update_user_profile(user['id'], skills='Figma', about_me='Рисую логотипы')
+        assert 'empty@example.com' in [c['email'] for c in get_job_candidates(market['Логотип для кафе'])]
+
+        recommended = get_recommended_jobs('design@example.com')
+        assert [job['title'] for job in recommended] == ['Логотип для кафе']
+        update_job(market['Логотип для кафе'], 'Логотип для кафе', 'Дизайн', '2099-01-01', 'in_progress')
+        assert get_recommended_jobs('design@example.com') == []
+
+    def test_recommended_jobs_skip_applied(self, market):
+        """Проекты, на которые фрилансер уже откликнулся, не рекомендуются"""
+        recommender.current()
+        assert [job['title'] for job in get_recommended_jobs('py@example.com')] == ['Бэкенд на Django']
+        apply_to_job(market['Бэкенд на Django'], 'py@example.com')
+        assert get_recommended_jobs('py@example.com') == []
+        assert get_recommended_jobs('client@example.com') == []
+
+    def test_candidates_endpoint(self, market):
+        """Кандидатов видит только создатель проекта"""
+        job_id = market['Бэкенд на Django']
+        client = TestClient(app, cookies={"user_email": 'client@example.com'})
+        response = client.get(f"/jobs/{job_id}/candidates")
+        assert response.status_code == 200
+        assert [c['email'] for c in response.json()['candidates']] == ['py@example.com']
+
+        other = TestClient(app, cookies={"user_email": 'py@example.com'})
+        assert other.get(f"/jobs/{job_id}/candidates").status_code == 403
+        assert client.get("/jobs/999/candidates").status_code == 404
+
+    def test_home_shows_recommendations(self, market):
+        """Главная страница фрилансера содержит блок рекомендаций"""
+        recommender.current()
+        client = TestClient(app, cookies={"user_email": 'design@example.com'})
+        response = client.get("/")
+        assert response.status_code == 200
+        assert 'Рекомендуем вам' in response.text
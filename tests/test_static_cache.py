@@ -0,0 +1,129 @@
+"""
+Тесты кэширования статики и загрузок
+"""
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import main
+import static_cache
+from static_cache import CachedStaticFiles, IMMUTABLE_CACHE_CONTROL, accepted_encodings
+
+CSS = b"body { color: #111; margin: 0; }\n" * 100
+
+
+@pytest.fixture
+def static_files(tmp_path):
+    """Каталог со стилями, иконкой и блобом"""
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "main.css").write_bytes(CSS)
+    (tmp_path / "icon.svg").write_bytes(b"<svg/>")
+    (tmp_path / "blobs").mkdir()
+    (tmp_path / "blobs" / "abc.pdf").write_bytes(b"%PDF")
+    return CachedStaticFiles(directory=tmp_path, immutable_prefixes=("blobs/",))
+
+
+@pytest.fixture
+def client(static_files):
+    app = FastAPI()
+    app.mount("/static", static_files)
+    return TestClient(app)
+
+
+class TestCachedStaticFiles:
+    """Тесты заголовков кэширования"""
+
+    def test_accepted_encodings(self):
+        """Кодировки с q=0 клиент не принимает"""
+        assert accepted_encodings("gzip, deflate, br;q=0") == {"gzip", "deflate"}
+        assert accepted_encodings("") == set()
+
+    def test_fingerprinted_url_is_immutable(self, client, static_files):
+        """Ссылка с верным отпечатком кэшируется навсегда, без отпечатка - сверяется"""
+        version = static_files.fingerprint("css/main.css")
+        assert len(version) == static_cache.FINGERPRINT_LENGTH
+        assert static_files.fingerprint("css/missing.css") is None
+
+        assert client.get(f"/static/css/main.css?v={version}").headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+        assert client.get("/static/css/main.css?v=stale").headers["cache-control"] == "no-cache"
+        assert client.get("/static/blobs/abc.pdf").headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+    def test_serves_precompressed_variants(self, client):
+        """CSS отдается в лучшей принимаемой кодировке, мелкие файлы - как есть"""
+        response = client.get("/static/css/main.css", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.content == CSS
+        assert int(response.headers["content-length"]) < len(CSS)
+
+        response = client.get("/static/css/main.css", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+        assert response.content == CSS
+
+        response = client.get("/static/icon.svg", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+    def test_brotli_preferred(self, client):
+        """Если brotli установлен, он предпочтительнее gzip"""
+        pytest.importorskip("brotli")
+        response = client.get("/static/css/main.css", headers={"Accept-Encoding": "gzip, br"})
+        assert response.headers["content-encoding"] == "br"
+        assert response.content == CSS
+
+    def test_strong_etag_revalidation(self, client, static_files, tmp_path):
+        """ETag считается по содержимому, совпадение дает 304, изменение файла - новый ETag"""
+        headers = {"Accept-Encoding": "gzip"}
+        etag = client.get("/static/css/main.css", headers=headers).headers["etag"]
+        assert not etag.startswith("W/") and etag.endswith('-gzip"')
+
+        response = client.get("/static/css/main.css", headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+        # Другое представление не совпадает по строгому ETag
+        response = client.get("/static/css/main.css", headers={"Accept-Encoding": "identity", "If-None-Match": etag})
+        assert response.status_code == 200
+
+        version = static_files.fingerprint("css/main.css")
+        (tmp_path / "css" / "main.css").write_bytes(CSS + b"a { color: red; }\n")
+        response = client.get("/static/css/main.css", headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.content.endswith(b"red; }\n")
+        assert static_files.fingerprint("css/main.css") != version
+
+    def test_blob_etag_from_name(self, client, static_files, monkeypatch):
+        """ETag блоба берется из имени файла без чтения содержимого"""
+        def fail(*args, **kwargs):
+            raise AssertionError("блоб не должен читаться для ETag")
+
+        monkeypatch.setattr(static_cache, "open", fail, raising=False)
+        response = client.get("/static/blobs/abc.pdf")
+        assert response.headers["etag"] == '"abc"'
+        assert client.get("/static/blobs/abc.pdf", headers={"If-None-Match": '"abc"'}).status_code == 304
+
+    def test_deleted_file_entry_dropped(self, client, static_files, tmp_path):
+        """Запрос удаленного файла убирает его запись из кэша"""
+        # prepare хранит записи под теми же путями, что и lookup_path
+        static_files.prepare()
+        full_path = os.path.realpath(tmp_path / "css" / "main.css")
+        assert full_path in static_files._entries
+
+        (tmp_path / "css" / "main.css").unlink()
+        assert client.get("/static/css/main.css").status_code == 404
+        assert full_path not in static_files._entries
+
+
+class TestStaticUrls:
+    """Тесты ссылок на статику в страницах"""
+
+    def test_pages_reference_fingerprinted_assets(self, test_db):
+        """Страница ссылается на стили и скрипты с отпечатком, и они отдаются как immutable"""
+        client = TestClient(main.app)
+        page = client.get("/login").text
+        url = main.static_url("css/main.css")
+        assert f'href="{url}"' in page
+        assert client.get(url).headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+        assert f'src="{main.static_url("js/main.js")}"' in page
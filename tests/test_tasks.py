@@ -0,0 +1,85 @@
+"""
+Тесты фоновых задач
+"""
+import threading
+import time
+from fastapi.testclient import TestClient
+
+from main import app
+from tasks import TaskRegistry
+from models import create_user, hash_password
+
+
+def wait_for(task, timeout=5.0):
+    """Ждет завершения задачи"""
+    deadline = time.monotonic() + timeout
+    while task.running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return task
+
+
+class TestTaskRegistry:
+    """Тесты реестра фоновых задач"""
+
+    def test_task_reports_progress_and_result(self):
+        """Задача получает колбэк прогресса, результат и длительность сохраняются"""
+        def job(progress):
+            for done in range(1, 4):
+                progress(done, 3)
+            return {"processed": 3}
+
+        registry = TaskRegistry(workers=1)
+        task = wait_for(registry.start("job", job))
+        info = task.to_dict()
+        assert info["status"] == "done"
+        assert (info["done"], info["total"], info["progress"]) == (3, 3, 1.0)
+        assert info["result"] == {"processed": 3}
+        assert info["duration"] >= 0
+        assert registry.get(task.id) is task
+
+    def test_failed_task_keeps_error(self):
+        """Исключение задачи сохраняется как ошибка"""
+        def job(progress):
+            raise ValueError("boom")
+
+        task = wait_for(TaskRegistry(workers=1).start("job", job))
+        assert (task.status, task.error) == ("failed", "boom")
+
+    def test_running_task_is_not_started_twice(self):
+        """Повторный запуск задачи с тем же именем возвращает выполняющуюся"""
+        release = threading.Event()
+
+        def job(progress):
+            release.wait(5)
+
+        registry = TaskRegistry(workers=2)
+        first = registry.start("job", job)
+        second = registry.start("job", job)
+        release.set()
+        wait_for(first)
+        assert first is second
+        assert registry.start("job", job) is not first
+
+
+class TestUpdateStatsTask:
+    """Тесты фонового пересчета статистики фрилансеров"""
+
+    def test_admin_starts_recompute_and_polls_status(self, test_db):
+        """Администратор запускает пересчет и получает его итог по id задачи"""
+        create_user('admin@example.com', hash_password('secret'), 'admin', 'Admin')
+        create_user('worker@example.com', hash_password('secret'), 'freelancer', 'Worker')
+        client = TestClient(app, cookies={"user_email": "admin@example.com"})
+
+        response = client.get("/admin/update-stats")
+        assert response.status_code == 202
+        task_id = response.json()["task"]["id"]
+
+        deadline = time.monotonic() + 5
+        while True:
+            task = client.get(f"/admin/tasks/{task_id}").json()["task"]
+            if task["status"] not in ("pending", "running") or time.monotonic() > deadline:
+                break
+            time.sleep(0.01)
+        assert task["status"] == "done"
+        assert task["result"]["freelancers"] == 1
+        assert client.get("/admin/tasks/missing").status_code == 404
@@ -0,0 +1,103 @@
+"""
+Тесты уменьшенных копий аватарок
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import thumbnails
+from thumbnails import Thumbnailer, thumbnail_size
+
+# Pillow - необязательная зависимость, без нее копии не строятся
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture
+def thumbnailer(tmp_path):
+    """Каталоги загрузок и статики во временной папке с одной фотографией"""
+    uploads = tmp_path / "uploads"
+    (uploads / "avatars").mkdir(parents=True)
+    Image.new("RGB", (900, 600), "red").save(uploads / "avatars" / "photo.jpg", quality=95)
+    (uploads / "avatars" / "broken.png").write_bytes(b"not an image")
+    return Thumbnailer({"uploads": uploads, "static": tmp_path / "static"}, uploads / "thumbs")
+
+
+class TestThumbnailer:
+    """Тесты построения копий"""
+
+    def test_size_covers_double_density(self):
+        """Размер копии - наименьший, покрывающий двойную плотность пикселей"""
+        assert [thumbnail_size(px) for px in (24, 32, 48, 64, 80, 200)] == [48, 96, 96, 160, 160, 160]
+
+    def test_url_points_to_thumbnail(self, thumbnailer, monkeypatch):
+        """Фильтр подменяет локальные изображения ссылками на копии"""
+        assert thumbnailer.url("/uploads/avatars/photo.jpg", 40) == "/thumbs/96/uploads/avatars/photo.jpg"
+        assert thumbnailer.url(None, 24) == "/thumbs/48/static/defaultAvatar.jpg"
+        assert thumbnailer.url("https://example.com/a.png", 40) == "https://example.com/a.png"
+        assert thumbnailer.url("/uploads/avatars/../../etc/passwd.jpg", 40) == "/uploads/avatars/../../etc/passwd.jpg"
+
+        monkeypatch.setattr(thumbnails, "Image", None)
+        assert thumbnailer.url("/uploads/avatars/photo.jpg", 40) == "/uploads/avatars/photo.jpg"
+
+    def test_builds_and_caches_square_copy(self, thumbnailer):
+        """Копия строится при первом запросе и переиспользуется"""
+        path = thumbnailer.get(96, "uploads/avatars/photo.jpg", "webp")
+        with Image.open(path) as image:
+            assert (image.format, image.size) == ("WEBP", (96, 96))
+        mtime = path.stat().st_mtime_ns
+        assert thumbnailer.get(96, "uploads/avatars/photo.jpg", "webp") == path
+        assert path.stat().st_mtime_ns == mtime
+
+    def test_generate_all_sizes(self, thumbnailer):
+        """При загрузке строятся копии всех размеров в обоих форматах"""
+        assert thumbnailer.generate("uploads/avatars/photo.jpg")
+        built = sorted(p.relative_to(thumbnailer.cache_dir).as_posix() for p in thumbnailer.cache_dir.rglob("*.*"))
+        assert built == sorted(
+            f"{size}/uploads/avatars/photo.jpg.{fmt}" for size in (48, 96, 160) for fmt in ("jpg", "webp")
+        )
+
+    def test_broken_image_is_skipped(self, thumbnailer):
+        """Файл, который не удается разобрать, не дает копии"""
+        assert thumbnailer.get(48, "uploads/avatars/broken.png") is None
+        assert thumbnailer.get(48, "uploads/avatars/missing.png") is None
+
+
+class TestThumbnailRoute:
+    """Тесты маршрута /thumbs"""
+
+    @pytest.fixture
+    def client(self, thumbnailer, monkeypatch):
+        monkeypatch.setattr(main, "thumbnailer", thumbnailer)
+        return TestClient(main.app)
+
+    def test_serves_negotiated_format(self, client):
+        """Копия отдается в WebP, если браузер его принимает, иначе в JPEG"""
+        response = client.get("/thumbs/48/uploads/avatars/photo.jpg", headers={"Accept": "image/webp,*/*"})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/webp"
+        assert response.headers["vary"] == "Accept"
+        assert "max-age" in response.headers["cache-control"]
+
+        response = client.get("/thumbs/48/uploads/avatars/photo.jpg", headers={"Accept": "image/*"})
+        assert response.headers["content-type"] == "image/jpeg"
+
+    def test_rejects_unknown_sizes_and_paths(self, client):
+        """Произвольные размеры и пути вне каталогов не обрабатываются"""
+        assert client.get("/thumbs/500/uploads/avatars/photo.jpg").status_code == 404
+        assert client.get("/thumbs/48/etc/passwd.jpg").status_code == 404
+
+    def test_rejects_thumbnails_as_sources(self, client, thumbnailer):
+        """Копия не строится из другой копии: цепочка копий росла бы без предела"""
+        assert client.get("/thumbs/48/uploads/avatars/photo.jpg").status_code == 200
+        assert client.get("/thumbs/48/uploads/thumbs/48/uploads/avatars/photo.jpg.webp").status_code == 404
+        assert client.get("/thumbs/48/uploads/./thumbs/48/uploads/avatars/photo.jpg.jpg").status_code == 404
+        assert thumbnailer.url("/uploads/thumbs/48/uploads/avatars/photo.jpg.webp", 24) == \
+            "/uploads/thumbs/48/uploads/avatars/photo.jpg.webp"
+        built = [p for p in thumbnailer.cache_dir.rglob("*") if p.is_file()]
+        assert len(built) == 1
+
+    def test_falls_back_to_original(self, client):
+        """Если копию не построить, браузер перенаправляется на оригинал"""
+        response = client.get("/thumbs/48/uploads/avatars/broken.png", follow_redirects=False)
+        assert response.status_code == 302
+        assert response.headers["location"] == "/uploads/avatars/broken.png"
@@ -0,0 +1,167 @@
+"""
+Тесты очистки загрузок без ссылок
+"""
+import io
+import json
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from database import db_connection
+from models import create_user, create_job, get_user_by_email, hash_password, update_user_profile
+from thumbnails import Thumbnailer
+from upload_gc import Throttle, UploadCollector
+from uploads import store_blob
+
+OLD = time.time() - 7 * 24 * 3600
+
+
+def age_blobs():
+    """Делает все блобы загруженными давно"""
+    with db_connection() as conn:
+        conn.execute("UPDATE UploadBlobs SET uploaded_at = '2000-01-01 00:00:00'")
+        conn.commit()
+
+
+def write_old(path, data=b"data"):
+    """Создает файл со старым временем изменения"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    os.utime(path, (OLD, OLD))
+    return path
+
+
+@pytest.fixture
+def uploads(test_db, tmp_path):
+    """Каталог загрузок: живые и брошенные блобы, старые файлы, копии и недописанная загрузка"""
+    root = tmp_path / "uploads"
+    create_user('client@example.com', 'hash', 'client', 'Client')
+    user_id = get_user_by_email('client@example.com')['id']
+
+    files = {
+        "avatar": store_blob(io.BytesIO(b"avatar"), root, ".png")["path"],
+        "job": store_blob(io.BytesIO(b"brief"), root, ".pdf")["path"],
+        "orphan": store_blob(io.BytesIO(b"deleted job file"), root, ".pdf")["path"],
+        "legacy": "/uploads/portfolio/old.pdf",
+    }
+    update_user_profile(user_id, avatar=files["avatar"], portfolio_files=json.dumps([files["legacy"]]))
+    create_job('Проект', 'Описание', '2099-01-01', 'client@example.com', files=[files["job"]])
+    age_blobs()
+    files["fresh"] = store_blob(io.BytesIO(b"just uploaded"), root, ".pdf")["path"]
+
+    write_old(root / "portfolio" / "old.pdf")
+    write_old(root / "projects" / "abandoned.pdf")
+    write_old(root / "blobs" / ".upload-x.part")
+    thumbnailer = Thumbnailer({"uploads": root}, root / "thumbs")
+    write_old(root / "thumbs" / "48" / files["avatar"].lstrip("/").replace(".png", ".png.webp"))
+    write_old(root / "thumbs" / "48" / "uploads" / "avatars" / "gone.jpg.webp")
+    write_old(root / "thumbs" / "48" / "uploads" / "thumbs" / "48" / files["avatar"].lstrip("/").replace(".png", ".png.webp.webp"))
+    return root, thumbnailer, files
+
+
+def existing(root):
+    """Пути всех файлов каталога загрузок"""
+    return sorted("/uploads/" + p.relative_to(root).as_posix() for p in root.rglob("*") if p.is_file())
+
+
+class TestUploadCollector:
+    """Тесты mark-and-sweep каталога загрузок"""
+
+    def test_dry_run_reports_without_deleting(self, uploads):
+        """Пробный запуск перечисляет мусор, но ничего не удаляет"""
+        root, thumbnailer, files = uploads
+        before = existing(root)
+        report = UploadCollector(root, thumbnailer).collect(dry_run=True, ops_per_second=0)
+        assert existing(root) == before
+        assert report["dry_run"] and report["deleted"] == 0
+        assert report["scanned"] == len(before)
+        assert report["in_grace"] == 1
+        assert sorted((item["kind"], item["path"]) for item in report["sample"]) == [
+            ("blob", files["orphan"]),
+            ("file", "/uploads/projects/abandoned.pdf"),
+            ("partial", "/uploads/blobs/.upload-x.part"),
+            ("thumb", "/uploads/thumbs/48/uploads/avatars/gone.jpg.webp"),
+            ("thumb", "/uploads/thumbs/48/uploads/thumbs/48" + files["avatar"] + ".webp.webp"),
+        ]
+
+    def test_sweeps_unreferenced_files(self, uploads):
+        """Удаляются только файлы без ссылок старше периода ожидания"""
+        root, thumbnailer, files = uploads
+        report = UploadCollector(root, thumbnailer).collect(dry_run=False, ops_per_second=0)
+        assert report["deleted"] == report["orphans"] == 5
+        assert existing(root) == sorted([
+            files["avatar"], files["job"], files["fresh"], files["legacy"],
+            "/uploads/thumbs/48" + files["avatar"] + ".webp",
+        ])
+        with db_connection() as conn:
+            rows = {row["path"] for row in conn.execute("SELECT path FROM UploadBlobs")}
+        assert rows == {files["avatar"], files["job"], files["fresh"]}
+
+    def test_reupload_and_new_refs_keep_blob(self, uploads):
+        """Блоб, загруженный заново или получивший ссылку после разметки, не удаляется"""
+        root, thumbnailer, files = uploads
+        store_blob(io.BytesIO(b"deleted job file"), root, ".pdf")
+        UploadCollector(root, thumbnailer).collect(dry_run=False, ops_per_second=0)
+        assert files["orphan"] in existing(root)
+
+        age_blobs()
+        blob_path = root / files["orphan"][len("/uploads/"):]
+        update_user_profile(get_user_by_email('client@example.com')['id'], portfolio_files=json.dumps([files["orphan"]]))
+        assert not UploadCollector._delete_blob(blob_path, files["orphan"], "-3600 seconds")
+        assert blob_path.exists()
+
+    def test_store_blob_restores_collected_file(self, uploads):
+        """Загрузка содержимого, чей файл уже удален очисткой, записывает файл заново"""
+        root, thumbnailer, files = uploads
+        UploadCollector(root, thumbnailer).collect(dry_run=False, ops_per_second=0)
+        blob = store_blob(io.BytesIO(b"deleted job file"), root, ".pdf")
+        assert (blob["path"], blob["created"]) == (files["orphan"], True)
+        assert (root / blob["path"][len("/uploads/"):]).read_bytes() == b"deleted job file"
+
+    def test_stale_rows_removed(self, uploads):
+        """Запись о блобе без файла и без ссылок удаляется"""
+        root, thumbnailer, files = uploads
+        (root / files["orphan"][len("/uploads/"):]).unlink()
+        report = UploadCollector(root, thumbnailer).collect(dry_run=False, ops_per_second=0)
+        assert report["stale_rows"] == 1
+        with db_connection() as conn:
+            assert conn.execute("SELECT 1 FROM UploadBlobs WHERE path = ?", (files["orphan"],)).fetchone() is None
+
+    def test_throttle_limits_rate(self):
+        """Ограничитель не дает выполнить больше операций, чем разрешено в секунду"""
+        throttle = Throttle(200)
+        started = time.monotonic()
+        for _ in range(21):
+            throttle.wait()
+        assert time.monotonic() - started >= 0.09
+
+
+class TestUploadGcRoute:
+    """Тесты запуска очистки администратором"""
+
+    def test_admin_starts_dry_run(self, test_db, tmp_path, monkeypatch):
+        """По умолчанию маршрут запускает пробную очистку, доступную только администратору"""
+        monkeypatch.setattr(main, "upload_collector", UploadCollector(tmp_path))
+        create_user('admin@example.com', hash_password('secret'), 'admin', 'Admin')
+        create_user('client@example.com', hash_password('secret'), 'client', 'Client')
+        write_old(tmp_path / "projects" / "abandoned.pdf")
+
+        client = TestClient(main.app, cookies={"user_email": "client@example.com"})
+        assert client.post("/admin/upload-gc").status_code == 403
+
+        client = TestClient(main.app, cookies={"user_email": "admin@example.com"})
+        response = client.post("/admin/upload-gc")
+        assert response.status_code == 202
+        task_id = response.json()["task"]["id"]
+        deadline = time.monotonic() + 5
+        while True:
+            task = client.get(f"/admin/tasks/{task_id}").json()["task"]
+            if task["status"] not in ("pending", "running") or time.monotonic() > deadline:
+                break
+            time.sleep(0.01)
+        assert task["status"] == "done"
+        assert task["result"]["dry_run"] and task["result"]["orphans"] == 1
+        assert (tmp_path / "projects" / "abandoned.pdf").exists()
@@ -0,0 +1,127 @@
+"""
+Тесты потокового сохранения загрузок и хранилища блобов
+"""
+import hashlib
+import io
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from database import db_connection
+from models import create_user, create_job, delete_job, get_jobs, get_user_by_email, update_user_profile
+from uploads import store_blob, UploadTooLarge
+
+
+class CountingStream(io.BytesIO):
+    """Поток, запоминающий размеры запрошенных кусков"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.requests = []
+
+    def read(self, size=-1):
+        self.requests.append(size)
+        return super().read(size)
+
+
+def ref_counts():
+    """Счетчики ссылок блобов: путь -> ref_count"""
+    with db_connection() as conn:
+        return {row["path"]: row["ref_count"] for row in conn.execute("SELECT path, ref_count FROM UploadBlobs")}
+
+
+class TestStoreBlob:
+    """Тесты записи потока в хранилище блобов"""
+
+    def test_copies_in_chunks_under_content_hash(self, test_db, tmp_path):
+        """Файл копируется кусками и сохраняется под SHA-256 содержимого"""
+        data = bytes(range(256)) * 40
+        source = CountingStream(data)
+        blob = store_blob(source, tmp_path, ".pdf", max_size=len(data), chunk_size=1000)
+        sha256 = hashlib.sha256(data).hexdigest()
+        assert blob == {
+            "sha256": sha256, "path": f"/uploads/blobs/{sha256[:2]}/{sha256}.pdf", "size": len(data), "created": True,
+        }
+        assert (tmp_path / "blobs" / sha256[:2] / f"{sha256}.pdf").read_bytes() == data
+        assert set(source.requests) == {1000}
+
+    def test_duplicate_content_reuses_blob(self, test_db, tmp_path):
+        """Повторная загрузка того же содержимого не создает второй файл"""
+        first = store_blob(io.BytesIO(b"same avatar"), tmp_path, ".png")
+        second = store_blob(io.BytesIO(b"same avatar"), tmp_path, ".PNG")
+        assert (second["path"], second["created"]) == (first["path"], False)
+        files = [p for p in (tmp_path / "blobs").rglob("*") if p.is_file()]
+        assert len(files) == 1
+
+    def test_same_content_other_extension(self, test_db, tmp_path):
+        """То же содержимое с другим расширением получает свой файл и свою запись"""
+        png = store_blob(io.BytesIO(b"same bytes"), tmp_path, ".png")
+        txt = store_blob(io.BytesIO(b"same bytes"), tmp_path, ".txt")
+        assert png["path"].endswith(".png") and txt["path"].endswith(".txt")
+        assert txt["created"]
+        assert (tmp_path / txt["path"][len("/uploads/"):]).read_bytes() == b"same bytes"
+        assert set(ref_counts()) == {png["path"], txt["path"]}
+
+    def test_aborts_when_limit_crossed(self, test_db, tmp_path):
+        """Чтение прекращается на первом куске сверх лимита, временный файл удаляется"""
+        source = CountingStream(b"x" * 10_000)
+        with pytest.raises(UploadTooLarge):
+            store_blob(source, tmp_path, ".pdf", max_size=2500, chunk_size=1000)
+        assert len(source.requests) == 3
+        assert list((tmp_path / "blobs").iterdir()) == []
+        assert ref_counts() == {}
+
+
+class TestUploadRefs:
+    """Тесты учета ссылок на блобы"""
+
+    def test_refs_follow_owner_fields(self, test_db, tmp_path):
+        """Счетчик ссылок растет и падает вместе с полями профиля и проектами"""
+        shared = store_blob(io.BytesIO(b"portfolio pdf"), tmp_path, ".pdf")["path"]
+        avatar = store_blob(io.BytesIO(b"avatar"), tmp_path, ".png")["path"]
+        create_user('client@example.com', 'hash', 'client', 'Client')
+        user_id = get_user_by_email('client@example.com')['id']
+
+        update_user_profile(user_id, avatar=avatar, portfolio_files=json.dumps([shared, "/uploads/portfolio/old.pdf"]))
+        create_job('Проект', 'Описание', '2099-01-01', 'client@example.com', files=[shared])
+        assert ref_counts() == {shared: 2, avatar: 1}
+
+        update_user_profile(user_id, portfolio_files=json.dumps([]))
+        delete_job(get_jobs()[0]['id'])
+        assert ref_counts() == {shared: 0, avatar: 1}
+
+
+class TestUploadRoutes:
+    """Тесты загрузки файлов через формы"""
+
+    @pytest.fixture
+    def client(self, test_db, tmp_path, monkeypatch):
+        """Заказчик и каталог загрузок во временной папке"""
+        monkeypatch.setattr(main, "UPLOAD_DIR", tmp_path)
+        monkeypatch.setattr(main, "MAX_FILE_SIZE", 1024)
+        create_user('client@example.com', 'hash', 'client', 'Client')
+        return TestClient(main.app, cookies={"user_email": 'client@example.com'})
+
+    def create_job(self, client, content):
+        return client.post("/jobs/create", data={
+            "title": "Проект", "description": "Описание", "deadline": "2099-01-01",
+        }, files=[("files", ("brief.pdf", content, "application/pdf"))], follow_redirects=False)
+
+    def test_job_files_deduplicated(self, client, tmp_path):
+        """Одинаковые файлы двух проектов хранятся одной копией с двумя ссылками"""
+        for _ in range(2):
+            assert self.create_job(client, b"%PDF brief").status_code == 302
+        paths = {json.loads(job["files"])[0] for job in get_jobs()}
+        assert len(paths) == 1
+        assert ref_counts() == {paths.pop(): 2}
+        assert len([p for p in (tmp_path / "blobs").rglob("*") if p.is_file()]) == 1
+
+    def test_too_large_file_rejected(self, client, tmp_path):
+        """Файл больше лимита отклоняется и не оставляет следов на диске"""
+        response = self.create_job(client, b"x" * 4096)
+        assert response.status_code == 400
+        assert "Файл слишком большой" in response.text
+        assert [p for p in tmp_path.rglob("*") if p.is_file()] == []
+        assert get_jobs() == []